@@ -0,0 +1,274 @@
+import os
+import hmac
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Token buckets live in one shared file per host, so every worker draws from
+# the same budget. Unset means a file in the temp directory named after the
+# database URL.
+RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH') or None
+# Per API key: sustained requests per second and burst size (rate 0 disables)
+RATE_LIMIT_KEY_RATE = float(os.environ.get('RATE_LIMIT_KEY_RATE', 100))
+RATE_LIMIT_KEY_BURST = float(os.environ.get('RATE_LIMIT_KEY_BURST', 200))
+# Per conversation (sessionId): scammers type, so a few messages a second is plenty
+RATE_LIMIT_SESSION_RATE = float(os.environ.get('RATE_LIMIT_SESSION_RATE', 2))
+RATE_LIMIT_SESSION_BURST = float(os.environ.get('RATE_LIMIT_SESSION_BURST', 10))
+# Buckets in the shared table; when full, the longest-idle bucket is reused
+RATE_LIMIT_SLOTS = int(os.environ.get('RATE_LIMIT_SLOTS', 65536))
+# Requests processed at once by one worker process; excess fails fast with 503 (0 = no cap)
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 64))
+
+_MAGIC = b"HPRATE01"
+# magic, slot count
+_HEADER = struct.Struct("<8sQ")
+# owner (hash of the bucket name, 0 = empty), tokens, last update (epoch seconds)
+_SLOT = struct.Struct("<Qdd")
+# Slots examined per lookup before the longest-idle one is reused
+_PROBES = 8
+
+
+class Rejected(Exception):
+    """A request turned away by admission control; rendered as a JSON error with Retry-After."""
+
+    def __init__(self, status, reply, retry_after=1.0):
+        super().__init__(reply)
+        self.status = status
+        self.reply = reply
+        self.retry_after = retry_after
+
+    def body(self):
+        return {"status": "error", "reply": self.reply}
+
+    def headers(self):
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def default_path(database_uri):
+    """Bucket file for a database: one per database URL, shared by its workers."""
+    name = hashlib.sha1(database_uri.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"honeypot-ratelimit-{name}.buckets")
+
+
+def key_digest(key):
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+class TokenBuckets:
+    """
+    Token buckets in a fixed-size hash table in a memory-mapped file.
+
+    Every worker maps the same file; a lookup-and-update holds an exclusive
+    flock on it for a few microseconds, so the budget is exact across
+    processes. Buckets are found by open addressing over a short probe run.
+    When the run is full the longest-idle bucket is taken over: one idle
+    for burst / rate seconds is full again anyway, so in practice only a
+    table far too small for the number of clients loses state, and then in
+    the client's favour.
+    """
+
+    def __init__(self, path, slots=RATE_LIMIT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._handle = None
+        self._map = None
+
+    def take(self, name, rate, burst, cost=1.0, now=None):
+        """
+        Takes cost tokens from bucket name. Returns 0.0 if they were there,
+        otherwise the seconds until they will be (nothing is taken then).
+        Costs above burst are charged as burst, so they can still succeed.
+        """
+        owner = int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        cost = min(cost, burst)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            table = self._map
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+            try:
+                now = time.time() if now is None else now
+                offset = self._find(table, owner)
+                found, tokens, stamp = _SLOT.unpack_from(table, offset)
+                if found != owner:
+                    tokens, stamp = burst, now
+                tokens = min(burst, tokens + max(0.0, now - stamp) * rate)
+                if tokens >= cost:
+                    tokens -= cost
+                    wait = 0.0
+                else:
+                    wait = (cost - tokens) / rate
+                _SLOT.pack_into(table, offset, owner, tokens, now)
+            finally:
+                fcntl.flock(self._handle, fcntl.LOCK_UN)
+        return wait
+
+    def _find(self, table, owner):
+        first = owner % self.slots
+        idlest, idlest_stamp = None, math.inf
+        for probe in range(_PROBES):
+            offset = _HEADER.size + (first + probe) % self.slots * _SLOT.size
+            found, _, stamp = _SLOT.unpack_from(table, offset)
+            if found == owner or found == 0:
+                return offset
+            if stamp < idlest_stamp:
+                idlest, idlest_stamp = offset, stamp
+        return idlest
+
+    def _open(self):
+        # A forked worker must not share the parent's open file: flock is per open file
+        if self._map is not None:
+            self._map.close()
+            self._handle.close()
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not self._valid():
+                    staging = f"{self.path}.{os.getpid()}.tmp"
+                    with open(staging, "wb") as handle:
+                        handle.write(_HEADER.pack(_MAGIC, self.slots))
+                        handle.truncate(_HEADER.size + self.slots * _SLOT.size)
+                    os.replace(staging, self.path)
+                self._handle = open(self.path, "r+b")
+                self._map = mmap.mmap(self._handle.fileno(), 0)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _valid(self):
+        try:
+            with open(self.path, "rb") as handle:
+                header = handle.read(_HEADER.size)
+                size = os.fstat(handle.fileno()).st_size
+        except FileNotFoundError:
+            return False
+        return header == _HEADER.pack(_MAGIC, self.slots) and size == _HEADER.size + self.slots * _SLOT.size
+
+
+class AdmissionControl:
+    """
+    Decides whether a request is worth doing before any work is done on it.
+
+    API keys are compared as SHA-256 digests with hmac.compare_digest
+    against every configured key, so neither the match nor its position
+    shows in the timing. Token buckets per API key and per sessionId are
+    shared by all workers through TokenBuckets; an exhausted bucket is a
+    429 with Retry-After. MAX_IN_FLIGHT caps the requests one worker
+    process handles at once; past it requests get an immediate 503 instead
+    of queueing behind a flood. A bucket file that cannot be used admits
+    the request rather than failing it.
+    """
+
+    def __init__(self, path=RATE_LIMIT_PATH, key_rate=RATE_LIMIT_KEY_RATE, key_burst=RATE_LIMIT_KEY_BURST,
+                 session_rate=RATE_LIMIT_SESSION_RATE, session_burst=RATE_LIMIT_SESSION_BURST,
+                 slots=RATE_LIMIT_SLOTS, max_in_flight=MAX_IN_FLIGHT):
+        self.path = path
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.slots = slots
+        self.max_in_flight = max_in_flight
+
+        self.buckets = None
+        self._digests = ()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._counters = {"rejected_key": 0, "rejected_session": 0, "rejected_overload": 0, "bucket_errors": 0}
+
+    def init_app(self, app, api_keys):
+        app.extensions['admission'] = self
+        self._digests = tuple(key_digest(key) for key in api_keys)
+        if self.path is None:
+            self.path = default_path(app.config['SQLALCHEMY_DATABASE_URI'])
+        self.buckets = TokenBuckets(self.path, self.slots)
+
+    # ------------------------------------------------------------------
+    # Request-side API
+    # ------------------------------------------------------------------
+
+    def authenticate(self, key):
+        """True if key is one of the configured API keys."""
+        if not isinstance(key, str):
+            return False
+        digest = key_digest(key)
+        matched = False
+        for candidate in self._digests:
+            matched |= hmac.compare_digest(digest, candidate)
+        return matched
+
+    def check_key(self, key, cost=1):
+        """Charges cost requests to the API key's bucket; raises Rejected (429) if it is empty."""
+        wait = self._take(f"key:{key}", self.key_rate, self.key_burst, cost)
+        if wait:
+            self._reject("rejected_key")
+            raise Rejected(429, "Rate limit exceeded for this API key", wait)
+
+    def session_wait(self, session_id):
+        """Charges one message to the session's bucket; returns 0.0, or the seconds to wait if it is empty."""
+        wait = self._take(f"session:{session_id}", self.session_rate, self.session_burst, 1)
+        if wait:
+            self._reject("rejected_session")
+        return wait
+
+    def check_session(self, session_id):
+        """session_wait() that raises Rejected (429) instead of returning a wait."""
+        wait = self.session_wait(session_id)
+        if wait:
+            raise Rejected(429, "Too many messages for this session", wait)
+
+    @contextmanager
+    def slot(self):
+        """Holds one of the process's in-flight slots; raises Rejected (503) if none is free."""
+        with self._in_flight_lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                admitted = False
+            else:
+                self._in_flight += 1
+                admitted = True
+        if not admitted:
+            self._reject("rejected_overload")
+            raise Rejected(503, "Server busy, retry shortly")
+        try:
+            yield
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        return dict(self._counters, in_flight=self._in_flight, max_in_flight=self.max_in_flight,
+                    key_rate=self.key_rate, session_rate=self.session_rate)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _take(self, name, rate, burst, cost):
+        if rate <= 0 or self.buckets is None:
+            return 0.0
+        try:
+            return self.buckets.take(name, rate, burst, cost)
+        except OSError as e:
+            self._counters["bucket_errors"] += 1
+            logger.error("Rate limit buckets unavailable: %s", e, extra={"rate_key": "rate-buckets"})
+            return 0.0
+
+    def _reject(self, reason):
+        self._counters[reason] += 1
+        metrics.inc("honeypot_rejections_total", reason=reason[len("rejected_"):])
+
+
+admission = AdmissionControl()
@@ -1,144 +1,247 @@
-
 import random
+import hashlib
+from types import MappingProxyType
+
+# Running session risk (risk.RiskState score) at which the agent skips
+# probing and asks for payment details straight away
+HIGH_RISK_SCORE = 60
+
+# Bits of the condition mask flow rules test: one per indicator kind held
+# for the session, plus one for a running risk score at HIGH_RISK_SCORE
+INTEL_BITS = {"bank": 1, "upi": 2, "phone": 4, "link": 8}
+ANY_INTEL = 15
+HIGH_RISK = 16
+MASK_COUNT = 32
+
+COMPLETED_REPLY = "Okay, I have done it. Please check."
+
+# Removed "neutral" responses - honeypot should NEVER sound suspicious
+DEFAULT_SCRIPTS = {
+    "opening": [
+        "Oh my god, really? I didn't do anything wrong. What should I do?",
+        "Wait, is this serious? I just got this number. I'm panicked.",
+        "Oh no! I haven't done anything illegal. Why is this happening?",
+        "This is terrifying. Please tell me this is a mistake.",
+        "What?! I'm so scared. Please help me understand what's going on."
+    ],
+    "probe": [
+        "I am so scared. Will I lose my money? Please help me fix this.",
+        "Is my bank balance safe? I can't afford to have it blocked.",
+        "I am really worried about my savings. What exactly do I need to do?",
+        "This sounds urgent. I don't want any legal trouble. Please help.",
+        "My hands are shaking. What did I do wrong? Can you fix this for me?"
+    ],
+    "bait": [
+        "Okay, I will do whatever you say. I just want my account safe.",
+        "I understand. Please guide me, I trust you to fix this.",
+        "Okay, tell me the steps. I want to resolve this immediately.",
+        "I am ready to verify. Just tell me what information you need.",
+        "Yes yes, I'll cooperate fully. Just please don't block my account."
+    ],
+    "extract": [
+        "I am trying to send the money but the app is asking for details. Can I send it to a bank account or UPI directly? Please share the details.",
+        "My app is glitching. Do you have a direct UPI ID or account number I can transfer to instead?",
+        "It says 'Server Error'. Is there a specific bank account number I should use for the verification fee?",
+        "The payment link isn't opening. Can you just give me your UPI ID? I'll send it from my other app.",
+        "Where should I send the payment? Give me your account details or UPI ID and I'll transfer right now.",
+        "Should I send it to your bank account? What's the account number? Or do you prefer UPI?"
+    ],
+    "stall": [
+        "Hold on, my internet is slow. Just writing it down now...",
+        "One second, the app is loading... it's just spinning.",
+        "Wait, I need to find my reading glasses to read the card number. Just a moment.",
+        "Hang on, my battery is low, let me plug in the charger quickly.",
+        "Sorry, my wife is calling me. Give me 30 seconds...",
+        "The screen went black, restarting my phone. Don't disconnect please."
+    ],
+    "fallback": [
+        "Okay, please tell me the next step.",
+        "I am listening. Go ahead.",
+        "What should I do next?",
+        "Okay, understood. Continue please."
+    ]
+}
+
+# Conversation flow. For each turn, the first rule whose turns and "when"
+# conditions match picks the script and the reported state. "turns" lists
+# turn numbers and "from" matches that turn and all later ones (neither
+# means every turn). "when" maps intel (any indicator), bank, upi, phone,
+# link or high_risk to the value required. Turns no rule covers use the
+# fallback script in state "active"; max_turns ends the conversation.
+DEFAULT_FLOW = (
+    # Turn 1: Immediate panic (no neutral response)
+    {"turns": [0, 1], "script": "opening", "state": "opening"},
+    # Turn 2: Express fear, ask what to do (or go for details if already high risk)
+    {"turns": [2], "when": {"intel": False, "high_risk": True}, "script": "extract", "state": "extraction"},
+    {"turns": [2], "script": "probe", "state": "probing"},
+    # Turn 3: Start extraction early; stall if we already have what we need
+    {"turns": [3], "when": {"intel": True}, "script": "stall", "state": "stalling"},
+    {"turns": [3], "script": "extract", "state": "extraction"},
+    # Turn 4: Bait, or a second extraction attempt with different wording
+    {"turns": [4], "when": {"intel": True}, "script": "bait", "state": "baiting"},
+    {"turns": [4], "script": "extract", "state": "extraction"},
+    # Turn 5: Stall or continue baiting
+    {"turns": [5], "when": {"intel": True}, "script": "stall", "state": "stalling"},
+    {"turns": [5], "script": "bait", "state": "baiting"},
+    # Turn 6+: Maximum stalling to keep them engaged
+    {"from": 6, "script": "stall", "state": "stalling"},
+)
+
+
+def condition_mask(intelligence_context=None, risk=None, high_risk_score=HIGH_RISK_SCORE):
+    """Packs the intel flags and the risk check into the bitmask flow rules are compiled against."""
+    mask = 0
+    if intelligence_context:
+        # INTEL_BITS unrolled, as in HoneypotAgent.generate_reply
+        get = intelligence_context.get
+        if get("has_bank"):
+            mask = 1
+        if get("has_upi"):
+            mask |= 2
+        if get("has_phone"):
+            mask |= 4
+        if get("has_link"):
+            mask |= 8
+    if risk and risk.get("score", 0) >= high_risk_score:
+        mask |= HIGH_RISK
+    return mask
+
+
+def _test(name, mask):
+    if name == "intel":
+        return bool(mask & ANY_INTEL)
+    if name == "high_risk":
+        return bool(mask & HIGH_RISK)
+    return bool(mask & INTEL_BITS[name])
+
+
+def _matches(rule, turn, mask):
+    if "from" in rule:
+        if turn < rule["from"]:
+            return False
+    elif "turns" in rule and turn not in rule["turns"]:
+        return False
+    return all(_test(name, mask) == bool(wanted) for name, wanted in rule.get("when", {}).items())
+
+
+def compile_flow(flow, scripts, max_turns):
+    """
+    Resolves flow rules into a flat table: entry turn * MASK_COUNT + mask
+    holds (state, script options) for that turn and condition mask.
+    Raises ValueError for rules naming unknown conditions or scripts.
+    """
+    for rule in flow:
+        unknown = set(rule.get("when", {})) - set(INTEL_BITS) - {"intel", "high_risk"}
+        if unknown:
+            raise ValueError(f"Unknown flow condition(s): {', '.join(sorted(unknown))}")
+        if rule["script"] not in scripts:
+            raise ValueError(f"Flow rule uses unknown script: {rule['script']}")
+
+    table = []
+    for turn in range(max_turns):
+        for mask in range(MASK_COUNT):
+            rule = next((rule for rule in flow if _matches(rule, turn, mask)), None)
+            if rule is None:
+                table.append(("active", scripts["fallback"]))
+            else:
+                table.append((rule.get("state", rule["script"]), scripts[rule["script"]]))
+    return tuple(table)
 
 
 class HoneypotAgent:
     """
     Maintains the persona and handles turn-taking logic.
     Acts as a panicked victim from the very first message.
+
+    The flow is compiled once per agent into a flat table, so a reply is
+    one index into it plus a choice among the script's options; turns no
+    condition applies to skip building the condition mask. With a
+    seed, that choice is a hash of (seed, session id) and the turn:
+    repeatable across runs and independent of request interleaving.
     """
 
-    def __init__(self, max_turns=8):
+    def __init__(self, max_turns=8, scripts=None, high_risk_score=HIGH_RISK_SCORE, flow=None, seed=None):
         self.max_turns = max_turns
+        self.high_risk_score = high_risk_score
+        self.seed = seed
+
+        # Overrides are layered on the defaults so every state keeps a script.
+        # Stored as tuples behind a read-only mapping: the agent is shared
+        # across request threads and must never be mutated after construction.
+        merged = dict(DEFAULT_SCRIPTS)
+        merged.update(scripts or {})
+        self.scripts = MappingProxyType({
+            key: tuple(options) if isinstance(options, (list, tuple)) else options
+            for key, options in merged.items()
+        })
+        self.flow = tuple(flow if flow is not None else DEFAULT_FLOW)
+        self._table = compile_flow(self.flow, self.scripts, max_turns)
+        # Turns whose entry is the same under every mask, so no mask is needed
+        self._fixed = tuple(
+            row[0] if len(set(row)) == 1 else None
+            for row in (self._table[turn * MASK_COUNT:(turn + 1) * MASK_COUNT] for turn in range(max_turns))
+        )
 
-        # Removed "neutral" responses - honeypot should NEVER sound suspicious
-        self.scripts = {
-            "opening": [
-                "Oh my god, really? I didn't do anything wrong. What should I do?",
-                "Wait, is this serious? I just got this number. I'm panicked.",
-                "Oh no! I haven't done anything illegal. Why is this happening?",
-                "This is terrifying. Please tell me this is a mistake.",
-                "What?! I'm so scared. Please help me understand what's going on."
-            ],
-            "probe": [
-                "I am so scared. Will I lose my money? Please help me fix this.",
-                "Is my bank balance safe? I can't afford to have it blocked.",
-                "I am really worried about my savings. What exactly do I need to do?",
-                "This sounds urgent. I don't want any legal trouble. Please help.",
-                "My hands are shaking. What did I do wrong? Can you fix this for me?"
-            ],
-            "bait": [
-                "Okay, I will do whatever you say. I just want my account safe.",
-                "I understand. Please guide me, I trust you to fix this.",
-                "Okay, tell me the steps. I want to resolve this immediately.",
-                "I am ready to verify. Just tell me what information you need.",
-                "Yes yes, I'll cooperate fully. Just please don't block my account."
-            ],
-            "extract": [
-                "I am trying to send the money but the app is asking for details. Can I send it to a bank account or UPI directly? Please share the details.",
-                "My app is glitching. Do you have a direct UPI ID or account number I can transfer to instead?",
-                "It says 'Server Error'. Is there a specific bank account number I should use for the verification fee?",
-                "The payment link isn't opening. Can you just give me your UPI ID? I'll send it from my other app.",
-                "Where should I send the payment? Give me your account details or UPI ID and I'll transfer right now.",
-                "Should I send it to your bank account? What's the account number? Or do you prefer UPI?"
-            ],
-            "stall": [
-                "Hold on, my internet is slow. Just writing it down now...",
-                "One second, the app is loading... it's just spinning.",
-                "Wait, I need to find my reading glasses to read the card number. Just a moment.",
-                "Hang on, my battery is low, let me plug in the charger quickly.",
-                "Sorry, my wife is calling me. Give me 30 seconds...",
-                "The screen went black, restarting my phone. Don't disconnect please."
-            ],
-            "fallback": [
-                "Okay, please tell me the next step.",
-                "I am listening. Go ahead.",
-                "What should I do next?",
-                "Okay, understood. Continue please."
-            ]
-        }
-
-    def _get_msg(self, key):
-        """Helper to pick a random message from the list for a given key."""
-        options = self.scripts.get(key, self.scripts["fallback"])
-        if isinstance(options, list):
-            return random.choice(options)
-        return options
-
-    def generate_reply(self, session, user_text, meta_data=None, intelligence_context=None):
+    def _session_key(self, session):
+        """
+        Seeded choices start from a hash of (seed, session id). It is kept on
+        the session object, so a session that lives across turns (the
+        sticky cache) hashes its id once.
+        """
+        cached = getattr(session, "_agent_choice_key", None)
+        if cached is not None and cached[0] == self.seed:
+            return cached[1]
+        digest = hashlib.blake2b(f"{self.seed}:{getattr(session, 'id', None)}".encode("utf-8"),
+                                 digest_size=8).digest()
+        key = int.from_bytes(digest, "little")
+        try:
+            session._agent_choice_key = (self.seed, key)
+        except AttributeError:
+            pass
+        return key
+
+    def _choose(self, options, session, turn):
+        """Picks one reply from a script (a single string is used as is)."""
+        if not isinstance(options, tuple):
+            return options
+        if self.seed is None:
+            # Same distribution as random.choice for a handful of options, at a third of the cost
+            return options[random.getrandbits(32) % len(options)]
+        # Hashes of int tuples are not salted per process, so this is repeatable across runs
+        return options[hash((self._session_key(session), turn)) % len(options)]
+
+    def generate_reply(self, session, user_text, meta_data=None, intelligence_context=None, risk=None):
         """
-        Generates the next response based on turn count.
-        Follows a tighter script to extract intelligence faster.
+        Generates the next response from the turn count, the intelligence
+        gathered so far and the session's RiskState.summary() (a high
+        running score moves the extraction attempt forward).
         """
 
         # Check Termination
-        if session.turn_count >= self.max_turns:
-            return self._response("Okay, I have done it. Please check.", end=True, state="completed")
-
         current_turn = session.turn_count
-
-        # Intelligence tracking
-        has_intel = intelligence_context and (
-            intelligence_context.get('has_bank') or
-            intelligence_context.get('has_upi') or
-            intelligence_context.get('has_phone') or
-            intelligence_context.get('has_link')
-        )
-
-        reply = ""
-        state = ""
-
-        # TURN-BY-TURN SCRIPT
-        # Turn 1: Immediate panic (no neutral response)
-        if current_turn == 0 or current_turn == 1:
-            reply = self._get_msg("opening")
-            state = "opening"
-
-        # Turn 2: Express fear, ask what to do
-        elif current_turn == 2:
-            reply = self._get_msg("probe")
-            state = "probing"
-
-        # Turn 3: Start extraction early
-        elif current_turn == 3:
-            if has_intel:
-                # Already got what we need, stall
-                reply = self._get_msg("stall")
-                state = "stalling"
-            else:
-                # First extraction attempt
-                reply = self._get_msg("extract")
-                state = "extraction"
-
-        # Turn 4: Second extraction attempt or bait
-        elif current_turn == 4:
-            if has_intel:
-                reply = self._get_msg("bait")
-                state = "baiting"
-            else:
-                # Try extraction again with different wording
-                reply = self._get_msg("extract")
-                state = "extraction"
-
-        # Turn 5: Stall or continue baiting
-        elif current_turn == 5:
-            if has_intel:
-                reply = self._get_msg("stall")
-                state = "stalling"
-            else:
-                reply = self._get_msg("bait")
-                state = "baiting"
-
-        # Turn 6+: Maximum stalling to keep them engaged
-        elif current_turn >= 6:
-            reply = self._get_msg("stall")
-            state = "stalling"
-
-        else:
-            reply = self._get_msg("fallback")
-            state = "active"
-
-        return self._response(reply, state=state)
+        if current_turn >= self.max_turns:
+            return self._response(COMPLETED_REPLY, end=True, state="completed")
+
+        entry = self._fixed[current_turn]
+        if entry is None:
+            # condition_mask() inlined: this runs on most replies
+            mask = 0
+            if intelligence_context:
+                get = intelligence_context.get
+                if get("has_bank"):
+                    mask = 1
+                if get("has_upi"):
+                    mask |= 2
+                if get("has_phone"):
+                    mask |= 4
+                if get("has_link"):
+                    mask |= 8
+            if risk and risk.get("score", 0) >= self.high_risk_score:
+                mask |= HIGH_RISK
+            entry = self._table[current_turn * MASK_COUNT + mask]
+        state, options = entry
+        return {"reply": self._choose(options, session, current_turn), "end_conversation": False,
+                "agent_state": state}
 
     def _response(self, text, end=False, state="active"):
         return {
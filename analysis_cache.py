@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Analysis results kept per detector (per worker process) for repeated messages (0 disables)
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 10000))
+# Keyword scoring shared by messages that match once links, handles and numbers
+# are masked (campaign variants); entries kept, 0 disables
+ANALYSIS_TEMPLATE_CACHE_SIZE = int(os.environ.get('ANALYSIS_TEMPLATE_CACHE_SIZE', 0))
+
+# Spans masked for the template key: whole words that are links or contain a
+# digit or '@' (anchored at word starts, so the scan stays linear)
+_TEMPLATE_SPANS = re.compile(r'(?<!\S)(?:https?://|[^\s\d@]*[\d@])\S*')
+# Stands in for a masked span; no keyword contains it
+MASK = "\x00"
+
+
+def text_key(text):
+    """Fixed-size cache key for a message."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def template(text):
+    """Returns (text with every masked word replaced by MASK, the masked spans)."""
+    spans = [match.span() for match in _TEMPLATE_SPANS.finditer(text)]
+    if not spans:
+        return text, spans
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append(text[last:start])
+        last = end
+    pieces.append(text[last:])
+    return MASK.join(pieces), spans
+
+
+def freeze(result):
+    """Immutable form of an analyze_text result, as cached."""
+    return (result["is_scam"], result["risk_score"], tuple(result["flags"]),
+            tuple((field, frozenset(values)) for field, values in result["extracted_data"].items()))
+
+
+def thaw(entry):
+    """A fresh result dict from a cached entry; callers may modify it."""
+    is_scam, risk_score, flags, extracted = entry
+    return {"is_scam": is_scam, "risk_score": risk_score, "flags": list(flags),
+            "extracted_data": {field: set(values) for field, values in extracted}}
+
+
+def entry_size(entry):
+    """Approximate bytes held by a frozen result (tuples and sets measured, strings estimated)."""
+    _, _, flags, extracted = entry
+    size = sys.getsizeof(entry) + sys.getsizeof(flags) + sys.getsizeof(extracted)
+    for _, values in extracted:
+        # An ASCII str is 49 bytes plus its length; field names and flags are shared constants
+        size += 64 + sys.getsizeof(values) + 49 * len(values) + sum(map(len, values))
+    return size
+
+
+class LRUCache:
+    """
+    Bounded map that evicts the least recently used entry, safe to share
+    between request threads. Counts hits, misses and evictions and keeps a
+    running total of the (caller-estimated) bytes held.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, size=0):
+        size += sys.getsizeof(key)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return dict(self._counters, entries=len(self._entries), max_entries=self.max_entries,
+                    bytes=self._bytes, hit_rate=round(self._counters["hits"] / lookups, 4) if lookups else None)
@@ -1,41 +1,245 @@
 import os
+import json
 import uuid
 import logging
-from flask import Flask, request, jsonify, make_response
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-import requests
+
+import click
+from flask import Flask, current_app, request, jsonify, make_response, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 # Import internal modules
-from models import db, ScamSession, ScamIntelligence
-from detector import ScamDetector
-from agent import HoneypotAgent
+from models import (db, ScamSession, ScamIntelligence, engine_options, install_sqlite_pragmas,
+                    add_missing_columns, add_missing_indexes, migrate_csv_indicators, migrate_message_blobs,
+                    backfill_indicator_stats, sessions_with_indicator, schema_is_current, mark_schema_current,
+                    link_domain)
+from engines import registry as engine_registry
+from callbacks import dispatcher as callback_dispatcher
+from session_cache import session_cache
+from metrics import metrics
+from logging_setup import configure_logging, SAMPLED
+from transfer import export_sessions, import_sessions, iter_ndjson, init_cli as init_transfer_cli
+from rescore import init_cli as init_rescore_cli
+from retention import retention, init_cli as init_retention_cli
+from intel_index import intel_index, LOOKUP_KINDS
+from prescreen import prescreen, indicator_key, PRESCREEN_KINDS
+from admission import admission, Rejected
 
-# Configuration
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default_secret_key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.root_path, 'honeypot_intelligence.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+logger = logging.getLogger(__name__)
 
-# Initialize extensions
-db.init_app(app)
+# Database: DATABASE_URL selects the backend (SQLite file by default)
+DATABASE_URL = (os.environ.get('DATABASE_URL') or
+                'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'honeypot_intelligence.db'))
+if DATABASE_URL.startswith('postgres://'):
+    # Hosted Postgres URLs often use the scheme SQLAlchemy no longer accepts
+    DATABASE_URL = 'postgresql://' + DATABASE_URL[len('postgres://'):]
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Schema creation and migrations at startup: "auto" runs them only when the
+# database was not yet initialized for this code (one query otherwise),
+# "always" on every start, "skip" never (run `flask init-db` once per deploy)
+DB_INIT = os.environ.get('DB_INIT', 'auto').lower()
+
+# One rolled-back turn when a server builds the app (create_app(serving=True)),
+# so the first request finds SQLAlchemy's statement cache warm (under
+# gunicorn's preload_app, for every worker)
+WARM_UP = os.environ.get('WARM_UP', '1') not in ('0', 'false', 'no')
 
 # CONFIGURATION
-CALLBACK_URL = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
+CALLBACK_URL = os.environ.get('CALLBACK_URL', "https://hackathon.guvi.in/api/updateHoneyPotFinalResult")
 
 # IMPORTANT: Replace with your actual API key
-API_KEYS = "MlYp-BYmcd7ebj1ospIEI387BJuIRmJYBOLyeIkj8NI"
+DEFAULT_API_KEY = "MlYp-BYmcd7ebj1ospIEI387BJuIRmJYBOLyeIkj8NI"
+
+# Accepted keys: API_KEYS (comma-separated), else HACKATHON_API_KEY, else the default above
+API_KEYS = frozenset(
+    key.strip()
+    for key in (os.environ.get('API_KEYS') or os.environ.get('HACKATHON_API_KEY') or DEFAULT_API_KEY).split(',')
+    if key.strip()
+)
+
+# Attempts at a /chat turn that loses a race with a concurrent turn of the
+# same session (e.g. both creating it)
+TURN_ATTEMPTS = int(os.environ.get('TURN_ATTEMPTS', 5))
+
+# Upper bound on messages accepted by /chat/batch in one request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 500))
+
+# Upper bound on session ids returned per match by /intel/lookup
+MAX_LOOKUP_SESSIONS = int(os.environ.get('MAX_LOOKUP_SESSIONS', 100))
+
+# Scored by warm_up(); reaches the keyword, indicator and insert paths
+WARM_UP_MESSAGE = "URGENT: your account is blocked, verify now at http://kyc-check.example or pay to verify@ybl"
+
+
+def create_app(serving=False):
+    """
+    Builds the app: config, extensions, routes and CLI commands, then the
+    DB_INIT step. serving=True is for a process that will answer requests
+    (gunicorn, asgi.py, `python app.py`) and also runs the WARM_UP turn;
+    the flask CLI and scripts get the app without it. The extensions are
+    process-wide singletons, so call this once per process. Importing the
+    module builds nothing; the `app` attribute is built on first access.
+    """
+    if DB_INIT not in ('auto', 'always', 'skip'):
+        raise ValueError(f"Unknown DB_INIT: {DB_INIT}")
+
+    # Setup logging (LOG_FORMAT, LOG_QUEUE, LOG_SAMPLE_RATE, LOG_RATE_LIMIT)
+    configure_logging()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default_secret_key')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        DATABASE_URL,
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    )
+
+    # Initialize extensions
+    db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(
+            db.engine,
+            journal_mode=os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+            synchronous=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            busy_timeout_ms=int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+            mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+            auto_vacuum=os.environ.get('SQLITE_AUTO_VACUUM', 'INCREMENTAL')
+        )
+
+    # Reports are delivered in the background from a durable outbox
+    callback_dispatcher.init_app(app, CALLBACK_URL)
+
+    # Optional write-behind cache of active sessions (SESSION_CACHE_MODE)
+    session_cache.init_app(app)
+
+    # In-process counters and stage histograms, served at /metrics (METRICS_DIR aggregates workers)
+    metrics.init_app(app)
+    metrics.add_collector(callback_dispatcher.metric_counters)
+    metrics.add_collector(lambda: engine_registry.current().detector.cache_counters())
+
+    # `flask export-sessions` / `flask import-sessions` (NDJSON, streaming)
+    init_transfer_cli(app, engine_registry.current)
+
+    # `flask rescore-sessions`: offline re-detection over stored transcripts
+    init_rescore_cli(app)
+
+    # Age-based expiry with archival: `flask compact-sessions`, `flask search-archive`,
+    # and background passes when RETENTION_INTERVAL is set (RETENTION_*)
+    retention.init_app(app)
+    init_retention_cli(app)
+
+    # Cross-session indicator aggregate, mirrored in memory for /intel/lookup
+    intel_index.init_app(app)
+
+    # Shared Bloom filter of known indicators, checked before detection (PRESCREEN_*)
+    prescreen.init_app(app)
+
+    # Key check, per-key and per-session rate limits, in-flight cap (RATE_LIMIT_*, MAX_IN_FLIGHT)
+    admission.init_app(app, API_KEYS)
+
+    for rule, view, methods in ROUTES:
+        app.add_url_rule(rule, view_func=view, methods=methods)
+    for code, handler in ERROR_HANDLERS:
+        app.register_error_handler(code, handler)
+
+    # `flask init-db`: schema and migrations as an explicit deploy step
+    app.cli.add_command(init_db_command)
+
+    with app.app_context():
+        if DB_INIT == 'always' or (DB_INIT == 'auto' and not schema_is_current()):
+            try:
+                init_db()
+            except Exception as e:
+                logger.error("Database initialization failed: %s", e)
+        if serving and WARM_UP:
+            try:
+                warm_up()
+            except Exception as e:
+                logger.warning("Warm-up failed: %s", e)
+        # Workers forked from this process (preload_app) must open their own connections
+        db.engine.dispose()
+
+    return app
+
+
+def init_db():
+    """
+    Creates missing tables, columns and indexes, runs the data migrations
+    and records the schema fingerprint (see models.schema_is_current).
+    Idempotent. Returns what it changed.
+    """
+    db.create_all()
+    report = {}
+    report["columns_added"] = added = add_missing_columns()
+    if added:
+        logger.info("Added columns: %s", ", ".join(added))
+    report["indexes_created"] = created = add_missing_indexes()
+    if created:
+        logger.info("Created indexes: %s", ", ".join(created))
+    # Before the migrations below, which already count into the aggregate
+    report["indicator_stats_backfilled"] = backfilled = backfill_indicator_stats()
+    if backfilled:
+        logger.info("Built indicator_stats from %d existing indicator rows", backfilled)
+    report["csv_indicators_migrated"] = migrated = migrate_csv_indicators()
+    if migrated:
+        logger.info("Migrated %d legacy CSV intelligence records to scam_indicators", migrated)
+    report["message_blobs_migrated"] = migrated = migrate_message_blobs()
+    if migrated:
+        logger.info("Migrated %d legacy transcripts to scam_messages", migrated)
+    mark_schema_current()
+    logger.info("Database initialized successfully")
+    return report
+
+
+@click.command("init-db")
+def init_db_command():
+    """Create and migrate the database schema (run once per deploy)."""
+    # Flask's CLI group supplies the app context
+    click.echo(json.dumps(init_db()), err=True)
+
+
+def warm_up():
+    """
+    Runs one scammer turn for a throwaway session through the database,
+    detector and agent, then rolls it back: the statements a turn executes
+    are compiled and cached on the engine before the first request. Records
+    no metrics and queues no callback.
+    """
+    engines = engine_registry.current()
+    if session_cache.enabled:
+        # Cached sessions live in memory, where a throwaway one would linger
+        engines.detector.analyze_text(WARM_UP_MESSAGE)
+        return
+
+    session_id = f"warm-up-{uuid.uuid4()}"
+    try:
+        load_sessions([session_id])
+        session, intelligence = create_session(session_id, [])
+        session.add_message("scammer", WARM_UP_MESSAGE)
+        analysis_result = engines.detector.analyze_message(WARM_UP_MESSAGE, session, intelligence)
+        risk = session.risk_state()
+        risk.update(analysis_result)
+        session.save_risk_state(risk)
+        intelligence.indicator_kinds()
+        engines.agent.generate_reply(session, WARM_UP_MESSAGE, intelligence_context={}, risk=risk.summary())
+        db.session.flush()
+    finally:
+        db.session.rollback()
+
+
+def api_key(headers):
+    return headers.get('x-api-key') or headers.get('X-API-KEY')
 
 
 def check_auth(headers):
     """Validate API Key from headers (Case Insensitive)."""
-    key = headers.get('x-api-key') or headers.get('X-API-KEY')
-    if key not in API_KEYS:
-        logger.warning(f"Unauthorized access attempt with key: {key}")
+    key = api_key(headers)
+    if not admission.authenticate(key):
+        logger.warning("Unauthorized access attempt with key: %s", key, extra={"rate_key": f"auth:{key}"})
         return False
     return True
 
@@ -59,236 +263,577 @@ def parse_input(data):
     return text
 
 
-@app.errorhandler(400)
 def bad_request(error):
     return make_response(jsonify({'status': 'error', 'message': 'Bad Request: Invalid input format'}), 400)
 
 
-@app.errorhandler(401)
 def unauthorized(error):
     return make_response(jsonify({'status': 'error', 'message': 'Unauthorized: Invalid API Key'}), 401)
 
 
-@app.errorhandler(500)
+def rejected(error):
+    return make_response(jsonify(error.body()), error.status, error.headers())
+
+
 def internal_error(error):
     return make_response(jsonify({'status': 'error', 'message': 'Internal Server Error'}), 500)
 
 
-@app.route('/', methods=['GET'])
 def home():
     """Health check endpoint"""
-    return jsonify({
+    return jsonify(home_info())
+
+
+def health():
+    """Additional health check"""
+    return jsonify(health_status())
+
+
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def home_info():
+    return {
         "status": "online",
         "message": "Honeypot Active. POST to /chat to engage.",
         "endpoints": {
             "chat": "/chat",
             "health": "/"
         }
-    })
+    }
 
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Additional health check"""
-    return jsonify({"status": "healthy", "service": "honeypot"})
+def health_status():
+    return {
+        "status": "healthy",
+        "service": "honeypot",
+        "callbacks": callback_dispatcher.stats(),
+        "session_cache": session_cache.stats(),
+        "intel_index": intel_index.stats(),
+        "prescreen": prescreen.stats(),
+        "admission": admission.stats(),
+        "retention": retention.stats(),
+        "analysis_cache": engine_registry.current().detector.cache_stats()
+    }
 
 
-@app.route('/chat', methods=['POST'])
 def chat():
     """Main chat endpoint for honeypot interaction."""
     
-    logger.info("Received request to /chat")
+    logger.info("Received request to /chat", extra=SAMPLED)
     
     # 1. Security Check
-    if not check_auth(request.headers):
-        logger.warning("Authentication failed")
+    with metrics.stage("auth"):
+        authorized = check_auth(request.headers)
+    if not authorized:
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
         return jsonify({"status": "error", "reply": "Invalid or missing API Key"}), 401
+    admission.check_key(api_key(request.headers))
 
     # 2. Parse Payload
     try:
-        data = request.get_json(force=True, silent=True)
+        with metrics.stage("parse"):
+            data = request.get_json(force=True, silent=True)
         if data is None:
             logger.error("Invalid JSON payload")
             return jsonify({"status": "error", "reply": "Invalid JSON payload"}), 400
     except Exception as e:
-        logger.error(f"JSON parsing error: {e}")
+        logger.error("JSON parsing error: %s", e)
         return jsonify({"status": "error", "reply": "Malformed JSON"}), 400
 
+    # Only requests that passed the key checks compete for an in-flight slot
+    with admission.slot():
+        body, status = metrics.profiled("chat", chat_response, data)
+    return jsonify(body), status
+
+
+def chat_response(data):
+    """
+    Handles one parsed /chat payload and returns (response body, status).
+    Shared by the Flask view and the ASGI entry point (asgi.py); needs an
+    app context. Raises Rejected when the session is over its rate limit.
+    """
     # Extract Core Data
     session_id = data.get('sessionId') or data.get('session_id')
-    if not session_id:
+    if session_id:
+        admission.check_session(session_id)
+    else:
         session_id = str(uuid.uuid4())
 
     user_text = parse_input(data)
     if not user_text:
         logger.error("No message text in payload")
-        return jsonify({"status": "error", "reply": "No message text provided"}), 400
+        return {"status": "error", "reply": "No message text provided"}, 400
 
-    logger.info(f"Processing message for session {session_id}: {user_text[:50]}...")
+    logger.info("Processing message for session %s: %.50s...", session_id, user_text,
+                extra=dict(SAMPLED, session_id=session_id))
 
     # Extract Metadata and History
     meta_data = data.get('meta_data', {})
     conversation_history = data.get('conversation_history', [])
 
-    # 3. Session Management
-    session = None
-    try:
-        session = ScamSession.query.filter_by(id=session_id).first()
-    except Exception as e:
-        logger.warning(f"DB Read Error: {e}")
-
-    if not session:
-        session = ScamSession(id=session_id)
-        
-        # Import conversation history if provided
-        if conversation_history:
-            for hist_msg in conversation_history:
-                if isinstance(hist_msg, dict):
-                    sender = hist_msg.get('sender', 'unknown')
-                    text = hist_msg.get('txt_message') or hist_msg.get('text', '')
-                    if text:
-                        session.add_message(sender, text)
-        
-        db.session.add(session)
-        intelligence = ScamIntelligence(session_id=session_id)
-        db.session.add(intelligence)
-
+    # Stored turns of one session queue up at flush (see models._sequence_messages),
+    # but two first turns can both create it; the loser's commit fails and the
+    # turn is redone against the stored row. Cached sessions are created under
+    # the cache lock, so they never race.
+    attempts = 1 if session_cache.enabled else TURN_ATTEMPTS
+    for attempt in range(1, attempts + 1):
         try:
-            db.session.commit()
+            agent_reply, outbox = run_turn(session_id, user_text, meta_data, conversation_history)
+            break
+        except IntegrityError as e:
+            db.session.rollback()
+            # Instances from the failed attempt carry its stale seq; load fresh ones
+            db.session.expunge_all()
+            if attempt < attempts:
+                metrics.inc("honeypot_turn_retries_total")
+                logger.info("Turn for session %s lost a race, retrying: %s", session_id, e.orig,
+                            extra={"rate_key": "turn-retry", "session_id": session_id})
+                continue
+            logger.error("Turn for session %s failed after %d attempts: %s", session_id, attempts, e.orig,
+                         extra={"session_id": session_id})
+            return {"status": "error", "reply": "Could not process the message, please retry"}, 500
         except Exception as e:
             db.session.rollback()
-            logger.error(f"DB Commit Failed: {e}")
-    else:
-        intelligence = session.intelligence
+            logger.error("Processing Error: %s", e, exc_info=True, extra={"session_id": session_id})
+            return {"status": "error", "reply": "Could not process the message"}, 500
 
-    # 4. Message Logging & Analysis
-    try:
-        session.add_message("scammer", user_text)
-
-        # Find this section around line 160 in your app.py
-        detector = ScamDetector()
-        analysis_result = detector.analyze_message(user_text, session, intelligence)
-
-        # FIX: Only update to True, never reset to False
-        # Force the session to stay True if it was ever flagged
-        if analysis_result['is_scam']:
-            session.scam_detected = True
-        elif session.scam_detected:
-        # Ensure the current analysis result reflects the session's known status
-            analysis_result['is_scam'] = True#
-
-        # 5. Agent Response Generation
-        agent = HoneypotAgent(max_turns=8)
-
-        # Pass intelligence context
-        current_intelligence_context = {
-            'has_bank': bool(intelligence.bank_accounts),
-            'has_upi': bool(intelligence.upi_ids),
-            'has_phone': bool(intelligence.phone_numbers),
-            'has_link': bool(intelligence.phishing_links)
-        }
+    # 6. Callback Logic (delivered off the request path)
+    callback_dispatcher.submit(outbox)
 
-        reply_data = agent.generate_reply(
-            session,
-            user_text,
-            meta_data=meta_data,
-            intelligence_context=current_intelligence_context
-        )
+    # 7. Final Response
+    logger.info("Sending reply for session %s", session_id, extra=dict(SAMPLED, session_id=session_id))
+    return {
+        "status": "success",
+        "reply": agent_reply
+    }, 200
 
-        agent_reply = reply_data['reply']
-        session.add_message("agent", agent_reply)
-        session.turn_count += 1
 
-        # Commit state updates
-        db.session.commit()
+def run_turn(session_id, user_text, meta_data, conversation_history):
+    """
+    Loads or creates the session, runs one message through process_message()
+    and commits. Returns (agent reply, staged callback outbox rows).
+    """
+    # 3. Session Management
+    with metrics.stage("load"):
+        existing = {}
+        try:
+            existing = load_sessions([session_id])
+        except Exception as e:
+            logger.warning("DB Read Error: %s", e, extra={"rate_key": "db-read"})
+
+        if session_id in existing:
+            session, intelligence = existing[session_id]
+        else:
+            session, intelligence = create_session(session_id, conversation_history)
 
-        # 6. Callback Logic
-        has_intelligence = (
-            bool(intelligence.bank_accounts) or 
-            bool(intelligence.upi_ids) or 
-            bool(intelligence.phone_numbers) or
-            bool(intelligence.phishing_links)
+    # 4. Message Logging & Analysis
+    # Shared, prebuilt engines (one snapshot per request, safe across reloads)
+    engines = engine_registry.current()
+    with session_cache.locked(session):
+        reply_data, callback_payload = process_message(
+            engines, session, intelligence, user_text, meta_data
         )
-        
-        should_report = (
-            session.scam_detected and 
-            session.turn_count >= 6 and 
-            has_intelligence
-        ) or reply_data['end_conversation']
-
-        if should_report:
-            send_guvi_callback(session, intelligence, analysis_result)
-
-        # 7. Final Response
-        logger.info(f"Sending reply for session {session_id}")
-        return jsonify({
-            "status": "success",
-            "reply": agent_reply
-        })
 
-    except Exception as e:
-        logger.error(f"Processing Error: {e}", exc_info=True)
-        return jsonify({"status": "error", "reply": str(e)}), 500
+        # The report is queued in the same transaction as the turn itself
+        outbox = []
+        if callback_payload:
+            with metrics.stage("callback"):
+                session_cache.write_through([session])
+                outbox.append(callback_dispatcher.stage(callback_payload, final=reply_data['end_conversation']))
+
+        # Commit state updates
+        with metrics.stage("commit"):
+            db.session.commit()
+    return reply_data['reply'], outbox
 
 
-def to_list(csv_str):
-    """Helper to convert CSV string to list, filtering empties."""
-    if not csv_str:
-        return []
-    return [item.strip() for item in csv_str.split(',') if item.strip()]
+def chat_batch():
+    """
+    Batch variant of /chat for upstream gateways.
 
+    Body: {"messages": [<chat payload>, ...]} where each entry has the same
+    shape as a /chat request. Entries are processed in order (so several turns
+    of one session behave exactly like consecutive /chat calls), all sessions
+    are loaded with one query and every update lands in a single commit.
+    """
+    logger.info("Received request to /chat/batch", extra=SAMPLED)
 
-def send_guvi_callback(session, intelligence, analysis_result):
-    """Sends final report to GUVI evaluation endpoint."""
+    if not check_auth(request.headers):
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
+        return jsonify({"status": "error", "reply": "Invalid or missing API Key"}), 401
+
+    data = request.get_json(force=True, silent=True)
+    items = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        logger.error("Invalid batch payload")
+        return jsonify({"status": "error", "reply": "Expected a JSON object with a 'messages' list"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"status": "error", "reply": f"Batch too large (max {MAX_BATCH_SIZE} messages)"}), 413
+    # Each message counts against the key's budget
+    admission.check_key(api_key(request.headers), cost=max(1, len(items)))
+
+    # Validate every entry up front; invalid ones get an error slot in place
+    replies = [None] * len(items)
+    work = []
+    for index, item in enumerate(items):
+        user_text = parse_input(item) if isinstance(item, dict) else None
+        if not user_text:
+            replies[index] = {"status": "error", "reply": "No message text provided"}
+            continue
+        session_id = item.get('sessionId') or item.get('session_id')
+        if session_id and admission.session_wait(session_id):
+            replies[index] = {"sessionId": session_id, "status": "error", "reply": "Too many messages for this session"}
+            continue
+        work.append((index, session_id or str(uuid.uuid4()), user_text, item))
+
+    logger.info("Processing batch of %d messages (%d rejected)", len(work), len(items) - len(work))
+
+    with admission.slot():
+        body, status = batch_response(work, replies)
+    return jsonify(body), status
+
+
+def batch_response(work, replies):
+    """
+    Processes validated /chat/batch entries, (index, session_id, text, item),
+    filling replies in place. Returns (response body, status).
+    """
     try:
-        tactics = ", ".join(analysis_result.get('flags', []))
-        notes = f"Honeypot engagement concluded. Threat detected. Tactics identified: {tactics or 'None'}."
-
-        payload = {
-        "sessionId": session.id,
-        "scamDetected": session.scam_detected,
-        "totalMessagesExchanged": session.turn_count,
-        "extractedIntelligence": {
-        "bank account": to_list(intelligence.bank_accounts),
-        "upiid": to_list(intelligence.upi_ids),
-        "phishing links": to_list(intelligence.phishing_links),
-        "phone numbers": to_list(intelligence.phone_numbers),
-        "suspicious keywords": to_list(intelligence.suspicious_keywords)
-        },
-        "agentNotes": notes
-        }
+        engines = engine_registry.current()
+
+        # One bulk query for every session (and its intelligence) in the batch
+        sessions = load_sessions({session_id for _, session_id, _, _ in work})
+
+        # Detection does not depend on session state, so score all texts at once
+        analyses = engines.detector.analyze_batch([user_text for _, _, user_text, _ in work])
 
-        logger.info(f"Sending callback to {CALLBACK_URL}")
-        logger.info(f"Payload: {payload}")
-        
-        response = requests.post(CALLBACK_URL, json=payload, timeout=5)
-        logger.info(f"Callback sent. Status: {response.status_code}, Response: {response.text}")
+        reports = []
+        for (index, session_id, user_text, item), analysis_result in zip(work, analyses):
+            if session_id not in sessions:
+                sessions[session_id] = create_session(session_id, item.get('conversation_history', []))
+            session, intelligence = sessions[session_id]
+
+            with session_cache.locked(session):
+                reply_data, callback_payload = process_message(
+                    engines, session, intelligence, user_text,
+                    item.get('meta_data', {}), analysis_result=analysis_result
+                )
+            if callback_payload:
+                reports.append((session, callback_payload, reply_data['end_conversation']))
+
+            replies[index] = {"sessionId": session_id, "status": "success", "reply": reply_data['reply']}
+
+        # Cached sessions must be on disk before their outbox rows; this has
+        # to happen before the batch transaction takes SQLite's write lock
+        session_cache.write_through({id(session): session for session, _, _ in reports}.values())
+        outbox = [callback_dispatcher.stage(payload, final=final) for _, payload, final in reports]
+
+        db.session.commit()
 
-    except requests.exceptions.Timeout:
-        logger.error("Callback timed out after 5 seconds.")
     except Exception as e:
-        logger.error(f"Failed to send callback: {e}")
+        db.session.rollback()
+        logger.error("Batch Processing Error: %s", e, exc_info=True)
+        return {"status": "error", "reply": str(e)}, 500
+
+    callback_dispatcher.submit(outbox)
+
+    return {
+        "status": "success",
+        "replies": replies
+    }, 200
+
+
+def sessions_export():
+    """Streams every session, its transcript and indicators as NDJSON."""
+    if not check_auth(request.headers):
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
+        return jsonify({"status": "error", "reply": "Invalid or missing API Key"}), 401
+    admission.check_key(api_key(request.headers))
+    return current_app.response_class(stream_with_context(export_sessions()), mimetype='application/x-ndjson')
 
 
-# Database Creation Hook
-with app.app_context():
+def sessions_import():
+    """
+    Imports an NDJSON body in the export format, scoring every message with
+    the current detector. Existing sessions are skipped, so a failed upload
+    can simply be sent again.
+    """
+    if not check_auth(request.headers):
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
+        return jsonify({"status": "error", "reply": "Invalid or missing API Key"}), 401
+    admission.check_key(api_key(request.headers))
+
     try:
-        db.create_all()
-        logger.info("Database initialized successfully")
+        stats = import_sessions(iter_ndjson(request.stream), engine_registry.current().detector)
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        db.session.rollback()
+        logger.error("Session import failed: %s", e, exc_info=True)
+        return jsonify({"status": "error", "reply": str(e)}), 500
+
+    logger.info("Imported %d sessions (%d skipped, %d invalid)", stats["imported"], stats["skipped"], stats["invalid"])
+    return jsonify(dict(stats, status="success"))
+
+
+def intel_lookup():
+    """
+    Threat-intel lookup across every session seen so far.
+
+    GET ?value=...[&kind=...][&sessions=N] looks up one indicator value
+    (under every kind unless kind is given). POST {"text": "..."} extracts
+    indicators from the text with the live detector and looks each one up.
+    Aggregates come from memory; with sessions=N up to N ids of sessions
+    that mentioned the value are read from the database.
+    """
+    if not check_auth(request.headers):
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
+        return jsonify({"status": "error", "reply": "Invalid or missing API Key"}), 401
+    admission.check_key(api_key(request.headers))
+
+    if request.method == 'POST':
+        data = request.get_json(force=True, silent=True) or {}
+        text = data.get('text') if isinstance(data, dict) else None
+        if not isinstance(text, str) or not text:
+            return jsonify({"status": "error", "reply": "text is required"}), 400
+        with metrics.stage("intel_lookup"):
+            extracted = engine_registry.current().detector.analyze_text(text)["extracted_data"]
+            matches = intel_index.lookup_extracted(extracted)
+    else:
+        value = request.args.get('value', '').strip()
+        kind = request.args.get('kind') or None
+        if not value:
+            return jsonify({"status": "error", "reply": "value is required"}), 400
+        if kind is not None and kind not in LOOKUP_KINDS:
+            return jsonify({"status": "error", "reply": f"kind must be one of {', '.join(LOOKUP_KINDS)}"}), 400
+        with metrics.stage("intel_lookup"):
+            matches = intel_index.lookup(value, kind)
+
+    limit = max(0, min(request.args.get('sessions', 0, type=int), MAX_LOOKUP_SESSIONS))
+    if limit:
+        for match in matches:
+            # Domains are derived from links and have no rows of their own
+            if match["kind"] != "link_domain":
+                match["sessions"] = sessions_with_indicator(match["kind"], match["value"], limit=limit)
+
+    return jsonify({"status": "success", "known": bool(matches), "matches": matches})
+
+
+def load_sessions(session_ids):
+    """Returns {session_id: (session, intelligence)} for the sessions that already exist."""
+    if not session_ids:
+        return {}
+    if session_cache.enabled:
+        return {sid: (cached, cached.intelligence) for sid, cached in session_cache.get_many(session_ids).items()}
+
+    rows = (ScamSession.query
+            .options(joinedload(ScamSession.intelligence), joinedload(ScamSession.risk))
+            .filter(ScamSession.id.in_(session_ids))
+            .all())
+    return {row.id: (row, row.intelligence) for row in rows}
+
+
+def create_session(session_id, conversation_history):
+    """Starts a new session plus its intelligence record (persisted by the caller's commit)."""
+    # Import conversation history if provided (one bulk insert)
+    history = []
+    for hist_msg in conversation_history or []:
+        if isinstance(hist_msg, dict):
+            sender = hist_msg.get('sender', 'unknown')
+            text = hist_msg.get('txt_message') or hist_msg.get('text', '')
+            if text:
+                history.append((sender, text))
+
+    if session_cache.enabled:
+        session = session_cache.create(session_id, history)
+        return session, session.intelligence
+
+    # Column defaults only apply at flush, so set the counters explicitly
+    session = ScamSession(id=session_id, turn_count=0, scam_detected=False, agent_state="", messages="")
+    if history:
+        session.add_messages(history)
+
+    db.session.add(session)
+    intelligence = ScamIntelligence(session_id=session_id)
+    session.intelligence = intelligence
+    db.session.add(intelligence)
+    return session, intelligence
+
+
+def known_indicators(extracted, intelligence):
+    """
+    Prescreen hits among a message's extracted indicators, minus the ones
+    only this session has recorded: a hit on a value the session already
+    holds counts only if the intel index shows other sessions with it too.
+    Call it before the message's own indicators are saved.
+    """
+    known = prescreen.check(extracted)
+    if not known:
+        return known
+
+    own = {}
+    for kind, values in intelligence.indicators().items():
+        if kind == "phishing_link":
+            kind, values = "link_domain", [link_domain(value) for value in values]
+        if kind in PRESCREEN_KINDS:
+            for value in values:
+                own.setdefault(indicator_key(kind, value), {}).setdefault(kind, []).append(value)
+    return [
+        key for key in known
+        if key not in own or any(intel_index.other_sessions(kind, key, own[key].get(kind, ())) > 0
+                                 for kind in PRESCREEN_KINDS)
+    ]
+
+
+def process_message(engines, session, intelligence, user_text, meta_data, analysis_result=None):
+    """
+    Runs one scammer message through detection and the agent, updating the
+    session objects (ORM rows or cached state) in place. The caller owns the
+    commit.
+    Returns (reply_data, callback_payload); the payload is None unless a
+    report is due, and is built now so it reflects this turn's state.
+    """
+    session.add_message("scammer", user_text)
+
+    with metrics.stage("analyze"):
+        if analysis_result is None:
+            analysis_result = engines.detector.analyze_text(user_text)
+
+    # Extracted indicators other sessions have recorded settle the verdict.
+    # Checked before this message's indicators are saved, so the session's
+    # own ones are exactly what its earlier turns recorded.
+    with metrics.stage("prescreen"):
+        known = known_indicators(analysis_result['extracted_data'], intelligence)
+
+    with metrics.stage("indicators"):
+        engines.detector.save_result(intelligence, analysis_result)
+    if known:
+        analysis_result['is_scam'] = True
+        analysis_result['flags'].append("known_indicator")
+    metrics.inc("honeypot_messages_total", scam=str(analysis_result['is_scam']).lower())
+    for flag in analysis_result['flags']:
+        metrics.inc("honeypot_detector_flags_total", flag=flag)
+
+    # Fold this message into the session's running risk (no transcript re-read)
+    with metrics.stage("risk"):
+        risk = session.risk_state()
+        risk.update(analysis_result)
+        session.save_risk_state(risk)
+
+    # FIX: Only update to True, never reset to False
+    # Force the session to stay True if it was ever flagged
+    if analysis_result['is_scam']:
+        session.scam_detected = True
+    elif session.scam_detected:
+    # Ensure the current analysis result reflects the session's known status
+        analysis_result['is_scam'] = True#
+
+    # 5. Agent Response Generation
+    # Pass intelligence context
+    with metrics.stage("intel"):
+        indicator_kinds = intelligence.indicator_kinds()
+    current_intelligence_context = {
+        'has_bank': 'bank_account' in indicator_kinds,
+        'has_upi': 'upi_id' in indicator_kinds,
+        'has_phone': 'phone_number' in indicator_kinds,
+        'has_link': 'phishing_link' in indicator_kinds
+    }
+
+    with metrics.stage("reply"):
+        reply_data = engines.agent.generate_reply(
+            session,
+            user_text,
+            meta_data=meta_data,
+            intelligence_context=current_intelligence_context,
+            risk=risk.summary()
+        )
+    metrics.inc("honeypot_agent_states_total", state=reply_data['agent_state'])
+
+    agent_reply = reply_data['reply']
+    session.add_message("agent", agent_reply)
+    session.turn_count += 1
+    session.agent_state = reply_data['agent_state']
+
+    # 6. Callback Logic
+    has_intelligence = any(current_intelligence_context.values())
+    
+    should_report = (
+        session.scam_detected and 
+        session.turn_count >= 6 and 
+        has_intelligence
+    ) or reply_data['end_conversation']
+
+    callback_payload = None
+    if should_report:
+        callback_payload = build_callback_payload(session, intelligence, risk)
+
+    return reply_data, callback_payload
+
+
+def build_callback_payload(session, intelligence, risk):
+    """Snapshots the report for the GUVI evaluation endpoint."""
+    tactics = ", ".join(risk.flags)
+    themes = ", ".join(risk.top_keywords())
+    notes = (f"Honeypot engagement concluded. Threat detected. Tactics identified: {tactics or 'None'}. "
+             f"Risk score {risk.score:g} (peak {risk.peak_score:g}) over {risk.messages_scored} messages. "
+             f"Recurring themes: {themes or 'None'}.")
+    found = intelligence.indicators()
+
+    return {
+    "sessionId": session.id,
+    "scamDetected": session.scam_detected,
+    "totalMessagesExchanged": session.turn_count,
+    "extractedIntelligence": {
+    "bank account": found["bank_account"],
+    "upiid": found["upi_id"],
+    "phishing links": found["phishing_link"],
+    "phone numbers": found["phone_number"],
+    "suspicious keywords": found["suspicious_keyword"]
+    },
+    "agentNotes": notes
+    }
+
+
+ROUTES = (
+    ('/', home, ['GET']),
+    ('/health', health, ['GET']),
+    ('/metrics', metrics_endpoint, ['GET']),
+    ('/chat', chat, ['POST']),
+    ('/chat/batch', chat_batch, ['POST']),
+    ('/sessions/export', sessions_export, ['GET']),
+    ('/sessions/import', sessions_import, ['POST']),
+    ('/intel/lookup', intel_lookup, ['GET', 'POST']),
+)
+
+ERROR_HANDLERS = (
+    (400, bad_request),
+    (401, unauthorized),
+    (Rejected, rejected),
+    (500, internal_error),
+)
+
+_app = None
+
+
+def __getattr__(name):
+    """
+    `app` for entry points that still name the module attribute
+    (`gunicorn app:app`, FLASK_APP=app:app): built on first access, as a
+    server app, except under the flask CLI, which never warms up.
+    """
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app(serving=os.environ.get('FLASK_RUN_FROM_CLI') != 'true')
+    return _app
+
 
 if __name__ == '__main__':
     # Get port from environment variable (Render uses PORT env var)
     port = int(os.environ.get('PORT', 5000))
-    
-    # Check if API keys have been updated
-    if "your_secret_hackathon_key" in API_KEYS and os.environ.get('HACKATHON_API_KEY') is None:
-        logger.warning("="*60)
-        logger.warning("WARNING: Using default API keys!")
-        logger.warning("Set HACKATHON_API_KEY environment variable")
-        logger.warning("="*60)
-    
+
     # Render requires host='0.0.0.0' to accept external connections
-    app.run(host='0.0.0.0', port=port, debug=False)
+    create_app(serving=True).run(host='0.0.0.0', port=port, debug=False)
 
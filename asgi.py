@@ -0,0 +1,192 @@
+"""
+ASGI entry point, for event-loop servers: `uvicorn asgi:app`.
+
+/, /health and /chat are served by async handlers, so a connection waiting
+on its turn costs a coroutine rather than a worker thread. The blocking part
+of a turn (database work and detection) runs on a bounded thread pool inside
+the Flask app context, through the same chat_response() the WSGI view uses,
+so both entry points return identical responses. Callbacks never block a
+request in either mode: they are delivered from the outbox by the
+dispatcher's background workers.
+
+Every other request (/chat/batch, HEAD, unknown paths, ...) is passed to the
+Flask app on the same pool, so the API surface is the same as under gunicorn.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from app import (create_app, api_key, check_auth, chat_response, home_info, health_status,
+                 callback_dispatcher, session_cache, metrics, prescreen, admission, Rejected, SAMPLED)
+
+logger = logging.getLogger(__name__)
+
+flask_app = create_app(serving=True)
+
+# Threads available for blocking work; bounds concurrent DB transactions per process
+ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', 8))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix="asgi-worker")
+
+
+def start_background():
+    """Starts this process's callback workers, metrics writer, prescreen refresh and cache flusher; idempotent."""
+    callback_dispatcher.start()
+    metrics.start()
+    prescreen.start()
+    if session_cache.enabled:
+        session_cache.start()
+
+
+def _in_app_context(fn, *args):
+    with flask_app.app_context():
+        return fn(*args)
+
+
+async def offload(fn, *args):
+    """Runs blocking work on the pool, inside an app context."""
+    return await asyncio.get_running_loop().run_in_executor(executor, _in_app_context, fn, *args)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def request_headers(scope):
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+
+async def home(scope, receive):
+    return home_info(), 200
+
+
+async def health(scope, receive):
+    return health_status(), 200
+
+
+def admit(headers):
+    """
+    Authenticates a /chat request and charges its API key's rate limit.
+    Blocking (the shared bucket file is locked with flock), so it runs on
+    the pool; raises Rejected when the key is over its limit.
+    """
+    with metrics.stage("auth"):
+        if not check_auth(headers):
+            return False
+    admission.check_key(api_key(headers))
+    return True
+
+
+async def chat(scope, receive):
+    """Async counterpart of app.chat(): same checks, same responses."""
+    logger.info("Received request to /chat", extra=SAMPLED)
+    start_background()
+
+    headers = request_headers(scope)
+    if not await offload(admit, headers):
+        logger.warning("Authentication failed", extra={"rate_key": "auth-failed"})
+        return {"status": "error", "reply": "Invalid or missing API Key"}, 401
+
+    body = await read_body(receive)
+    with metrics.stage("parse"):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+    if data is None:
+        logger.error("Invalid JSON payload")
+        return {"status": "error", "reply": "Invalid JSON payload"}, 400
+
+    # Held while queued for the pool too, so a flood cannot pile up unbounded waiters
+    with admission.slot():
+        return await offload(metrics.profiled, "chat", chat_response, data)
+
+
+ROUTES = {
+    ('GET', '/'): home,
+    ('GET', '/health'): health,
+    ('POST', '/chat'): chat,
+}
+
+
+def _call_flask(scope, body):
+    """Runs one request through the WSGI app; returns (status, headers, body)."""
+    client = scope.get('client') or ('', 0)
+    environ = EnvironBuilder(
+        path=scope.get('root_path', '') + scope['path'],
+        method=scope['method'],
+        query_string=scope.get('query_string', b'').decode('latin-1'),
+        headers=list(request_headers(scope).items()),
+        data=body,
+        environ_overrides={'REMOTE_ADDR': client[0], 'wsgi.url_scheme': scope.get('scheme', 'http')},
+    ).get_environ()
+    app_iter, status, headers = run_wsgi_app(flask_app, environ, buffered=True)
+    try:
+        content = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    return int(status.split(' ', 1)[0]), list(headers.items()), content
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_background()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        body = await read_body(receive)
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            executor, _call_flask, scope, body
+        )
+    else:
+        started = time.perf_counter()
+        extra_headers = {}
+        try:
+            payload, status = await handler(scope, receive)
+        except Rejected as e:
+            payload, status, extra_headers = e.body(), e.status, e.headers()
+        except Exception as e:
+            logger.error("Unhandled error on %s: %s", scope['path'], e, exc_info=True)
+            payload, status = {'status': 'error', 'message': 'Internal Server Error'}, 500
+        response = flask_app.json.response(payload)
+        content = response.get_data()
+        headers = [('Content-Type', response.content_type), ('Content-Length', str(len(content)))]
+        headers.extend(extra_headers.items())
+        # Same series the Flask hooks record, keyed by the Flask endpoint name
+        metrics.observe("honeypot_request_duration_seconds", time.perf_counter() - started, endpoint=handler.__name__)
+        metrics.inc("honeypot_requests_total", endpoint=handler.__name__, status=str(status))
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': content})
@@ -0,0 +1,186 @@
+"""
+Latency of well-behaved clients while another API key floods /chat.
+
+Starts `gunicorn 'app:create_app(serving=True)'` (gthread) on a fresh
+database with two API keys, once with admission control on and once with it
+off. Well-behaved clients
+hold conversations on the first key with a think time between turns; they
+run alone first, then again while flood threads hammer /chat on the second
+key with no pause. Reports p50/p99 of the well-behaved requests in both
+phases, their error count, and the status codes the flood received.
+
+Usage:
+    python benchmarks/bench_admission.py
+    python benchmarks/bench_admission.py --flooders 32 --duration 15 --key-rate 20 --clients 8
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GOOD_KEY = 'bench-good-key'
+FLOOD_KEY = 'bench-flood-key'
+
+MESSAGES = [
+    "Dear customer, your account will be blocked today. Update KYC immediately.",
+    "Send the verification fee to refund.desk@ybl or call 9876543210",
+    "Click http://kyc-update-secure.co/verify to avoid legal action",
+    "Transfer to account 123456789012 IFSC SBIN0001234 now",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] * 1000, 2)
+
+
+def good_clients(base, args, stop):
+    """Conversations on GOOD_KEY with a think time; returns (latencies, errors)."""
+    latencies, errors = [], Counter()
+    lock = threading.Lock()
+
+    def converse():
+        http = requests.Session()
+        headers = {'x-api-key': GOOD_KEY}
+        while not stop.is_set():
+            session_id = f"good-{uuid.uuid4()}"
+            for turn in range(args.turns):
+                body = {'sessionId': session_id, 'message': {'text': MESSAGES[turn % len(MESSAGES)]}}
+                started = time.perf_counter()
+                try:
+                    status = http.post(base + '/chat', json=body, headers=headers, timeout=30).status_code
+                except requests.RequestException:
+                    status = 'error'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if status == 200:
+                        latencies.append(elapsed)
+                    else:
+                        errors[str(status)] += 1
+                if stop.wait(args.think):
+                    return
+
+    threads = [threading.Thread(target=converse) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    return threads, latencies, errors
+
+
+def flood(base, stop, statuses, lock):
+    http = requests.Session()
+    headers = {'x-api-key': FLOOD_KEY}
+    while not stop.is_set():
+        body = {'sessionId': f"flood-{uuid.uuid4()}", 'message': {'text': MESSAGES[0]}}
+        try:
+            status = http.post(base + '/chat', json=body, headers=headers, timeout=30).status_code
+        except requests.RequestException:
+            status = 'error'
+        with lock:
+            statuses[str(status)] += 1
+
+
+def phase(base, args, flooders):
+    stop = threading.Event()
+    statuses, lock = Counter(), threading.Lock()
+    flood_threads = [threading.Thread(target=flood, args=(base, stop, statuses, lock)) for _ in range(flooders)]
+    for thread in flood_threads:
+        thread.start()
+    threads, latencies, errors = good_clients(base, args, stop)
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads + flood_threads:
+        thread.join()
+
+    latencies.sort()
+    result = {"good_requests": len(latencies), "good_errors": dict(errors),
+              "good_p50_ms": percentile(latencies, 0.50), "good_p99_ms": percentile(latencies, 0.99)}
+    if flooders:
+        result["flood_statuses"] = dict(statuses)
+        result["flood_rps"] = round(sum(statuses.values()) / args.duration, 1)
+    return result
+
+
+def run_config(name, overrides, args):
+    workdir = tempfile.mkdtemp(prefix=f"honeypot-{name}-")
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'CALLBACK_URL': 'http://127.0.0.1:9/unused',
+        'CALLBACK_MAX_ATTEMPTS': '1',
+        'API_KEYS': f"{GOOD_KEY},{FLOOD_KEY}",
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'ratelimit.buckets'),
+    })
+    env.update(overrides)
+
+    port = free_port()
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        ['gunicorn', '-w', str(args.workers), '--threads', str(args.threads), '-b', f'127.0.0.1:{port}',
+         'app:create_app(serving=True)'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(base + '/health', timeout=1)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{name}: server did not start")
+                time.sleep(0.2)
+
+        return {"config": name, "alone": phase(base, args, 0), "flooded": phase(base, args, args.flooders)}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            # Flood connections can outlast the graceful shutdown
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=4, help='well-behaved conversations at a time')
+    parser.add_argument('--turns', type=int, default=6)
+    parser.add_argument('--think', type=float, default=0.5, help='seconds between turns of a good client')
+    parser.add_argument('--flooders', type=int, default=16, help='threads flooding the second key')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per phase')
+    parser.add_argument('--key-rate', type=float, default=10, help='RATE_LIMIT_KEY_RATE with admission on')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='MAX_IN_FLIGHT with admission on')
+    args = parser.parse_args()
+
+    configs = {
+        "admission-off": {'RATE_LIMIT_KEY_RATE': '0', 'RATE_LIMIT_SESSION_RATE': '0', 'MAX_IN_FLIGHT': '0'},
+        "admission-on": {'RATE_LIMIT_KEY_RATE': str(args.key_rate), 'RATE_LIMIT_KEY_BURST': str(args.key_rate * 2),
+                         'MAX_IN_FLIGHT': str(args.max_in_flight)},
+    }
+    print(json.dumps([run_config(name, overrides, args) for name, overrides in configs.items()], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Concurrent-session capacity of the WSGI and ASGI entry points on one core.
+
+Each mode runs as a single server process on a fresh SQLite database:
+  wsgi-sync     gunicorn 'app:create_app(serving=True)' (sync worker)
+  wsgi-gthread  the same with --threads N
+  asgi          uvicorn asgi:app
+
+For each concurrency level, that many scammer conversations run at once, with
+a think time between turns like a human typing. A level is "sustained" when
+no request fails and p99 latency stays under --slo-ms. The client is a small
+asyncio HTTP/1.1 client, so it can hold hundreds of open conversations
+without needing hundreds of threads.
+
+Usage:
+    python benchmarks/bench_asgi.py
+    python benchmarks/bench_asgi.py --levels 32,128,512 --think 0.5 --slo-ms 500
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Measure the pipeline, not admission control (benchmarks/bench_admission.py covers that)
+for _name in ('RATE_LIMIT_KEY_RATE', 'RATE_LIMIT_SESSION_RATE', 'MAX_IN_FLIGHT'):
+    os.environ.setdefault(_name, '0')
+
+from generator import ScamMessageGenerator
+
+
+def modes(threads):
+    return {
+        "wsgi-sync": ['gunicorn', '-w', '1', '-b', '127.0.0.1:{port}', 'app:create_app(serving=True)'],
+        "wsgi-gthread": ['gunicorn', '-w', '1', '--threads', str(threads), '-b', '127.0.0.1:{port}',
+                         'app:create_app(serving=True)'],
+        "asgi": [sys.executable, '-m', 'uvicorn', '--no-access-log', '--log-level', 'warning',
+                 '--port', '{port}', 'asgi:app'],
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def api_key():
+    """Reads the configured key without touching the default database."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='honeypot-key-'), 'scratch.db')
+    import app as honeypot
+    return next(iter(honeypot.API_KEYS))
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; reconnects when the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def post(self, path, body, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        head = [f"POST {path} HTTP/1.1", "Host: 127.0.0.1", "Content-Type: application/json",
+                f"Content-Length: {len(body)}"] + [f"{k}: {v}" for k, v in headers.items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        length, close = 0, False
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name = name.lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                close = True
+        await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_level(port, key, concurrency, args):
+    generator = ScamMessageGenerator(seed=concurrency)
+    conversations = [generator.conversation(args.turns) for _ in range(concurrency)]
+    latencies, errors = [], 0
+
+    async def converse(messages):
+        nonlocal errors
+        connection = Connection(port)
+        session_id = f"load-{uuid.uuid4()}"
+        # Stagger the start so the sessions do not move in lockstep
+        await asyncio.sleep(args.think * (hash(session_id) % 1000) / 1000)
+        for text in messages:
+            body = json.dumps({'sessionId': session_id, 'message': {'text': text}}).encode()
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(connection.post('/chat', body, {'x-api-key': key}), args.timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError, asyncio.IncompleteReadError):
+                status = None
+                connection.close()
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+            await asyncio.sleep(args.think)
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(converse(messages) for messages in conversations))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000 if latencies else None
+    return {
+        "concurrent_sessions": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round((len(latencies) + errors) / wall, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "p99_ms": round(p99, 2) if p99 is not None else None,
+        "sustained": errors == 0 and p99 is not None and p99 <= args.slo_ms,
+    }
+
+
+def run_mode(name, command, key, args):
+    workdir = tempfile.mkdtemp(prefix=f"honeypot-{name}-")
+    env = dict(os.environ)
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    env['CALLBACK_URL'] = 'http://127.0.0.1:9/unused'
+    env['CALLBACK_MAX_ATTEMPTS'] = '1'
+
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    port = free_port()
+    server = subprocess.Popen([part.format(port=port) for part in command], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{name}: server did not start")
+                time.sleep(0.2)
+
+        levels = []
+        for concurrency in args.levels:
+            levels.append(asyncio.run(run_level(port, key, concurrency, args)))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    sustained = [level["concurrent_sessions"] for level in levels if level["sustained"]]
+    return {"mode": name, "max_sustained_sessions": max(sustained) if sustained else 0, "levels": levels}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', type=lambda value: [int(v) for v in value.split(',')], default=[16, 64, 256])
+    parser.add_argument('--turns', type=int, default=6)
+    parser.add_argument('--think', type=float, default=1.0, help='seconds between turns of one session')
+    parser.add_argument('--slo-ms', type=float, default=1000, help='p99 latency a level must stay under')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--threads', type=int, default=8, help='threads for the gthread mode')
+    parser.add_argument('--modes', help='comma-separated subset of modes')
+    args = parser.parse_args()
+
+    key = api_key()
+    selected = modes(args.threads)
+    if args.modes:
+        selected = {name: selected[name] for name in args.modes.split(',')}
+    results = [run_mode(name, command, key, args) for name, command in selected.items()]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Callback dispatcher check against a local stub of the evaluation endpoint.
+
+The stub answers slowly and fails the first few posts with 503, which is the
+situation that used to pin a worker for the whole request. Reports /chat
+latency (now independent of the endpoint) and what the dispatcher delivered.
+
+Usage: python benchmarks/bench_callbacks.py [--delay 0.5] [--fail-first 3]
+"""
+import os
+import sys
+import time
+import uuid
+import json
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_first = 0
+    received = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.delay)
+        with self.lock:
+            StubHandler.fail_first -= 1
+            failing = StubHandler.fail_first >= 0
+            if not failing:
+                StubHandler.received.append(json.loads(body))
+        self.send_response(503 if failing else 200)
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.5, help='stub response delay (s)')
+    parser.add_argument('--fail-first', type=int, default=3, help='posts answered with 503 first')
+    parser.add_argument('--sessions', type=int, default=5)
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.fail_first = args.fail_first
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['CALLBACK_URL'] = f"http://127.0.0.1:{server.server_port}/callback"
+    os.environ.setdefault('CALLBACK_BACKOFF_BASE', '0.2')
+    import app as honeypot
+
+    client = honeypot.create_app().test_client()
+    headers = {'x-api-key': next(iter(honeypot.API_KEYS))}
+    text = "Your account is blocked. Pay the fee to refund.desk@ybl urgently or call 9876543210"
+
+    latencies = []
+    for _ in range(args.sessions):
+        session_id = f"bench-{uuid.uuid4()}"
+        for _ in range(8):
+            started = time.perf_counter()
+            client.post('/chat', json={'sessionId': session_id, 'message': {'text': text}}, headers=headers)
+            latencies.append(time.perf_counter() - started)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        stats = honeypot.callback_dispatcher.stats()
+        if not (stats['queue_depth'] or stats['in_flight'] or stats['retry_scheduled']):
+            break
+        time.sleep(0.1)
+
+    latencies.sort()
+    print(json.dumps({
+        "chat_requests": len(latencies),
+        "chat_latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 2),
+            "p99": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 2),
+        },
+        "stub_delay_ms": args.delay * 1000,
+        "callbacks_received_by_stub": len(StubHandler.received),
+        "dispatcher": honeypot.callback_dispatcher.stats(),
+    }, indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
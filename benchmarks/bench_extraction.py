@@ -0,0 +1,110 @@
+"""
+Equivalence fuzzing and timing for the single-scan indicator extractor.
+
+1. Fuzz: random strings built from indicator fragments (digit runs, '+91',
+   '@handles', link schemes, IFSC-like tokens, non-ASCII letters and digits)
+   plus generated scam messages are run through both IndicatorExtractor and
+   the five separate findall passes it replaced; any difference is printed
+   and the script exits non-zero.
+2. Throughput on generated messages, old vs new.
+3. Adversarial inputs at doubling sizes: time per character should stay
+   flat for the new extractor (linear); the old passes are shown alongside.
+
+Usage: python benchmarks/bench_extraction.py [--cases 100000] [--seed 0]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+from extraction import (IndicatorExtractor, UPI_PATTERN, PHONE_PATTERN, BANK_PATTERN, LINK_PATTERN,
+                        IFSC_PATTERN)
+
+FRAGMENTS = (
+    list("0123456789") * 4 + list("abcxyhtps") * 2 + list("ABCDS") + list("@@.:/-_+ 9 1\n%")
+    + ["http://", "https://", "+91", "+91 ", "+91-", "@ybl", "SBIN0", "٣", "é", "ß",
+       "ı", "K", " "]
+)
+
+ADVERSARIAL = {
+    "dotted_words": "a.",
+    "digit_run": "1",
+    "phone_like": "9876543210 ",
+    "at_signs": "a@",
+    "schemes": "http://",
+    "ifsc_prefixes": "ABCD0 ",
+}
+
+
+def legacy_extract(text):
+    """The five findall passes ScamDetector ran before the combined scan."""
+    return {
+        "upiIds": set(UPI_PATTERN.findall(text)),
+        "phoneNumbers": set(PHONE_PATTERN.findall(text)),
+        "bankAccounts": set(BANK_PATTERN.findall(text)),
+        "phishingLinks": set(LINK_PATTERN.findall(text)),
+        "ifscCodes": set(IFSC_PATTERN.findall(text.upper())),
+    }
+
+
+def fuzz(extractor, cases, seed):
+    rng = random.Random(seed)
+    texts = ScamMessageGenerator(seed=seed).messages(2000)
+    texts += ["".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 60))) for _ in range(cases)]
+    failures = 0
+    for text in texts:
+        expected, actual = legacy_extract(text), extractor.extract(text)
+        if expected != actual:
+            failures += 1
+            if failures <= 10:
+                print(json.dumps({"text": text, "expected": {k: sorted(v) for k, v in expected.items()},
+                                  "actual": {k: sorted(v) for k, v in actual.items()}}), file=sys.stderr)
+    return {"cases": len(texts), "mismatches": failures}
+
+
+def per_message_us(fn, texts):
+    started = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return round((time.perf_counter() - started) / len(texts) * 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-size', type=int, default=16000, help="largest adversarial input (characters)")
+    args = parser.parse_args()
+
+    # No cap here: equivalence and scaling are about the scan itself
+    extractor = IndicatorExtractor(max_text_length=None)
+    result = {"fuzz": fuzz(extractor, args.cases, args.seed)}
+
+    messages = ScamMessageGenerator(seed=3).messages(5000)
+    result["messages_us"] = {"legacy": per_message_us(legacy_extract, messages),
+                             "combined": per_message_us(extractor.extract, messages)}
+
+    scaling = {}
+    for name, unit in ADVERSARIAL.items():
+        rows, size = [], 1000
+        while size <= args.max_size:
+            text = (unit * (size // len(unit) + 1))[:size]
+            rows.append({"chars": size,
+                         "legacy_ms": round(per_message_us(legacy_extract, [text]) / 1000, 2),
+                         "combined_ms": round(per_message_us(extractor.extract, [text]) / 1000, 2)})
+            size *= 2
+        scaling[name] = rows
+    result["adversarial"] = scaling
+
+    print(json.dumps(result, indent=2))
+    if result["fuzz"]["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
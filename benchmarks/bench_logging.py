@@ -0,0 +1,88 @@
+"""
+Per-request logging overhead on /chat under different logging settings.
+
+Each configuration runs in its own process, with stderr sent to a real file
+(as under a process manager), and drives /chat through the test client:
+valid turns first, then a flood of requests with a wrong API key. Reports
+mean and p50 per-request time and the number of log lines written.
+
+Usage: python benchmarks/bench_logging.py [--requests 2000]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Measure the pipeline, not admission control (benchmarks/bench_admission.py covers that)
+for _name in ('RATE_LIMIT_KEY_RATE', 'RATE_LIMIT_SESSION_RATE', 'MAX_IN_FLIGHT'):
+    os.environ.setdefault(_name, '0')
+
+CONFIGS = {
+    # Equivalent of the previous logging.basicConfig(level=INFO) setup
+    "sync-text": {"LOG_QUEUE": "0", "LOG_RATE_LIMIT": "0"},
+    "queue-text": {"LOG_QUEUE": "1"},
+    "queue-text-sampled": {"LOG_QUEUE": "1", "LOG_SAMPLE_RATE": "0.1"},
+    "queue-json-sampled": {"LOG_QUEUE": "1", "LOG_FORMAT": "json", "LOG_SAMPLE_RATE": "0.1"},
+}
+
+
+def child(requests_count):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as honeypot
+    from generator import ScamMessageGenerator
+
+    client = honeypot.create_app().test_client()
+    good = {'x-api-key': next(iter(honeypot.API_KEYS))}
+    texts = ScamMessageGenerator(seed=3).messages(requests_count)
+
+    def run(headers):
+        latencies = []
+        session_id = f"bench-{uuid.uuid4()}"
+        for index, text in enumerate(texts):
+            if index % 8 == 0:
+                session_id = f"bench-{uuid.uuid4()}"
+            started = time.perf_counter()
+            client.post('/chat', json={'sessionId': session_id, 'message': {'text': text}}, headers=headers)
+            latencies.append(time.perf_counter() - started)
+        return {"mean_us": round(statistics.mean(latencies) * 1e6, 1),
+                "p50_us": round(statistics.median(latencies) * 1e6, 1)}
+
+    result = {"chat": run(good), "bad_key_flood": run({'x-api-key': 'wrong-key'})}
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.requests)
+
+    results = []
+    for name, overrides in CONFIGS.items():
+        workdir = tempfile.mkdtemp(prefix=f"honeypot-log-{name}-")
+        env = dict(os.environ, **overrides)
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        env['CALLBACK_URL'] = 'http://127.0.0.1:9/unused'
+        env['CALLBACK_MAX_ATTEMPTS'] = '1'
+        log_path = os.path.join(workdir, 'stderr.log')
+        with open(log_path, 'w') as stderr:
+            output = subprocess.run([sys.executable, __file__, '--child', '--requests', str(args.requests)],
+                                    env=env, stdout=subprocess.PIPE, stderr=stderr, check=True, text=True)
+        with open(log_path) as handle:
+            lines = sum(1 for _ in handle)
+        results.append(dict(config=name, log_lines=lines, **json.loads(output.stdout.strip().splitlines()[-1])))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
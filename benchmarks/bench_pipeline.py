@@ -0,0 +1,156 @@
+"""
+Equivalence and latency of the staged detector pipeline.
+
+1. Equivalence: synthetic messages (generator.py) plus edge cases are scored
+   by ScamDetector with DEFAULT_STAGES and by the single method it was split
+   from; results must be identical (exit 1 otherwise).
+2. Time per message: single method vs the default stages.
+3. A slow stage (sleeps --slow-min-ms..--slow-max-ms, like a local ML
+   classifier) added to the default stages, once inline and once concurrent
+   with a --budget-ms budget: p50/p99/max analyze_text latency and how many
+   results were scored without it.
+
+Usage: python benchmarks/bench_pipeline.py [--messages 20000] [--slow-calls 300] [--budget-ms 20]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+from detector import ScamDetector
+from stages import DEFAULT_STAGES, Stage, register_stage
+
+EDGE_CASES = ["", " ", "now", "URGENT: account BLOCKED", "click http://x.co now, account frozen",
+              "pay 123456789012 SBIN0001234", "call +91 9876543210", "a@ybl", "ünïcode 9876543210 blocked"]
+
+
+def legacy_analyze(detector, text):
+    """ScamDetector.analyze_text before it was split into stages."""
+    if not text:
+        return {"is_scam": False, "risk_score": 0, "flags": [], "extracted_data": {}}
+
+    text = text[:detector.max_text_length]
+    text_lower = text.lower()
+    risk_score = 0
+    flags = []
+
+    extracted = {"suspiciousKeywords": set()}
+    extracted.update(detector.extractor.extract(text))
+
+    hits = detector._match_keywords(text_lower)
+    keyword_matches = hits & detector.keywords
+    extracted["suspiciousKeywords"] = keyword_matches
+    risk_score += 10 * len(keyword_matches)
+
+    has_urgency = not hits.isdisjoint(detector.urgency_words)
+    has_threat = not hits.isdisjoint(detector.threat_words)
+    has_verify = not hits.isdisjoint(detector.verify_words)
+
+    if has_urgency and has_threat:
+        risk_score += 20
+        flags.append("urgency_with_threat")
+    if has_verify and has_threat:
+        risk_score += 15
+        flags.append("verify_with_threat")
+    if extracted["upiIds"] or extracted["bankAccounts"] or extracted["ifscCodes"]:
+        risk_score += 30
+        flags.append("payment_request")
+    if extracted["phishingLinks"]:
+        risk_score += 40
+        flags.append("phishing_link")
+        if has_urgency:
+            risk_score += 10
+    if extracted["phoneNumbers"]:
+        risk_score += 10
+        flags.append("contact_sharing")
+
+    indicator_count = sum([
+        bool(extracted["upiIds"]), bool(extracted["bankAccounts"]), bool(extracted["phishingLinks"]),
+        bool(keyword_matches), has_urgency, has_threat
+    ])
+    if indicator_count >= 3:
+        risk_score += 20
+        flags.append("multiple_indicators")
+
+    is_scam = (risk_score >= 30 or indicator_count >= 2 or bool(extracted["upiIds"]) or
+               bool(extracted["bankAccounts"]) or bool(extracted["phishingLinks"]))
+    return {"is_scam": is_scam, "risk_score": risk_score, "flags": flags, "extracted_data": extracted}
+
+
+@register_stage("bench_sleep")
+class SleepStage(Stage):
+    """Stands in for a costly detector: sleeps a random time, then adds a small score."""
+
+    def __init__(self, name, min_ms=1, max_ms=50, **options):
+        super().__init__(name, **options)
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.random = random.Random(3)
+
+    def run(self, text, text_lower):
+        time.sleep(self.random.uniform(self.min_ms, self.max_ms) / 1000)
+        return {"score": 5, "flags": ["classifier"]}
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+    return {"p50_ms": pct(0.50), "p99_ms": pct(0.99), "max_ms": pct(1.0)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--slow-calls', type=int, default=300)
+    parser.add_argument('--slow-min-ms', type=float, default=1)
+    parser.add_argument('--slow-max-ms', type=float, default=60)
+    parser.add_argument('--budget-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    texts = EDGE_CASES + ScamMessageGenerator(seed=11).messages(args.messages)
+    detector = ScamDetector()
+
+    mismatches = 0
+    for text in texts:
+        if detector.analyze_text(text) != legacy_analyze(detector, text):
+            mismatches += 1
+            if mismatches <= 5:
+                print(json.dumps({"text": text[:200]}), file=sys.stderr)
+    result = {"equivalence": {"messages": len(texts), "mismatches": mismatches}}
+
+    timings = {}
+    for name, fn in (("single_method", lambda text: legacy_analyze(detector, text)),
+                     ("stages", detector.analyze_text)):
+        started = time.perf_counter()
+        for text in texts:
+            fn(text)
+        timings[name] = round((time.perf_counter() - started) / len(texts) * 1e6, 2)
+    result["us_per_message"] = timings
+
+    sample = texts[:args.slow_calls]
+    slow = {"name": "classifier", "type": "bench_sleep", "min_ms": args.slow_min_ms, "max_ms": args.slow_max_ms}
+    for mode, extra in (("inline", {}), ("concurrent", {"concurrent": True, "budget_ms": args.budget_ms})):
+        staged = ScamDetector(stages=list(DEFAULT_STAGES) + [dict(slow, **extra)])
+        latencies, degraded = [], 0
+        for text in sample:
+            started = time.perf_counter()
+            outcome = staged.analyze_text(text)
+            latencies.append(time.perf_counter() - started)
+            degraded += bool(outcome.get("degraded_stages"))
+        result[f"slow_stage_{mode}"] = dict(percentiles(latencies), degraded=degraded, calls=len(sample))
+
+    print(json.dumps(result, indent=2))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
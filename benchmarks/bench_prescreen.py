@@ -0,0 +1,97 @@
+"""
+Size, accuracy and speed of the known-indicator prescreen (prescreen.py).
+
+Fills Bloom filters with N synthetic indicators (UPI IDs, phone numbers,
+accounts, link domains) at several false-positive targets and memory caps,
+then reports the file size, the measured false-positive rate over keys that
+were never added, and the per-message cost of a prescreen check (probing the
+indicators the detector extracted) next to the detector pass itself.
+
+Usage: python benchmarks/bench_prescreen.py [--indicators 200000] [--probes 200000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+from prescreen import BloomFile, extracted_keys, indicator_key, expected_fp_rate
+from detector import ScamDetector
+
+# (fp_rate, max_bytes); max_bytes 0 means sized purely from the rate
+CONFIGS = [(0.01, 0), (0.001, 0), (0.0001, 0), (0.001, 128 * 1024)]
+
+
+def indicators(generator, count):
+    for index in range(count):
+        pick = index % 4
+        if pick == 0:
+            yield indicator_key("upi_id", generator.upi_id())
+        elif pick == 1:
+            yield indicator_key("phone_number", generator.phone())
+        elif pick == 2:
+            yield indicator_key("bank_account", generator.account())
+        else:
+            yield indicator_key("link_domain", f"{generator.upi_id().split('@')[0]}.example.net")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--indicators', type=int, default=200000)
+    parser.add_argument('--probes', type=int, default=200000)
+    parser.add_argument('--messages', type=int, default=5000)
+    args = parser.parse_args()
+
+    members = list(indicators(ScamMessageGenerator(seed=1), args.indicators))
+    member_set = set(members)
+    # A different seed gives keys of the same shapes that were never added
+    probes = [key for key in indicators(ScamMessageGenerator(seed=2), args.probes) if key not in member_set]
+    messages = ScamMessageGenerator(seed=3).messages(args.messages)
+    detector = ScamDetector()
+    extracted = [detector.analyze_text(text)["extracted_data"] for text in messages]
+    workdir = tempfile.mkdtemp(prefix='honeypot-prescreen-')
+
+    results = []
+    for fp_rate, max_bytes in CONFIGS:
+        path = os.path.join(workdir, f"filter-{fp_rate}-{max_bytes}.bloom")
+        bloom = BloomFile.create(path, args.indicators, fp_rate, max_bytes)
+        started = time.perf_counter()
+        for key in members:
+            bloom.add(key)
+        build_s = time.perf_counter() - started
+
+        assert all(key in bloom for key in members[:1000])
+        false_hits = sum(1 for key in probes if key in bloom)
+
+        started = time.perf_counter()
+        for data in extracted:
+            [key for key in extracted_keys(data) if key in bloom]
+        check_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        results.append({
+            "fp_target": fp_rate,
+            "max_bytes": max_bytes,
+            "bytes": os.path.getsize(path),
+            "hashes": bloom.hashes,
+            "fp_expected": round(expected_fp_rate(bloom.bits, bloom.hashes, len(member_set)), 6),
+            "fp_measured": round(false_hits / len(probes), 6),
+            "build_s": round(build_s, 2),
+            "check_us_per_message": round(check_us, 1),
+        })
+        bloom.close()
+
+    started = time.perf_counter()
+    for text in messages:
+        detector.analyze_text(text)
+    analyze_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+    print(json.dumps({"indicators": args.indicators, "probes": len(probes),
+                      "analyze_us_per_message": round(analyze_us, 1), "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
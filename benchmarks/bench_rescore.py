@@ -0,0 +1,65 @@
+"""
+Scaling of `rescore-sessions` with the number of worker processes.
+
+Loads synthetic sessions into a scratch SQLite database (through the NDJSON
+importer), then dry-runs the re-score with 1, 2, 4, ... workers up to the CPU
+count and reports sessions/s and speedup over one worker.
+
+Usage: python benchmarks/bench_rescore.py [--sessions 5000] [--turns 8]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='honeypot-rescore-'), 'bench.db')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--turns', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    import app as honeypot
+    from transfer import import_sessions
+    from rescore import rescore_sessions
+
+    generator = ScamMessageGenerator(seed=7)
+    records = (
+        (index, {"sessionId": f"rescore-{index:07d}",
+                 "messages": [{"sender": "scammer", "text": text} for text in generator.conversation(args.turns)]})
+        for index in range(args.sessions)
+    )
+    flask_app = honeypot.create_app()
+    with flask_app.app_context():
+        import_sessions(records, honeypot.engine_registry.current().detector)
+
+        counts, workers = [], 1
+        while workers <= (os.cpu_count() or 1):
+            counts.append(workers)
+            workers *= 2
+
+        results = []
+        for workers in counts:
+            stats = rescore_sessions(flask_app.config['SQLALCHEMY_DATABASE_URI'], workers=workers,
+                                     batch_size=args.batch_size, dry_run=True)
+            results.append({"workers": workers, "sessions_per_s": stats["sessions_per_s"]})
+
+    base = results[0]["sessions_per_s"]
+    for result in results:
+        result["speedup"] = round(result["sessions_per_s"] / base, 2)
+    print(json.dumps({"sessions": args.sessions, "turns": args.turns, "cpus": os.cpu_count(),
+                      "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
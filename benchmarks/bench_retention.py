@@ -0,0 +1,155 @@
+"""
+Compaction of expired sessions: space reclaimed, writer stalls, archive search.
+
+Imports synthetic sessions (scam and benign) with createdAt spread over
+--days into a scratch SQLite database (through the NDJSON importer), then runs one compaction
+pass with retention of --scam-days / --clean-days while a writer thread
+keeps inserting sessions the way request handlers do. Reports the pass
+(sessions expired, bytes reclaimed, longest write transaction), the
+writer's commit latency during the pass, checks that exactly the expired
+sessions were archived and deleted, and times archive searches by
+indicator (keys files) and by message text (full scan).
+
+Usage: python benchmarks/bench_retention.py [--sessions 5000] [--turns 8] [--batch-size 200]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+
+WORKDIR = tempfile.mkdtemp(prefix='honeypot-retention-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'bench.db')
+os.environ.setdefault('CALLBACK_URL', 'http://127.0.0.1:9/unused')
+
+
+# Ordinary conversations, so both retention periods have sessions to expire
+BENIGN = ["Hi, is this the right number for the bakery?", "Can you send me the photos from the trip?",
+          "Thanks, see you tomorrow at the station.", "Running ten minutes late, order for me."]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] * 1000, 2)
+
+
+def writer(app, db, ScamSession, stop, latencies):
+    """Inserts and commits one session at a time until stopped, timing each commit."""
+    with app.app_context():
+        while not stop.is_set():
+            started = time.perf_counter()
+            db.session.add(ScamSession(id=f"live-{uuid.uuid4()}", turn_count=0, agent_state=""))
+            db.session.commit()
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.005)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--turns', type=int, default=8)
+    parser.add_argument('--clean-ratio', type=float, default=0.3, help='share of benign conversations')
+    parser.add_argument('--days', type=float, default=180, help='createdAt spread over this many days')
+    parser.add_argument('--scam-days', type=float, default=90)
+    parser.add_argument('--clean-days', type=float, default=30)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    import app as honeypot
+    from models import db, ScamSession
+    from transfer import import_sessions
+    from retention import retention, search
+
+    now = datetime.utcnow()
+    rng = random.Random(7)
+    generator = ScamMessageGenerator(seed=7)
+
+    def conversation():
+        if rng.random() < args.clean_ratio:
+            return [rng.choice(BENIGN) for _ in range(args.turns)]
+        return generator.conversation(args.turns)
+
+    records = (
+        (index, {"sessionId": f"retention-{index:07d}",
+                 "createdAt": (now - timedelta(days=rng.uniform(0, args.days))).isoformat(),
+                 "messages": [{"sender": "scammer", "text": text} for text in conversation()]})
+        for index in range(args.sessions)
+    )
+    archive_dir = os.path.join(WORKDIR, 'archive')
+
+    flask_app = honeypot.create_app()
+    with flask_app.app_context():
+        import_sessions(records, honeypot.engine_registry.current().detector)
+        expected = set()
+        for scam, days in ((True, args.scam_days), (False, args.clean_days)):
+            expected.update(db.session.scalars(
+                db.select(ScamSession.id).where(ScamSession.created_at < now - timedelta(days=days),
+                                                ScamSession.scam_detected == scam)
+            ))
+        db.session.rollback()
+
+        stop, latencies = threading.Event(), []
+        thread = threading.Thread(target=writer, args=(flask_app, db, ScamSession, stop, latencies))
+        thread.start()
+        time.sleep(0.5)
+        idle = len(latencies)
+        report = retention.run(now=now, scam_days=args.scam_days, clean_days=args.clean_days,
+                               archive_dir=archive_dir, batch_size=args.batch_size)
+        stop.set()
+        thread.join()
+
+        remaining = set(db.session.scalars(db.select(ScamSession.id).where(ScamSession.id.like("retention-%"))))
+        db.session.rollback()
+
+    archived = {record["sessionId"]: record for record in search(archive_dir)}
+    during = sorted(latencies[idle:])
+    result = {
+        "sessions": args.sessions,
+        "compaction": report,
+        "writer_during_pass": {"commits": len(during), "p50_ms": percentile(during, 0.50),
+                               "p99_ms": percentile(during, 0.99), "max_ms": percentile(during, 1.0)},
+        "check": {
+            "expected_expired": len(expected),
+            "archived": len(archived),
+            "archived_is_expired": set(archived) == expected,
+            "expired_gone": not (expected & remaining),
+            "kept": len(remaining),
+        },
+    }
+
+    sample = next((record for record in archived.values() if record["intelligence"]), None)
+    if sample is not None:
+        value = next(iter(sample["intelligence"].values()))[0]
+        started = time.perf_counter()
+        hits = sum(1 for _ in search(archive_dir, value=value))
+        by_value_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        text_hits = sum(1 for _ in search(archive_dir, contains=sample["messages"][0]["text"][:20]))
+        by_text_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        missing = sum(1 for _ in search(archive_dir, value="no-such-indicator@nowhere"))
+        miss_ms = (time.perf_counter() - started) * 1000
+        result["search"] = {"by_indicator": {"hits": hits, "ms": round(by_value_ms, 2)},
+                            "by_indicator_absent": {"hits": missing, "ms": round(miss_ms, 2)},
+                            "by_text_full_scan": {"hits": text_hits, "ms": round(by_text_ms, 2)}}
+
+    print(json.dumps(result, indent=2))
+    check = result["check"]
+    if not (check["archived_is_expired"] and check["expired_gone"]):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
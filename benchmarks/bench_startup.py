@@ -0,0 +1,243 @@
+"""
+Cold-start cost: import time and time to first response.
+
+Against a scratch SQLite database that `flask init-db` (or, for an older
+tree without it, a plain import) has already initialized, like a deployed
+instance:
+  import        wall time of importing app and building it as a server
+                does (`create_app(serving=True)`; a plain import for trees
+                that build the app at import time), of importing just
+                Flask and SQLAlchemy (the floor no app change can remove),
+                and the difference: the app's own startup overhead. Also
+                the slowest direct imports of app (`python -X importtime`)
+  in_process    process start to the first /chat reply through the test
+                client, plus that first request on its own
+  gunicorn      `gunicorn -w --workers` start to the first /chat reply over
+                HTTP, with the tree's own gunicorn settings (preload_app
+                and the wsgi_app target, where gunicorn.conf.py sets them;
+                app:app otherwise) and with GUNICORN_PRELOAD=0
+Each figure is the median of --runs runs. With --compare REF the same
+measurements run on a checkout of REF (git worktree), interleaved run by
+run with the current tree so machine noise hits both alike, and the report
+adds the improvement. Target (--target, default 30%): the app's own import
+overhead and the gunicorn time to first response both improve on REF by
+at least that much; exits 1 if not.
+
+Usage: python benchmarks/bench_startup.py [--runs 7] [--workers 2] [--compare HEAD~1] [--target 0.3]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRAMEWORK = "import flask, flask_sqlalchemy, sqlalchemy.orm, sqlalchemy.dialects.sqlite"
+
+# Older trees build the app when the module is imported
+STARTUP = "import app\nif not hasattr(app, 'app'):\n    app.create_app(serving=True)"
+
+FIRST_RESPONSE = """
+import time, json
+started = time.perf_counter()
+import app as honeypot
+flask_app = getattr(honeypot, 'app', None) or honeypot.create_app(serving=True)
+imported = time.perf_counter()
+client = flask_app.test_client()
+response = client.post('/chat', json={"sessionId": "startup", "message": {"text": "Your account is blocked, pay to x@ybl"}},
+                       headers={"x-api-key": next(iter(honeypot.API_KEYS))})
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - started, "first_request_s": done - imported}))
+"""
+
+CHAT_BODY = json.dumps({"sessionId": "startup", "message": {"text": "Your account is blocked, pay to x@ybl"}}).encode()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Tree:
+    """One checkout under test, with its own scratch database."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.workdir = tempfile.mkdtemp(prefix='honeypot-startup-')
+        self.env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(self.workdir, 'startup.db'),
+                        CALLBACK_URL='http://127.0.0.1:9/unused', LOG_LEVEL='WARNING')
+        self.env.pop('GUNICORN_PRELOAD', None)
+        self.samples = {}
+        self.modules = {}
+        self.loaded = set()
+
+        initialized = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=path,
+                                     env=self.env, capture_output=True).returncode == 0
+        if not initialized:
+            # A tree from before `flask init-db`: importing the app creates the schema
+            self.run('import app')
+        # Also leaves up-to-date bytecode behind, as a deployed image has
+        self.key = self.run('import app; print(next(iter(app.API_KEYS)))').stdout.split()[-1]
+        # Trees whose gunicorn.conf.py names the app (wsgi_app) are started the way it says
+        conf = os.path.join(path, 'gunicorn.conf.py')
+        names_app = os.path.exists(conf) and 'wsgi_app' in open(conf).read()
+        self.gunicorn_target = [] if names_app else ['app:app']
+
+    def run(self, code, *flags):
+        return subprocess.run([sys.executable, *flags, '-c', code], cwd=self.path, env=self.env,
+                              capture_output=True, text=True, check=True)
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def median_ms(self, name):
+        return ms(statistics.median(self.samples[name]))
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def measure_imports(tree):
+    started = time.perf_counter()
+    result = tree.run(STARTUP, '-X', 'importtime')
+    tree.add("import", time.perf_counter() - started)
+    started = time.perf_counter()
+    tree.run(FRAMEWORK)
+    tree.add("framework", time.perf_counter() - started)
+
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, raw = line[len('import time:'):].split('|')
+        name = raw.strip()
+        depth = len(raw) - len(raw.lstrip()) - 1
+        tree.loaded.add(name)
+        # Children are listed before their parent, two spaces deeper
+        if depth == 2:
+            children.append((name, int(cumulative)))
+        elif depth == 0:
+            if name == 'app':
+                for child, micros in children + [('app', int(cumulative))]:
+                    tree.modules.setdefault(child, []).append(micros / 1e6)
+            children = []
+
+
+def measure_first_response(tree):
+    started = time.perf_counter()
+    result = tree.run(FIRST_RESPONSE)
+    tree.add("in_process", time.perf_counter() - started)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    tree.add("in_process_import", timings["import_s"])
+    tree.add("first_request", timings["first_request_s"])
+
+
+def measure_gunicorn(tree, workers, preload):
+    env = dict(tree.env, GUNICORN_PRELOAD='1' if preload else '0')
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', *tree.gunicorn_target],
+                               cwd=tree.path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() < started + 60:
+            request = urllib.request.Request(f'http://127.0.0.1:{port}/chat', data=CHAT_BODY, method='POST',
+                                             headers={'Content-Type': 'application/json', 'x-api-key': tree.key})
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    if response.status == 200:
+                        tree.add("gunicorn" if preload else "gunicorn_no_preload", time.perf_counter() - started)
+                        return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError("gunicorn did not answer within 60s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(tree):
+    slowest = sorted(((name, statistics.median(values)) for name, values in tree.modules.items()),
+                     key=lambda item: -item[1])[:8]
+    overhead = [total - floor for total, floor in zip(tree.samples["import"], tree.samples["framework"])]
+    return {
+        "import": {"wall_ms": tree.median_ms("import"), "framework_ms": tree.median_ms("framework"),
+                   "app_overhead_ms": ms(statistics.median(overhead)),
+                   "slowest_imports_ms": {name: ms(seconds) for name, seconds in slowest},
+                   "loads_requests": 'requests' in tree.loaded},
+        "in_process": {"start_to_first_response_ms": tree.median_ms("in_process"),
+                       "import_ms": tree.median_ms("in_process_import"),
+                       "first_request_ms": tree.median_ms("first_request")},
+        "gunicorn": {"start_to_first_response_ms": tree.median_ms("gunicorn")},
+        "gunicorn_no_preload": {"start_to_first_response_ms": tree.median_ms("gunicorn_no_preload")},
+    }
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--compare', help='git ref to measure the same way (e.g. HEAD~1)')
+    parser.add_argument('--target', type=float, default=0.3, help='required improvement over --compare')
+    args = parser.parse_args()
+
+    worktree = None
+    trees = [Tree("current", ROOT)]
+    try:
+        if args.compare:
+            worktree = tempfile.mkdtemp(prefix='honeypot-startup-ref-')
+            subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.compare], cwd=ROOT, check=True,
+                           capture_output=True)
+            trees.append(Tree("baseline", worktree))
+
+        for _ in range(args.runs):
+            for tree in trees:
+                measure_imports(tree)
+                measure_first_response(tree)
+                measure_gunicorn(tree, args.workers, preload=True)
+                measure_gunicorn(tree, args.workers, preload=False)
+        result = {tree.name: report(tree) for tree in trees}
+    finally:
+        for tree in trees:
+            tree.close()
+        if worktree:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, capture_output=True)
+
+    failed = False
+    if args.compare:
+        result["baseline"]["ref"] = args.compare
+        improvement = {}
+        for section, field in (("import", "wall_ms"), ("import", "app_overhead_ms"),
+                               ("in_process", "start_to_first_response_ms"), ("in_process", "first_request_ms"),
+                               ("gunicorn", "start_to_first_response_ms"),
+                               ("gunicorn_no_preload", "start_to_first_response_ms")):
+            before = result["baseline"][section][field]
+            after = result["current"][section][field]
+            improvement[f"{section}.{field}"] = round(1 - after / before, 3)
+        result["improvement"] = improvement
+        result["target"] = args.target
+        result["target_met"] = (improvement["import.app_overhead_ms"] >= args.target and
+                                improvement["gunicorn.start_to_first_response_ms"] >= args.target)
+        failed = not result["target_met"]
+
+    print(json.dumps(result, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
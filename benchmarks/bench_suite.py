@@ -0,0 +1,283 @@
+"""
+Benchmark suite for the /chat pipeline, with a stored-baseline comparison.
+
+Micro-benchmarks (synthetic messages from generator.py):
+  analyze_text      detector scoring only
+  analyze_message   scoring plus saving indicators to a session (SQLite)
+  save_indicators   the indicator upsert alone (what _merge used to do)
+  generate_reply    agent turn logic
+
+End-to-end: concurrent multi-turn conversations against /chat, in-process
+through Flask's test client or against a running server with --url.
+
+Results are printed as JSON. --save-baseline writes them out; --baseline
+compares against a stored file and flags anything slower than --tolerance.
+
+Usage:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json --fail-on-regression
+    python benchmarks/bench_suite.py --only e2e --url http://127.0.0.1:8000 --sessions 200
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import tempfile
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generator import ScamMessageGenerator
+
+# Everything the suite writes goes to a scratch database, never the real one
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='honeypot-bench-'), 'bench.db')
+# Callbacks go nowhere and give up at once; they are not what is measured here
+os.environ.setdefault('CALLBACK_URL', 'http://127.0.0.1:9/unused')
+os.environ.setdefault('CALLBACK_MAX_ATTEMPTS', '1')
+# Measure the pipeline, not admission control (benchmarks/bench_admission.py covers that)
+for _name in ('RATE_LIMIT_KEY_RATE', 'RATE_LIMIT_SESSION_RATE', 'MAX_IN_FLIGHT'):
+    os.environ.setdefault(_name, '0')
+
+# Lower is better for these fields; throughput is the one higher-is-better field
+LATENCY_FIELDS = ("p50_us", "p99_us", "p50_ms", "p99_ms")
+
+_flask_app = None
+
+
+def flask_app():
+    """The app, built on first use; its extensions are per-process singletons, so once per run."""
+    global _flask_app
+    if _flask_app is None:
+        import app as honeypot
+        _flask_app = honeypot.create_app()
+    return _flask_app
+
+
+def summarize(latencies, wall, unit="us"):
+    """Throughput and percentiles for a list of per-operation seconds."""
+    latencies = sorted(latencies)
+    scale = 1e6 if unit == "us" else 1e3
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * scale, 2)
+
+    return {
+        "ops": len(latencies),
+        "throughput_ops": round(len(latencies) / wall, 1) if wall else None,
+        f"p50_{unit}": pct(0.50),
+        f"p99_{unit}": pct(0.99),
+        f"max_{unit}": round(latencies[-1] * scale, 2),
+    }
+
+
+def timed(fn, inputs):
+    """Calls fn on every input, returning (per-call latencies, wall time)."""
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+def bench_micro(args):
+    import app as honeypot
+    from models import db, ScamSession, ScamIntelligence
+
+    engines = honeypot.engine_registry.current()
+    texts = ScamMessageGenerator(seed=args.seed).messages(args.messages)
+    results = {}
+
+    latencies, wall = timed(engines.detector.analyze_text, texts)
+    results["analyze_text"] = summarize(latencies, wall)
+
+    with flask_app().app_context():
+        db.create_all()
+
+        def new_session():
+            session_id = f"bench-{uuid.uuid4()}"
+            session = ScamSession(id=session_id, turn_count=0, scam_detected=False, messages="")
+            intel = ScamIntelligence(session_id=session_id)
+            db.session.add_all([session, intel])
+            db.session.commit()
+            return session, intel
+
+        # A fresh session every few messages, so inserts and duplicates both occur
+        # Commits happen between timed calls and are not counted
+        session, intel = new_session()
+        latencies = []
+        for index, text in enumerate(texts):
+            if index % args.turns == 0:
+                session, intel = new_session()
+            t0 = time.perf_counter()
+            engines.detector.analyze_message(text, session, intel)
+            latencies.append(time.perf_counter() - t0)
+            db.session.commit()
+        results["analyze_message"] = summarize(latencies, sum(latencies))
+
+        extracted = [engines.detector.analyze_text(text)["extracted_data"] for text in texts]
+        session, intel = new_session()
+        latencies = []
+        for index, data in enumerate(extracted):
+            if index % args.turns == 0:
+                session, intel = new_session()
+            t0 = time.perf_counter()
+            intel.add_indicators(data)
+            latencies.append(time.perf_counter() - t0)
+            db.session.commit()
+        results["save_indicators"] = summarize(latencies, sum(latencies))
+
+    contexts = [
+        {"has_bank": i % 2 == 0, "has_upi": i % 3 == 0, "has_phone": False, "has_link": i % 5 == 0}
+        for i in range(len(texts))
+    ]
+    sessions = [SimpleNamespace(turn_count=i % (engines.agent.max_turns + 2)) for i in range(len(texts))]
+    latencies, wall = timed(
+        lambda i: engines.agent.generate_reply(sessions[i], texts[i], intelligence_context=contexts[i]),
+        range(len(texts))
+    )
+    results["generate_reply"] = summarize(latencies, wall)
+    return results
+
+
+def bench_e2e(args):
+    import app as honeypot
+
+    generator = ScamMessageGenerator(seed=args.seed + 1)
+    conversations = [generator.conversation(args.turns) for _ in range(args.sessions)]
+    headers = {'x-api-key': next(iter(honeypot.API_KEYS))}
+    local = threading.local()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    if args.url:
+        import requests
+
+        def post(body):
+            http = getattr(local, 'http', None)
+            if http is None:
+                http = local.http = requests.Session()
+            try:
+                return http.post(args.url.rstrip('/') + '/chat', json=body, headers=headers, timeout=30).status_code
+            except requests.RequestException:
+                return None
+    else:
+        with flask_app().app_context():
+            honeypot.db.create_all()
+
+        def post(body):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = flask_app().test_client()
+            return client.post('/chat', json=body, headers=headers).status_code
+
+    def converse(messages):
+        session_id = f"bench-{uuid.uuid4()}"
+        for text in messages:
+            t0 = time.perf_counter()
+            status = post({'sessionId': session_id, 'message': {'text': text}})
+            elapsed = time.perf_counter() - t0
+            with lock:
+                (latencies if status == 200 else errors).append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(converse, conversations))
+    wall = time.perf_counter() - started
+
+    if not latencies:
+        return {"chat": {"ops": 0, "errors": len(errors)}}
+    result = summarize(latencies, wall, unit="ms")
+    result["errors"] = len(errors)
+    result["target"] = args.url or "test_client"
+    result["session_cache"] = os.environ.get('SESSION_CACHE_MODE', 'off')
+    return {"chat": result}
+
+
+def compare(current, baseline, tolerance):
+    """
+    Per-metric ratio against the baseline. Latencies regress when they grow
+    by more than tolerance, throughput when it drops by more than tolerance.
+    """
+    report, regressions = {}, []
+    for section, benches in current.items():
+        for name, metrics in benches.items():
+            base = baseline.get(section, {}).get(name)
+            if not base:
+                continue
+            for field, value in metrics.items():
+                old = base.get(field)
+                if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                    continue
+                if field in LATENCY_FIELDS:
+                    regressed = value > old * (1 + tolerance)
+                elif field == "throughput_ops":
+                    regressed = value < old * (1 - tolerance)
+                else:
+                    continue
+                key = f"{section}.{name}.{field}"
+                report[key] = {"baseline": old, "current": value, "ratio": round(value / old, 3)}
+                if regressed:
+                    regressions.append(key)
+    return report, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', choices=['micro', 'e2e'], help='run one part of the suite')
+    parser.add_argument('--messages', type=int, default=2000, help='messages per micro-benchmark')
+    parser.add_argument('--sessions', type=int, default=50, help='end-to-end conversations')
+    parser.add_argument('--turns', type=int, default=8, help='messages per conversation')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent end-to-end clients')
+    parser.add_argument('--url', help='drive a running server instead of the test client')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='compare against this results file')
+    parser.add_argument('--save-baseline', help='write the results to this file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, e.g. 0.25 = 25%%')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.ERROR)
+
+    results = {}
+    if args.only in (None, 'micro'):
+        results["micro"] = bench_micro(args)
+    if args.only in (None, 'e2e'):
+        results["e2e"] = bench_e2e(args)
+
+    output = {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        output["comparison"], regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        output["regressions"] = regressions
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as handle:
+            json.dump({"environment": output["environment"], "results": results}, handle, indent=2)
+            handle.write('\n')
+
+    print(json.dumps(output, indent=2))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Synthetic scam traffic for the benchmarks.
+
+Messages are assembled from templates and carry the indicators the detector
+extracts (UPI IDs, phone numbers, bank accounts with IFSC codes, phishing
+links), plus plain chatter and occasional long pasted messages. Everything is
+driven by a seeded Random, so two runs with the same seed see the same text.
+"""
+import random
+import string
+
+OPENERS = [
+    "Dear customer, your {bank} account will be blocked today due to pending KYC.",
+    "This is {bank} customer care. Unauthorized transaction detected on your card.",
+    "Congratulations! You are the lottery winner of Rs {amount}. Claim your prize now.",
+    "Your electricity connection will be suspended tonight. Pay pending bill immediately.",
+    "Customs has held a parcel in your name. Legal action will follow if not cleared.",
+    "Income tax refund of Rs {amount} is approved. Verify your PAN card to receive it.",
+]
+
+ASKS = [
+    "Send the verification fee of Rs {amount} to {upi} urgently.",
+    "Call our officer on {phone} now to avoid arrest.",
+    "Click {link} and update your details immediately.",
+    "Transfer Rs {amount} to account {account} IFSC {ifsc} to unfreeze your wallet.",
+    "Share the OTP you received to confirm the refund.",
+    "Pay via {upi} or call {phone}, offer valid for limited time only.",
+]
+
+CHATTER = [
+    "Why are you delaying?",
+    "Hello? Are you there?",
+    "Sir please cooperate, this is for your safety.",
+    "Do it fast, time is running out.",
+    "I am waiting, tell me once done.",
+]
+
+BANKS = ["SBI", "HDFC", "ICICI", "Axis", "PNB", "Kotak"]
+UPI_HANDLES = ["ybl", "okaxis", "paytm", "oksbi", "ibl", "upi"]
+DOMAINS = ["kyc-update-secure.co", "sbi-verify.in", "refund-portal.net", "rbi-alerts.org"]
+
+
+class ScamMessageGenerator:
+    """Produces scammer messages and whole conversations from a seed."""
+
+    def __init__(self, seed=0, long_ratio=0.05, chatter_ratio=0.2):
+        self.random = random.Random(seed)
+        self.long_ratio = long_ratio
+        self.chatter_ratio = chatter_ratio
+
+    def upi_id(self):
+        name = ''.join(self.random.choices(string.ascii_lowercase, k=self.random.randint(4, 10)))
+        return f"{name}.{self.random.randint(1, 99)}@{self.random.choice(UPI_HANDLES)}"
+
+    def phone(self):
+        number = str(self.random.randint(6, 9)) + ''.join(self.random.choices(string.digits, k=9))
+        return ("+91 " + number) if self.random.random() < 0.3 else number
+
+    def account(self):
+        return ''.join(self.random.choices(string.digits, k=self.random.randint(11, 16)))
+
+    def ifsc(self):
+        return ''.join(self.random.choices(string.ascii_uppercase, k=4)) + '0' + \
+            ''.join(self.random.choices(string.ascii_uppercase + string.digits, k=6))
+
+    def link(self):
+        path = ''.join(self.random.choices(string.ascii_lowercase, k=6))
+        return f"http://{self.random.choice(DOMAINS)}/{path}"
+
+    def message(self):
+        """One scammer message; a mix of openers, asks, chatter and long pastes."""
+        roll = self.random.random()
+        if roll < self.chatter_ratio:
+            return self.random.choice(CHATTER)
+        text = self._fill(self.random.choice(OPENERS)) + " " + self._fill(self.random.choice(ASKS))
+        if roll > 1 - self.long_ratio:
+            # Long forwarded messages: several asks plus a pasted "terms" block
+            extra = " ".join(self._fill(self.random.choice(ASKS)) for _ in range(self.random.randint(5, 15)))
+            text = f"{text} {extra} " + "Terms and conditions apply. " * self.random.randint(20, 80)
+        return text
+
+    def messages(self, count):
+        return [self.message() for _ in range(count)]
+
+    def conversation(self, turns):
+        """A multi-turn conversation: an opener first, then follow-ups."""
+        first = self._fill(self.random.choice(OPENERS))
+        return [first] + self.messages(turns - 1)
+
+    def _fill(self, template):
+        return template.format(
+            bank=self.random.choice(BANKS),
+            amount=self.random.choice([499, 1999, 5000, 25000, 100000]),
+            upi=self.upi_id(),
+            phone=self.phone(),
+            link=self.link(),
+            account=self.account(),
+            ifsc=self.ifsc(),
+        )
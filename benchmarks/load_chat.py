@@ -0,0 +1,164 @@
+"""
+/chat load test against real gunicorn workers, one run per database configuration.
+
+Each configuration starts `gunicorn 'app:create_app(serving=True)'` on a
+fresh database with its own environment, then drives concurrent multi-turn
+conversations and reports throughput, p50/p99 latency and error counts
+(e.g. "database is locked").
+
+Usage:
+    python benchmarks/load_chat.py
+    python benchmarks/load_chat.py --workers 4 --clients 32 --sessions 200
+    python benchmarks/load_chat.py --config pg:DATABASE_URL=postgresql://user:pw@localhost/honeypot
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Measure the pipeline, not admission control (benchmarks/bench_admission.py covers that)
+for _name in ('RATE_LIMIT_KEY_RATE', 'RATE_LIMIT_SESSION_RATE', 'MAX_IN_FLIGHT'):
+    os.environ.setdefault(_name, '0')
+
+# name -> extra environment; {db} is replaced with a fresh SQLite path
+DEFAULT_CONFIGS = {
+    # What the app ran with before: rollback journal, full sync, driver's 5 s timeout
+    "sqlite-legacy": {"DATABASE_URL": "sqlite:///{db}", "SQLITE_JOURNAL_MODE": "DELETE",
+                      "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_MMAP_SIZE": "0"},
+    "sqlite-wal": {"DATABASE_URL": "sqlite:///{db}"},
+}
+
+MESSAGES = [
+    "Dear customer, your account will be blocked today. Update KYC immediately.",
+    "Send the verification fee to refund.desk@ybl or call 9876543210",
+    "Click http://kyc-update-secure.co/verify to avoid legal action",
+    "Transfer to account 123456789012 IFSC SBIN0001234 now",
+    "Why are you delaying? Police will arrest you",
+    "Share the OTP you received",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def api_key():
+    """Reads the configured key without touching the default database."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='honeypot-key-'), 'scratch.db')
+    import app as honeypot
+    return next(iter(honeypot.API_KEYS))
+
+
+def run_config(name, overrides, args):
+    workdir = tempfile.mkdtemp(prefix=f"honeypot-{name}-")
+    env = dict(os.environ)
+    env.update({key: value.format(db=os.path.join(workdir, 'bench.db')) for key, value in overrides.items()})
+    # Keep callbacks local so the measurement is the request path only
+    env.setdefault('CALLBACK_URL', 'http://127.0.0.1:9/unused')
+
+    port = free_port()
+    # Create the schema once up front so workers do not race on it
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        ['gunicorn', '-w', str(args.workers), '--threads', str(args.threads), '-b', f'127.0.0.1:{port}',
+         'app:create_app(serving=True)'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(base + '/health', timeout=1)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{name}: server did not start")
+                time.sleep(0.2)
+
+        headers = {'x-api-key': api_key()}
+        local = threading.local()
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def converse(_):
+            http = getattr(local, 'http', None)
+            if http is None:
+                http = local.http = requests.Session()
+            session_id = f"load-{uuid.uuid4()}"
+            for turn in range(args.turns):
+                body = {'sessionId': session_id, 'message': {'text': MESSAGES[turn % len(MESSAGES)]}}
+                started = time.perf_counter()
+                try:
+                    response = http.post(base + '/chat', json=body, headers=headers, timeout=30)
+                    failed = response.status_code != 200
+                except requests.RequestException:
+                    failed = True
+                elapsed = time.perf_counter() - started
+                with lock:
+                    (errors if failed else latencies).append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            list(pool.map(converse, range(args.sessions)))
+        wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    latencies.sort()
+    total = len(latencies) + len(errors)
+    return {
+        "config": name,
+        "requests": total,
+        "errors": len(errors),
+        "throughput_rps": round(total / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--turns', type=int, default=6)
+    parser.add_argument('--config', action='append', default=[],
+                        help='extra configuration as name:KEY=VALUE,KEY=VALUE')
+    args = parser.parse_args()
+
+    configs = dict(DEFAULT_CONFIGS)
+    for spec in args.config:
+        name, _, assignments = spec.partition(':')
+        configs[name] = dict(pair.split('=', 1) for pair in assignments.split(',') if pair)
+
+    results = [run_config(name, overrides, args) for name, overrides in configs.items()]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
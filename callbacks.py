@@ -0,0 +1,405 @@
+import os
+import json
+import hashlib
+import time
+import heapq
+import queue
+import atexit
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from models import db, CallbackOutbox, CallbackState
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Dispatcher tuning (all overridable from the environment)
+CALLBACK_WORKERS = int(os.environ.get('CALLBACK_WORKERS', 2))
+CALLBACK_QUEUE_SIZE = int(os.environ.get('CALLBACK_QUEUE_SIZE', 1000))
+CALLBACK_TIMEOUT = float(os.environ.get('CALLBACK_TIMEOUT', 5))
+CALLBACK_MAX_ATTEMPTS = int(os.environ.get('CALLBACK_MAX_ATTEMPTS', 5))
+CALLBACK_BACKOFF_BASE = float(os.environ.get('CALLBACK_BACKOFF_BASE', 1))
+CALLBACK_BACKOFF_MAX = float(os.environ.get('CALLBACK_BACKOFF_MAX', 60))
+CALLBACK_SWEEP_INTERVAL = float(os.environ.get('CALLBACK_SWEEP_INTERVAL', 30))
+# A 'sending' row untouched this long belongs to a dead worker and is retried
+CALLBACK_STALE_AFTER = float(os.environ.get('CALLBACK_STALE_AFTER', 300))
+# Reports for one session within this many seconds are merged into one send
+CALLBACK_DEBOUNCE = float(os.environ.get('CALLBACK_DEBOUNCE', 2))
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def report_fingerprint(payload):
+    """Digest of the parts of a report that make it worth re-sending."""
+    material = json.dumps([payload.get("scamDetected"), payload.get("extractedIntelligence")], sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CallbackDispatcher:
+    """
+    Delivers evaluation-endpoint reports off the request path.
+
+    Requests only write a CallbackOutbox row (inside their own transaction)
+    and hand its id to a bounded in-memory queue. A small worker pool posts
+    the stored payload over one pooled keep-alive requests.Session and
+    retries transient failures with exponential backoff. The outbox row is
+    the source of truth: anything not yet sent when the process dies, or
+    that did not fit in the queue, is picked up again by the periodic sweep.
+    Rows are claimed with a conditional UPDATE, so several gunicorn workers
+    sweeping the same table never post a report twice.
+    """
+
+    def __init__(self, workers=CALLBACK_WORKERS, queue_size=CALLBACK_QUEUE_SIZE,
+                 timeout=CALLBACK_TIMEOUT, max_attempts=CALLBACK_MAX_ATTEMPTS,
+                 backoff_base=CALLBACK_BACKOFF_BASE, backoff_max=CALLBACK_BACKOFF_MAX,
+                 sweep_interval=CALLBACK_SWEEP_INTERVAL, stale_after=CALLBACK_STALE_AFTER,
+                 debounce=CALLBACK_DEBOUNCE):
+        self.app = None
+        self.url = None
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sweep_interval = sweep_interval
+        self.stale_after = stale_after
+        self.debounce = debounce
+
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._reset_runtime()
+
+    def init_app(self, app, url):
+        self.app = app
+        self.url = url
+        app.extensions['callback_dispatcher'] = self
+        # Threads do not survive a fork, so start them lazily in each worker
+        app.before_request(self.start)
+        atexit.register(self.shutdown)
+
+    # ------------------------------------------------------------------
+    # Request-side API
+    # ------------------------------------------------------------------
+
+    def stage(self, payload, final=False):
+        """
+        Queues a report in the current DB transaction; submit() the result after commit.
+
+        Reports whose intelligence matches what was last staged for the session
+        are dropped, unless this is the first final report. A report that finds
+        an unsent row for its session replaces that row's payload instead of
+        adding another send. New rows wait out the debounce window, so a burst
+        of turns collapses into one POST carrying the latest state.
+        Returns the new outbox row, or None if nothing new needs sending.
+        """
+        session_id = payload["sessionId"]
+        fingerprint = report_fingerprint(payload)
+
+        state = db.session.get(CallbackState, session_id)
+        if state is None:
+            state = CallbackState(session_id=session_id, fingerprint="", final_reported=False)
+            db.session.add(state)
+        elif state.fingerprint == fingerprint and (state.final_reported or not final):
+            self._count("skipped_unchanged")
+            return None
+
+        now = datetime.utcnow()
+        state.fingerprint = fingerprint
+        state.final_reported = state.final_reported or final
+        state.updated_at = now
+        body = json.dumps(payload)
+
+        # Only rows nobody has claimed yet can absorb the update
+        merged = db.session.execute(
+            update(CallbackOutbox)
+            .where(CallbackOutbox.session_id == session_id, CallbackOutbox.status == "pending")
+            .values(payload=body, updated_at=now)
+        )
+        if merged.rowcount:
+            self._count("coalesced")
+            return None
+
+        row = CallbackOutbox(
+            session_id=session_id,
+            payload=body,
+            status="pending",
+            attempts=0,
+            next_attempt_at=now + timedelta(seconds=self.debounce),
+            updated_at=now
+        )
+        db.session.add(row)
+        return row
+
+    def submit(self, rows):
+        """Schedules committed outbox rows for delivery. Never blocks."""
+        self.start()
+        for row in rows:
+            if row is None:
+                continue
+            # identity survives expire-on-commit, so this costs no SELECT
+            outbox_id = db.inspect(row).identity[0]
+            if self.debounce > 0:
+                self._retry_later(outbox_id, self.debounce)
+            else:
+                self._enqueue(outbox_id)
+
+    def stats(self):
+        """Snapshot of dispatcher metrics for this process."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        with self._cond:
+            retry_scheduled = len(self._retry_heap)
+
+        return dict(
+            counters,
+            queue_depth=self._queue.qsize(),
+            in_flight=in_flight,
+            retry_scheduled=retry_scheduled,
+            latency_ms={"p50": percentile(0.50), "p99": percentile(0.99),
+                        "max": percentile(1.0), "samples": len(latencies)}
+        )
+
+    def metric_counters(self):
+        """Event counters as (name, labels, value), for the /metrics collector."""
+        with self._stats_lock:
+            counters = dict(self._counters)
+        return [("honeypot_callbacks_total", {"outcome": name}, value) for name, value in counters.items()]
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the worker pool in the current process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Anything inherited from a parent process is stale after fork
+            self._reset_runtime()
+
+            self._threads = [threading.Thread(target=self._schedule, name="callback-scheduler", daemon=True)]
+            self._threads += [
+                threading.Thread(target=self._work, name=f"callback-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def shutdown(self, timeout=5):
+        """Stops the threads; undelivered rows stay pending in the outbox."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for _ in range(self.workers):
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        if self._http is not None:
+            self._http.close()
+        self._pid = None
+
+    def _reset_runtime(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._retry_heap = []  # (due monotonic time, outbox id)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._http = None
+        self._http_errors = ()
+        self._stats_lock = threading.Lock()
+        self._counters = {"sent": 0, "failed_attempts": 0, "gave_up": 0, "overflow": 0,
+                          "coalesced": 0, "skipped_unchanged": 0}
+        self._latencies = deque(maxlen=1024)
+        self._in_flight = 0
+
+    # ------------------------------------------------------------------
+    # Background threads
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, outbox_id):
+        try:
+            self._queue.put_nowait(outbox_id)
+        except queue.Full:
+            # The row is still pending in the outbox; the next sweep retries it
+            self._count("overflow")
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _schedule(self):
+        """Moves due retries onto the queue and periodically sweeps the outbox."""
+        next_sweep = 0.0
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                due = []
+                while self._retry_heap and self._retry_heap[0][0] <= now:
+                    due.append(heapq.heappop(self._retry_heap)[1])
+                if not due and now < next_sweep:
+                    wake = min(next_sweep, self._retry_heap[0][0]) if self._retry_heap else next_sweep
+                    self._cond.wait(wake - now)
+                    continue
+
+            for outbox_id in due:
+                self._enqueue(outbox_id)
+
+            if time.monotonic() >= next_sweep:
+                try:
+                    self._sweep()
+                except Exception as e:
+                    logger.error("Callback outbox sweep failed: %s", e)
+                next_sweep = time.monotonic() + self.sweep_interval
+
+    def _sweep(self):
+        """Re-queues pending rows that are due (restarts, overflow, other workers' leftovers)."""
+        with self.app.app_context():
+            now = datetime.utcnow()
+            db.session.execute(
+                update(CallbackOutbox)
+                .where(CallbackOutbox.status == "sending",
+                       CallbackOutbox.updated_at < now - timedelta(seconds=self.stale_after))
+                .values(status="pending", updated_at=now)
+            )
+            db.session.commit()
+
+            room = self.queue_size - self._queue.qsize()
+            if room <= 0:
+                return
+            due_ids = db.session.scalars(
+                select(CallbackOutbox.id)
+                .where(CallbackOutbox.status == "pending", CallbackOutbox.next_attempt_at <= now)
+                .order_by(CallbackOutbox.next_attempt_at)
+                .limit(room)
+            ).all()
+
+        for outbox_id in due_ids:
+            self._enqueue(outbox_id)
+
+    def _work(self):
+        while True:
+            outbox_id = self._queue.get()
+            if outbox_id is None:
+                return
+            with self._stats_lock:
+                self._in_flight += 1
+            try:
+                with self.app.app_context():
+                    self._deliver(outbox_id)
+            except Exception as e:
+                logger.error("Callback delivery crashed for outbox row %s: %s", outbox_id, e, exc_info=True)
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+
+    def _http_session(self):
+        # requests (tens of ms to import) is loaded by the first delivery,
+        # not at startup: most processes never send a report
+        if self._http is None:
+            with self._start_lock:
+                if self._http is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                    http = requests.Session()
+                    http.mount('https://', adapter)
+                    http.mount('http://', adapter)
+                    self._http_errors = requests.exceptions.RequestException
+                    self._http = http
+        return self._http
+
+    def _deliver(self, outbox_id):
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(CallbackOutbox)
+            .where(CallbackOutbox.id == outbox_id, CallbackOutbox.status == "pending",
+                   CallbackOutbox.next_attempt_at <= now)
+            .values(status="sending", updated_at=now)
+        )
+        db.session.commit()
+        if claimed.rowcount != 1:
+            return  # already sent, taken by another worker, or not due yet
+
+        row = db.session.get(CallbackOutbox, outbox_id)
+
+        error = None
+        retryable = True
+        started = time.perf_counter()
+        try:
+            response = self._http_session().post(self.url, data=row.payload, headers=JSON_HEADERS, timeout=self.timeout)
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                retryable = response.status_code >= 500 or response.status_code == 429
+        except self._http_errors as e:
+            error = str(e) or e.__class__.__name__
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._latencies.append(elapsed)
+        metrics.observe("honeypot_callback_post_seconds", elapsed)
+
+        row.attempts += 1
+        row.updated_at = datetime.utcnow()
+        row.last_error = error or ""
+        retry_delay = None
+
+        if error is None:
+            row.status = "sent"
+            self._count("sent")
+            logger.info("Callback sent for session %s in %.0f ms", row.session_id, elapsed * 1000,
+                        extra={"session_id": row.session_id})
+        elif retryable and row.attempts < self.max_attempts:
+            retry_delay = self._backoff(row.attempts)
+            row.status = "pending"
+            row.next_attempt_at = row.updated_at + timedelta(seconds=retry_delay)
+            self._count("failed_attempts")
+            logger.warning("Callback for session %s failed (attempt %d), retrying in %.1fs: %s",
+                           row.session_id, row.attempts, retry_delay, error, extra={"session_id": row.session_id})
+        else:
+            row.status = "failed"
+            self._count("failed_attempts")
+            self._count("gave_up")
+            logger.error("Callback for session %s failed permanently after %d attempts: %s",
+                         row.session_id, row.attempts, error, extra={"session_id": row.session_id})
+
+        db.session.commit()
+
+        if retry_delay is not None:
+            self._retry_later(outbox_id, retry_delay)
+
+    def _retry_later(self, outbox_id, delay):
+        with self._cond:
+            heapq.heappush(self._retry_heap, (time.monotonic() + delay, outbox_id))
+            self._cond.notify()
+
+    def _backoff(self, attempts):
+        """Exponential backoff with jitter: base * 2^(n-1), capped, scaled by 0.5-1.0."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+
+dispatcher = CallbackDispatcher()
@@ -1,155 +1,240 @@
-import re
+import sys
+
+try:
+    import ahocorasick
+except ImportError:
+    # Without the wheel, keywords fall back to one substring scan per phrase
+    ahocorasick = None
+
+from extraction import IndicatorExtractor, MAX_TEXT_LENGTH
+from stages import DEFAULT_STAGES, build_stages, run_stages
+from analysis_cache import LRUCache, MASK, text_key, template, freeze, thaw, entry_size
+
+
+# Expanded suspicious keywords library
+DEFAULT_KEYWORDS = frozenset({
+    "urgent", "immediately", "blocked", "suspended", "kyc",
+    "verify", "pan card", "aadhaar", "aadhar", "lottery", "prize",
+    "winner", "expire", "expired", "unauthorized", "irs", "police",
+    "bank", "rbi", "customer care", "refund", "cashback",
+    "wallet", "otp", "pin", "cvv", "atm", "card",
+    "account", "payment", "transfer", "freeze", "frozen",
+    "legal action", "arrest", "warrant", "customs", "tax",
+    "confirm", "update", "link", "click", "reset password",
+    "secure", "verify now", "act now", "limited time"
+})
+
+
+def _build_automaton(vocabulary):
+    """Aho-Corasick automaton over the phrases (None without pyahocorasick or phrases)."""
+    if ahocorasick is None or not vocabulary:
+        return None
+    automaton = ahocorasick.Automaton()
+    for word in vocabulary:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
 
 
 class ScamDetector:
+    """
+    Stateless scorer: everything built here is read-only afterwards (the
+    caches lock internally), so one instance can be shared by all request
+    threads.
+
+    Scoring is split into stages (see stages.py), configured by `stages`
+    (default DEFAULT_STAGES): each contributes a weighted score, flags and
+    extracted fields, and analyze_text merges them and applies the
+    combination rules and the threshold.
+
+    With cache_size, results are memoized by message text, so a message
+    blasted to many sessions is scored once; persisting a result is still
+    up to the caller every time. With template_cache_size, the keyword
+    sweep is also shared by messages that only differ in their links,
+    handles and numbers (see _template_hits).
+    """
+
+    def __init__(self, keywords=None, max_text_length=MAX_TEXT_LENGTH, stages=None, cache_size=0,
+                 template_cache_size=0):
+        if keywords is None:
+            self.keywords = DEFAULT_KEYWORDS
+        else:
+            self.keywords = frozenset(word.strip().lower() for word in keywords if word.strip())
 
-    def __init__(self):
-        # Expanded suspicious keywords library
-        self.keywords = {
-            "urgent", "immediately", "blocked", "suspended", "kyc",
-            "verify", "pan card", "aadhaar", "aadhar", "lottery", "prize",
-            "winner", "expire", "expired", "unauthorized", "irs", "police",
-            "bank", "rbi", "customer care", "refund", "cashback",
-            "wallet", "otp", "pin", "cvv", "atm", "card",
-            "account", "payment", "transfer", "freeze", "frozen",
-            "legal action", "arrest", "warrant", "customs", "tax",
-            "confirm", "update", "link", "click", "reset password",
-            "secure", "verify now", "act now", "limited time"
-        }
+        # Longer messages are only scored on their first max_text_length characters
+        self.max_text_length = max_text_length
+        # UPI IDs, phone numbers, accounts, links and IFSC codes in one scan (see extraction.py)
+        self.extractor = IndicatorExtractor(max_text_length)
 
-        # Improved Regex Patterns
-        # UPI: handle@bank format (more strict)
-        self.upi_pattern = r'\b[a-zA-Z0-9.\-_]{3,}@[a-zA-Z]{3,}\b'
+        # High-risk keyword combinations
+        self.urgency_words = frozenset({"urgent", "immediately", "now", "quickly", "hurry"})
+        self.threat_words = frozenset({"blocked", "suspended", "frozen", "arrest", "legal action"})
+        self.verify_words = frozenset({"verify", "confirm", "update", "click", "link"})
 
-        # Indian Phone: +91 or start with 6-9, 10 digits
-        self.phone_pattern = r'(?:\+91[\s\-]?)?[6-9]\d{9}\b'
+        # Every phrase we look for, de-duplicated so each one is scanned once
+        self._vocabulary = tuple(sorted(
+            self.keywords | self.urgency_words | self.threat_words | self.verify_words
+        ))
+        self._longest_phrase = max(map(len, self._vocabulary), default=1)
+        self._automaton = _build_automaton(self._vocabulary)
 
-        # Bank Account: 9-18 digits (more strict boundaries)
-        self.bank_pattern = r'\b\d{9,18}\b'
+        self.cache = LRUCache(cache_size) if cache_size > 0 else None
+        self.template_cache = LRUCache(template_cache_size) if template_cache_size > 0 else None
 
-        # Links: HTTP/HTTPS with better capture
-        self.link_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-        
-        # Additional patterns for better detection
-        self.ifsc_pattern = r'\b[A-Z]{4}0[A-Z0-9]{6}\b'  # IFSC codes
+        self.stages = build_stages(DEFAULT_STAGES if stages is None else stages, self)
+        self._concurrent = any(stage.concurrent for stage in self.stages)
 
     def analyze_message(self, text, session, intelligence_record):
         """
         Analyzes text, updates the intelligence record, and calculates risk.
         Returns a summary dict.
         """
+        result = self.analyze_text(text)
+        self.save_result(intelligence_record, result)
+        return result
+
+    def analyze_batch(self, texts, intelligence_records=None):
+        """
+        Analyzes many messages in one call, returning results in input order.
+        If intelligence_records is given (one per text, repeats allowed) each
+        result is persisted to its record in order, exactly as a sequence of
+        analyze_message calls would.
+        """
+        results = [self.analyze_text(text) for text in texts]
+        if intelligence_records is not None:
+            for record, result in zip(intelligence_records, results):
+                self.save_result(record, result)
+        return results
+
+    def save_result(self, intelligence_record, result):
+        """Persists a result from analyze_text/analyze_batch into the record."""
+        if result["extracted_data"]:
+            self._save_intelligence(intelligence_record, result["extracted_data"])
+
+    def analyze_text(self, text):
+        """Scores a single message without touching the database."""
         if not text:
             return {"is_scam": False, "risk_score": 0, "flags": [], "extracted_data": {}}
 
-        text_lower = text.lower()
+        text = text[:self.max_text_length]
+        cache = self.cache
+        if cache is None:
+            return self._score(text)
+
+        key = text_key(text)
+        entry = cache.get(key)
+        if entry is not None:
+            return thaw(entry)
+        result = self._score(text)
+        if "degraded_stages" not in result:
+            entry = freeze(result)
+            cache.put(key, entry, entry_size(entry))
+        return result
+
+    def cache_stats(self):
+        return {"results": self.cache.stats() if self.cache else None,
+                "templates": self.template_cache.stats() if self.template_cache else None}
+
+    def cache_counters(self):
+        """Cache events as (name, labels, value), for the /metrics collector."""
+        counters = []
+        for name, stats in self.cache_stats().items():
+            if stats:
+                counters.extend(("honeypot_analysis_cache_total", {"cache": name, "event": event}, stats[event])
+                                for event in ("hits", "misses", "evictions"))
+        return counters
+
+    def _score(self, text):
+        outputs, degraded = run_stages(self.stages, text, text.lower(), self._concurrent)
+
+        # Merge the stage outputs, in stage order
         risk_score = 0
         flags = []
-
-        # Extraction Phase
-        extracted = {
-            "suspiciousKeywords": set(),
-            "upiIds": set(re.findall(self.upi_pattern, text)),
-            "phoneNumbers": set(re.findall(self.phone_pattern, text)),
-            "bankAccounts": set(re.findall(self.bank_pattern, text)),
-            "phishingLinks": set(re.findall(self.link_pattern, text)),
-            "ifscCodes": set(re.findall(self.ifsc_pattern, text.upper()))
-        }
-
-        # Keyword Analysis - Multi-word phrases
-        keyword_matches = []
-        for word in self.keywords:
-            if word in text_lower:
-                extracted["suspiciousKeywords"].add(word)
-                keyword_matches.append(word)
-                risk_score += 10
-
-        # High-risk keyword combinations
-        urgency_words = {"urgent", "immediately", "now", "quickly", "hurry"}
-        threat_words = {"blocked", "suspended", "frozen", "arrest", "legal action"}
-        verify_words = {"verify", "confirm", "update", "click", "link"}
-        
-        has_urgency = any(w in text_lower for w in urgency_words)
-        has_threat = any(w in text_lower for w in threat_words)
-        has_verify = any(w in text_lower for w in verify_words)
-        
-        # Combination scoring
-        if has_urgency and has_threat:
-            risk_score += 20
-            flags.append("urgency_with_threat")
-        
-        if has_verify and has_threat:
-            risk_score += 15
-            flags.append("verify_with_threat")
-
-        # Payment Request Detection
-        if extracted["upiIds"] or extracted["bankAccounts"] or extracted["ifscCodes"]:
-            risk_score += 30
-            flags.append("payment_request")
-
-        # Phishing Link Detection
-        if extracted["phishingLinks"]:
-            risk_score += 40
-            flags.append("phishing_link")
-            
-            # Extra points if link + urgency
-            if has_urgency:
-                risk_score += 10
-
-        # Contact Sharing
-        if extracted["phoneNumbers"]:
+        extracted = {}
+        signals = {}
+        for stage, output in outputs:
+            score = output.get("score", 0)
+            risk_score += score if stage.weight == 1 else score * stage.weight
+            flags.extend(output.get("flags", ()))
+            extracted.update(output.get("extracted", ()))
+            signals.update(output.get("signals", ()))
+
+        # Combination rules over what the stages found
+        has_urgency = signals.get("has_urgency", False)
+        has_threat = signals.get("has_threat", False)
+        upi_ids = extracted.get("upiIds")
+        accounts = extracted.get("bankAccounts")
+        links = extracted.get("phishingLinks")
+
+        # Extra points if link + urgency
+        if links and has_urgency:
             risk_score += 10
-            flags.append("contact_sharing")
 
         # Heuristic: Multiple indicators = high confidence scam
         indicator_count = sum([
-            bool(extracted["upiIds"]),
-            bool(extracted["bankAccounts"]),
-            bool(extracted["phishingLinks"]),
-            bool(keyword_matches),
+            bool(upi_ids),
+            bool(accounts),
+            bool(links),
+            bool(extracted.get("suspiciousKeywords")),
             has_urgency,
             has_threat
         ])
-        
+
         if indicator_count >= 3:
             risk_score += 20
             flags.append("multiple_indicators")
 
-        # Threshold for scam detection
-         # In detector.py, inside analyze_message
-        # Change the threshold or add a 'Force True' for intelligence gathered
-        # Ensure this block is aligned with the 'if indicator_count' block above it
+        # Threshold for scam detection: any payment or link indicator alone is enough
         is_scam = (
-            risk_score >= 30 or 
+            risk_score >= 30 or
             indicator_count >= 2 or  # Trigger if multiple types of flags are raised
-            bool(extracted["upiIds"]) or 
-            bool(extracted["bankAccounts"]) or 
-            bool(extracted["phishingLinks"])
-        ) #
-
-        # Persistence Phase
-        self._save_intelligence(intelligence_record, extracted)
+            bool(upi_ids) or
+            bool(accounts) or
+            bool(links)
+        )
 
-        return {
+        result = {
             "is_scam": is_scam,
             "risk_score": risk_score,
             "flags": flags,
             "extracted_data": extracted
-        } #
+        }
+        if degraded:
+            # Scored without these stages (over budget, busy or failed)
+            result["degraded_stages"] = degraded
+        return result
 
-    def _save_intelligence(self, record, extracted_data):
-        """Helper to append unique items to the DB record without duplication."""
-        record.upi_ids = self._merge(record.upi_ids, extracted_data["upiIds"])
-        record.bank_accounts = self._merge(record.bank_accounts, extracted_data["bankAccounts"])
-        record.phone_numbers = self._merge(record.phone_numbers, extracted_data["phoneNumbers"])
-        record.phishing_links = self._merge(record.phishing_links, extracted_data["phishingLinks"])
-        record.suspicious_keywords = self._merge(record.suspicious_keywords, extracted_data["suspiciousKeywords"])
-
-    def _merge(self, current_str, new_set):
-        """Merges a CSV string with a new set of items, returning unique CSV."""
-        if not current_str:
-            current_items = set()
-        else:
-            current_items = set(x.strip() for x in current_str.split(',') if x.strip())
+    def _match_keywords(self, text_lower):
+        """
+        Returns every vocabulary phrase that occurs in the (lowercased) text,
+        overlapping ones included: plain substring containment, found in a
+        single pass of the Aho-Corasick automaton built in __init__.
+        """
+        automaton = self._automaton
+        if automaton is None:
+            return {word for word in self._vocabulary if word in text_lower}
+        return {word for _, word in automaton.iter(text_lower)}
 
-        merged = current_items.union(new_set)
-        return ",".join(sorted(merged))  # Sorted for consistency
+    def _template_hits(self, text_lower):
+        """
+        _match_keywords() with the sweep over the message's template (see
+        analysis_cache.template) cached. A phrase that avoids every masked
+        span also occurs in the template; one that overlaps a span lies
+        within it widened by the longest phrase, and those windows are swept
+        on every call, so the hits are exactly those of a plain sweep.
+        """
+        masked, spans = template(text_lower)
+        key = text_key(masked)
+        hits = self.template_cache.get(key)
+        if hits is None:
+            hits = frozenset(self._match_keywords(masked))
+            self.template_cache.put(key, hits, sys.getsizeof(hits))
+        if not spans:
+            return set(hits)
+        widen = self._longest_phrase - 1
+        windows = MASK.join(text_lower[max(0, start - widen):end + widen] for start, end in spans)
+        return self._match_keywords(windows).union(hits)
+
+    def _save_intelligence(self, record, extracted_data):
+        """Helper to record unique items against the session (insert-if-absent)."""
+        record.add_indicators(extracted_data)
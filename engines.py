@@ -0,0 +1,122 @@
+import os
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from detector import ScamDetector
+from extraction import MAX_TEXT_LENGTH
+from agent import HoneypotAgent, HIGH_RISK_SCORE
+from analysis_cache import ANALYSIS_CACHE_SIZE, ANALYSIS_TEMPLATE_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file overriding detector keywords / agent scripts and flow, e.g.
+# {"keywords": ["otp", "kyc"], "scripts": {"stall": ["One sec..."]}, "max_turns": 8,
+#  "max_text_length": 10000, "high_risk_score": 60, "agent_seed": 42,
+#  "analysis_cache_size": 10000, "analysis_template_cache_size": 0,
+#  "flow": [{"turns": [0, 1], "script": "opening", "state": "opening"}, ...],
+#  "stages": [{"name": "keywords", "weight": 1.5}, {"name": "indicators"},
+#             {"name": "url_reputation", "feed": "bad_domains.txt", "concurrent": true, "budget_ms": 20}]}
+# (flow replaces agent.DEFAULT_FLOW and stages replaces stages.DEFAULT_STAGES
+# as a whole; see there for the formats)
+ENGINE_CONFIG_PATH = os.environ.get('HONEYPOT_ENGINE_CONFIG')
+
+# How often (seconds) a worker checks the config file for changes
+ENGINE_RELOAD_INTERVAL = float(os.environ.get('HONEYPOT_ENGINE_RELOAD_INTERVAL', 5))
+
+Engines = namedtuple('Engines', ['detector', 'agent', 'version'])
+
+
+def build_engines(config=None, version=None):
+    """Builds a fresh, read-only detector/agent pair from a config dict."""
+    config = config or {}
+    return Engines(
+        detector=ScamDetector(keywords=config.get('keywords'),
+                              max_text_length=config.get('max_text_length', MAX_TEXT_LENGTH),
+                              stages=config.get('stages'),
+                              cache_size=config.get('analysis_cache_size', ANALYSIS_CACHE_SIZE),
+                              template_cache_size=config.get('analysis_template_cache_size',
+                                                             ANALYSIS_TEMPLATE_CACHE_SIZE)),
+        agent=HoneypotAgent(max_turns=config.get('max_turns', 8), scripts=config.get('scripts'),
+                            high_risk_score=config.get('high_risk_score', HIGH_RISK_SCORE),
+                            flow=config.get('flow'), seed=config.get('agent_seed')),
+        version=version
+    )
+
+
+def _load_config(path):
+    with open(path, 'r', encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def _config_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class EngineRegistry:
+    """
+    Holds the process-wide Engines tuple.
+
+    Requests read `current()` once and keep that reference, so a reload never
+    mixes an old detector with a new agent. Reloads build the replacement off
+    to the side and publish it with a single reference assignment.
+    Every gunicorn worker polls the config file's mtime, so editing the file
+    rolls out to all workers without restarting them.
+    """
+
+    def __init__(self, config_path=None, reload_interval=ENGINE_RELOAD_INTERVAL):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._engines = None
+        self.reload()
+
+    def current(self):
+        """Returns the active Engines, picking up config file edits if due."""
+        if self.config_path and time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        return self._engines
+
+    def reload(self, config=None):
+        """
+        Atomically swaps in new engines. With no explicit config the JSON
+        file (if any) is re-read; on a bad file the current engines are kept.
+        """
+        with self._lock:
+            version = _config_mtime(self.config_path) if self.config_path else None
+            try:
+                if config is None and version is not None:
+                    config = _load_config(self.config_path)
+                engines = build_engines(config, version=version)
+            except Exception as e:
+                if self._engines is None:
+                    raise
+                logger.error("Engine reload failed, keeping current config: %s", e)
+                return self._engines
+
+            self._engines = engines
+            self._next_check = time.monotonic() + self.reload_interval
+            logger.info("Engines loaded (config version: %s)", version)
+            return engines
+
+    def _maybe_reload(self):
+        # Only one thread polls; the others keep serving the current engines
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.reload_interval
+            changed = _config_mtime(self.config_path) != self._engines.version
+        finally:
+            self._lock.release()
+
+        if changed:
+            self.reload()
+
+
+registry = EngineRegistry(config_path=ENGINE_CONFIG_PATH)
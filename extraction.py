@@ -0,0 +1,119 @@
+import re
+
+# Longest message (in characters) scanned for indicators; the rest is ignored
+MAX_TEXT_LENGTH = 10000
+
+# The separate findall passes ScamDetector used to run. They define the
+# extractor's expected output (benchmarks/bench_extraction.py checks it);
+# LINK_PATTERN and IFSC_PATTERN are also used directly below.
+UPI_PATTERN = re.compile(r'\b[a-zA-Z0-9.\-_]{3,}@[a-zA-Z]{3,}\b')
+PHONE_PATTERN = re.compile(r'(?:\+91[\s\-]?)?[6-9]\d{9}\b')
+BANK_PATTERN = re.compile(r'\b\d{9,18}\b')
+LINK_PATTERN = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
+IFSC_PATTERN = re.compile(r'\b[A-Z]{4}0[A-Z0-9]{6}\b')
+
+# One pass finds every anchor an indicator can hang off: digit runs long
+# enough for an account or phone number, a '0' right after a letter (the
+# fifth character of an IFSC code), '@' and a link scheme. Each alternative
+# starts with a digit, '@' or 'h', so the scan skips other text quickly.
+_SCAN = re.compile(
+    r'(?P<digits>\d{9,})'
+    r'|(?P<zero>(?<=[a-zA-Z])0)'
+    r'|(?P<at>@)'
+    r'|(?P<link>https?://)'
+)
+_IFSC = re.compile(r'\b(?i:[a-z]{4}0[a-z0-9]{6})\b')
+_UPI_DOMAIN = re.compile(r'[a-zA-Z]{3,}\b')
+_UPI_LOCAL = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.-_')
+_PHONE_LEADS = frozenset('6789')
+
+
+def _is_word(char):
+    # Same test as \w in a str pattern
+    return char.isalnum() or char == '_'
+
+
+class IndicatorExtractor:
+    """
+    Extracts UPI IDs, phone numbers, bank accounts, links and IFSC codes in
+    a single regex scan, with the same results as running the five patterns
+    above separately.
+
+    The scan only locates anchors (digit runs, '@', link and IFSC starts);
+    which indicators an anchor yields is then decided from the characters
+    around it, so overlapping matches (a phone number that is also an
+    account, digits inside a UPI ID or link) are all still reported. Every
+    step is bounded by the text it looks at, so the cost is linear in the
+    (capped) message length.
+    """
+
+    def __init__(self, max_text_length=MAX_TEXT_LENGTH):
+        self.max_text_length = max_text_length
+
+    def extract(self, text):
+        """Returns {"upiIds", "phoneNumbers", "bankAccounts", "phishingLinks", "ifscCodes"} as sets."""
+        text = text[:self.max_text_length]
+        upi_ids, phones, accounts, links, ifsc_codes = set(), set(), set(), set(), set()
+        ascii_only = text.isascii()
+        length = len(text)
+        link_end = upi_end = 0
+
+        for match in _SCAN.finditer(text):
+            kind = match.lastgroup
+            start, end = match.span()
+            if kind == 'digits':
+                if ascii_only and text[start] == '0' and start >= 4:
+                    self._ifsc(text, start, ifsc_codes)
+                if end != length and _is_word(text[end]):
+                    continue
+                run = end - start
+                if run <= 18 and (start == 0 or not _is_word(text[start - 1])):
+                    accounts.add(text[start:end])
+                if run >= 10 and text[end - 10] in _PHONE_LEADS:
+                    core = end - 10
+                    if core >= 3 and text[core - 3:core] == '+91':
+                        core -= 3
+                    elif core == start and core >= 4 and text[core - 4:core - 1] == '+91' and \
+                            (text[core - 1].isspace() or text[core - 1] == '-'):
+                        core -= 4
+                    phones.add(text[core:end])
+            elif kind == 'zero':
+                if ascii_only and start >= 4:
+                    self._ifsc(text, start, ifsc_codes)
+            elif kind == 'at':
+                domain = _UPI_DOMAIN.match(text, end)
+                if domain is None:
+                    continue
+                local = start
+                while local > upi_end and text[local - 1] in _UPI_LOCAL:
+                    local -= 1
+                # Leftmost word boundary leaving at least three characters
+                for begin in range(local, start - 2):
+                    if (begin > 0 and _is_word(text[begin - 1])) != _is_word(text[begin]):
+                        upi_ids.add(text[begin:domain.end()])
+                        upi_end = domain.end()
+                        break
+            elif start >= link_end:
+                link = LINK_PATTERN.match(text, start)
+                if link is not None:
+                    links.add(link.group())
+                    link_end = link.end()
+
+        if not ascii_only:
+            # upper() can change length and letter class outside ASCII; keep the exact old behaviour
+            ifsc_codes = set(IFSC_PATTERN.findall(text.upper()))
+
+        return {
+            "upiIds": upi_ids,
+            "phoneNumbers": phones,
+            "bankAccounts": accounts,
+            "phishingLinks": links,
+            "ifscCodes": ifsc_codes,
+        }
+
+    @staticmethod
+    def _ifsc(text, zero, found):
+        # An IFSC code has its '0' four letters in
+        match = _IFSC.match(text, zero - 4)
+        if match is not None:
+            found.add(match.group().upper())
@@ -0,0 +1,18 @@
+"""
+Settings gunicorn reads when started from this directory (plain `gunicorn`:
+the app comes from wsgi_app below).
+
+With preload_app the master builds the app once: schema check, engine
+tables (detector keyword sets, compiled agent flow) and the warm-up turn
+all happen before the workers are forked, so a new worker answers its
+first request without importing or compiling anything and shares those
+pages with the master copy-on-write. Background threads, DB connections
+and shared-memory files are opened per worker after the fork.
+"""
+import os
+
+# GUNICORN_PRELOAD=0 imports the app in every worker instead (needed for --reload)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'no')
+
+# The factory, as a server: importing app builds nothing, and only serving runs the warm-up
+wsgi_app = 'app:create_app(serving=True)'
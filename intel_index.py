@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from models import db, IndicatorStat, INDICATOR_KINDS, indicator_value, link_domain
+from prescreen import indicator_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of indicator_stats for changes made by any worker
+INTEL_REFRESH_INTERVAL = float(os.environ.get('INTEL_REFRESH_INTERVAL', 1.0))
+# Re-read rows stamped this long before the newest one seen, to catch
+# transactions that committed after a later-stamped one
+INTEL_REFRESH_OVERLAP = float(os.environ.get('INTEL_REFRESH_OVERLAP', 10.0))
+
+# Kinds an unqualified lookup tries, in the order matches are reported
+LOOKUP_KINDS = tuple(INDICATOR_KINDS.values()) + ("link_domain",)
+
+
+class IntelIndex:
+    """
+    In-memory copy of the indicator_stats aggregate for threat-intel lookups.
+
+    A background thread loads the table once, then polls for rows whose
+    last_seen moved past the newest one it has, so every worker converges
+    on what all workers have written within about one refresh interval.
+    Entries are grouped by prescreen.indicator_key, so lookups are plain dict
+    reads in the same normalised form the prescreen filter uses. Until the
+    first load finishes they fall back to the database.
+    """
+
+    def __init__(self, refresh_interval=INTEL_REFRESH_INTERVAL, overlap=INTEL_REFRESH_OVERLAP):
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.app = None
+
+        self._entries = {}
+        self._watermark = None
+        self._loaded = False
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._counters = {"lookups": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['intel_index'] = self
+        app.before_request(self.start)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def lookup(self, value, kind=None):
+        """
+        Returns a list of {"kind", "value", "firstSeen", "lastSeen",
+        "hitCount", "sessionCount"} for the kinds this value is known under
+        (only kind, if given). Values are matched in prescreen.indicator_key
+        form (phone numbers on their last ten digits, accounts on their
+        digits, the rest lowercased), so one lookup can report several
+        stored spellings, each under its own "value".
+        """
+        self._counters["lookups"] += 1
+        kinds = (kind,) if kind else LOOKUP_KINDS
+        value = indicator_value(value)
+        matches = []
+        for candidate in kinds:
+            key = indicator_key(candidate, value)
+            if not key:
+                continue
+            for stored, (first_seen, last_seen, hits, sessions) in sorted(self._get(candidate, key, value).items()):
+                matches.append({
+                    "kind": candidate,
+                    "value": stored,
+                    "firstSeen": first_seen.isoformat(),
+                    "lastSeen": last_seen.isoformat(),
+                    "hitCount": hits,
+                    "sessionCount": sessions,
+                })
+        return matches
+
+    def lookup_extracted(self, extracted):
+        """Looks up every value in a detector's extracted_data, plus the hosts of its links."""
+        matches = []
+        for field, kind in INDICATOR_KINDS.items():
+            for value in extracted.get(field, ()):
+                matches.extend(self.lookup(value, kind))
+        for domain in sorted({link_domain(url) for url in extracted.get("phishingLinks", ())}):
+            matches.extend(self.lookup(domain, "link_domain"))
+        return matches
+
+    def other_sessions(self, kind, key, own_values):
+        """
+        Sessions other than the asking one known to have recorded a key
+        (indicator_key form) under kind, given the stored values the asking
+        session has for it: each of those counts once in its session_count.
+        """
+        entries = self._get(kind, key, key)
+        return sum(entry[3] for entry in entries.values()) - sum(1 for value in own_values if value in entries)
+
+    def stats(self):
+        return dict(self._counters, entries=len(self._entries), loaded=self._loaded,
+                    watermark=self._watermark.isoformat() if self._watermark else None)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the refresh thread in the current process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child refreshes on its own; start from what the parent had
+            threading.Thread(target=self._run, name="intel-refresh", daemon=True).start()
+            self._pid = os.getpid()
+
+    def refresh(self):
+        """Pulls rows changed since the last refresh (all rows the first time)."""
+        stmt = select(IndicatorStat.kind, IndicatorStat.value, IndicatorStat.first_seen,
+                      IndicatorStat.last_seen, IndicatorStat.hit_count, IndicatorStat.session_count)
+        if self._watermark is not None:
+            stmt = stmt.where(IndicatorStat.last_seen >= self._watermark - self.overlap)
+
+        entries = self._entries
+        watermark = self._watermark
+        for kind, value, first_seen, last_seen, hits, sessions in db.session.execute(
+            stmt.execution_options(yield_per=5000)
+        ):
+            entries.setdefault((kind, indicator_key(kind, value)), {})[value] = (first_seen, last_seen, hits, sessions)
+            if watermark is None or last_seen > watermark:
+                watermark = last_seen
+        db.session.rollback()
+
+        self._watermark = watermark
+        self._loaded = True
+        self._counters["refreshes"] += 1
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _get(self, kind, key, value):
+        """{stored value: (first_seen, last_seen, hit_count, session_count)} for a normalised key."""
+        if self._loaded:
+            return self._entries.get((kind, key), {})
+        # Before the first load: the value as given, its key, and for phones
+        # the other spellings the extractor records
+        spellings = {value, key}
+        if kind == "phone_number":
+            spellings.update(prefix + key for prefix in ("+91", "+91 ", "+91-"))
+        rows = db.session.scalars(
+            select(IndicatorStat).where(IndicatorStat.kind == kind, IndicatorStat.value.in_(spellings))
+        )
+        return {row.value: (row.first_seen, row.last_seen, row.hit_count, row.session_count) for row in rows}
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception as e:
+                self._counters["refresh_errors"] += 1
+                logger.error("Intel index refresh failed: %s", e, exc_info=True)
+            time.sleep(self.refresh_interval)
+
+
+intel_index = IntelIndex()
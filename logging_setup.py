@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging settings (all overridable from the environment)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# text keeps the classic "LEVEL:logger:message" lines; json emits one object per line
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# Hand records to a background thread instead of writing on the request thread
+LOG_QUEUE = os.environ.get('LOG_QUEUE', '1') not in ('0', 'false', 'no')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+# Fraction of per-message INFO records (those logged with extra=SAMPLED) kept
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+# Records carrying a rate_key are emitted at most once per this many seconds per key (0 disables)
+LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 60))
+
+# Pass as extra= on per-message INFO logs so LOG_SAMPLE_RATE applies to them
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_CONTROL_FIELDS = frozenset({"sampled", "rate_key"})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; extra= fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in _CONTROL_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random fraction of INFO-and-below records marked as sampled."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets one record per rate_key through every interval seconds. The next
+    record for a key after a quiet spell reports how many were suppressed.
+    Keys are kept in a bounded LRU so sprayed keys cannot grow memory.
+    """
+
+    def __init__(self, interval, max_keys=10000):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._keys.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._keys[key] = (last, suppressed + 1)
+                return False
+            self._keys[key] = (now, 0)
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueues the record untouched, so %-formatting happens on the listener
+    thread. Safe because records never leave the process and log arguments
+    here are immutable (ids, counts, strings).
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a log line beats blocking a request on a stuck stderr
+            pass
+
+
+class _Listener:
+    """Owns the QueueListener thread; a forked child gets a fresh queue and thread."""
+
+    def __init__(self, queue_handler, output):
+        self.queue_handler = queue_handler
+        self.output = output
+        self.listener = None
+
+    def start(self):
+        self.listener = QueueListener(self.queue_handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def restart_in_child(self):
+        # The parent's thread did not survive the fork and its queue lock may be held
+        self.queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, use_queue=LOG_QUEUE, sample_rate=LOG_SAMPLE_RATE,
+                      rate_limit=LOG_RATE_LIMIT, stream=None):
+    """Installs the root handler; replaces logging.basicConfig for the app."""
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    if use_queue:
+        handler = DeferredQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        listener = _Listener(handler, output)
+        listener.start()
+        atexit.register(listener.stop)
+        os.register_at_fork(after_in_child=listener.restart_in_child)
+    else:
+        handler = output
+
+    # Filters run on the calling thread, before anything is queued or formatted
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
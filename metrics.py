@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import cProfile
+import logging
+import tempfile
+import threading
+import itertools
+from glob import glob
+
+logger = logging.getLogger(__name__)
+
+# Multi-process aggregation: each worker writes its totals here and /metrics
+# sums every file. Unset means single-process (in-memory only). Empty the
+# directory on deploy; files of exited workers are kept so counters never go
+# backwards.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# Profile one request out of every N (0 disables); .prof files land in METRICS_PROFILE_DIR
+METRICS_PROFILE_EVERY = int(os.environ.get('METRICS_PROFILE_EVERY', 0))
+METRICS_PROFILE_DIR = os.environ.get('METRICS_PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'honeypot-profiles')
+
+# Seconds; tuned for a pipeline whose stages run from microseconds to seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    "honeypot_request_duration_seconds": "HTTP request latency by endpoint.",
+    "honeypot_requests_total": "HTTP responses by endpoint and status code.",
+    "honeypot_stage_duration_seconds": "Time spent in each /chat pipeline stage.",
+    "honeypot_messages_total": "Scammer messages analyzed, by detection outcome.",
+    "honeypot_detector_flags_total": "Detector flags raised, by flag.",
+    "honeypot_agent_states_total": "Agent replies, by conversation state.",
+    "honeypot_callbacks_total": "Callback dispatcher events, by outcome.",
+    "honeypot_callback_post_seconds": "Latency of posts to the evaluation endpoint.",
+    "honeypot_profiles_total": "Requests captured with cProfile.",
+    "honeypot_rejections_total": "Requests turned away by admission control, by reason.",
+    "honeypot_turn_retries_total": "/chat turns redone after losing a race with the same session.",
+    "honeypot_detector_stage_seconds": "Time spent in each detector stage.",
+    "honeypot_detector_stage_dropped_total": "Detector stage results left out of a score, by stage and reason.",
+    "honeypot_analysis_cache_total": "Detector cache lookups and evictions, by cache and event.",
+}
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """
+    In-process counters and histograms with a Prometheus text exposition.
+
+    Recording is a dict lookup and an increment under one lock, cheap enough
+    for every request. Histograms share fixed buckets, so per-worker
+    snapshots merge by plain addition. Collectors are callables polled at
+    snapshot time for counters kept elsewhere (e.g. the callback dispatcher).
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL,
+                 profile_every=METRICS_PROFILE_EVERY, profile_dir=METRICS_PROFILE_DIR, buckets=BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._collectors = []
+        self._pid = None
+        self._reset()
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['metrics'] = self
+        app.before_request(self.start)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if self.directory:
+            atexit.register(self._final_snapshot)
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        self._observe(name, tuple(sorted(labels.items())), seconds)
+
+    def recorder(self, name, **labels):
+        """Returns record(seconds) observing name with these labels, for hot paths."""
+        key = tuple(sorted(labels.items()))
+        return lambda seconds: self._observe(name, key, seconds)
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self, name, tuple(sorted(labels.items())))
+
+    def stage(self, stage):
+        """Times one /chat pipeline stage."""
+        return _Timer(self, "honeypot_stage_duration_seconds", (("stage", stage),))
+
+    def add_collector(self, collector):
+        """collector() returns an iterable of (name, labels dict, value) counters."""
+        self._collectors.append(collector)
+
+    def profiled(self, tag, fn, *args):
+        """Calls fn(*args), under cProfile for one call in every profile_every."""
+        if not self.profile_every or next(self._calls) % self.profile_every:
+            return fn(*args)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (one at a time on newer Pythons)
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{tag}-{os.getpid()}-{time.time_ns()}.prof")
+            profiler.dump_stats(path)
+            self.inc("honeypot_profiles_total", tag=tag)
+            logger.info("Wrote request profile %s", path)
+
+    def _observe(self, name, labels, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def _before_request(self):
+        from flask import g
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        from flask import g, request
+        started = g.pop('metrics_started', None)
+        endpoint = request.endpoint or "unmatched"
+        if started is not None:
+            self._observe("honeypot_request_duration_seconds", (("endpoint", endpoint),),
+                          time.perf_counter() - started)
+        self.inc("honeypot_requests_total", endpoint=endpoint, status=str(response.status_code))
+        return response
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def snapshot(self):
+        """This process's totals as a JSON-serialisable dict."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: [list(h[0]), h[1], h[2]] for key, h in self._histograms.items()}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    key = (name, tuple(sorted(labels.items())))
+                    counters[key] = counters.get(key, 0) + value
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        return {
+            "buckets": list(self.buckets),
+            "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [[name, list(labels)] + h for (name, labels), h in histograms.items()],
+        }
+
+    def write_snapshot(self):
+        """Publishes this process's totals for the other workers to read."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        temp = path + ".tmp"
+        with open(temp, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(temp, path)
+
+    def render(self):
+        """Prometheus text format, summed over every worker when METRICS_DIR is set."""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+            for path in glob(os.path.join(self.directory, "metrics-*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as handle:
+                        snapshots.append(json.load(handle))
+                except (OSError, ValueError):
+                    continue
+
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            if snap.get("buckets") != list(self.buckets):
+                continue
+            for name, labels, value in snap["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, buckets, total, count in snap["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            self._header(lines, name, "counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            self._header(lines, name, "histogram")
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), buckets):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _header(lines, name, kind):
+        if name in DESCRIPTIONS:
+            lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the snapshot writer in this process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Totals inherited from a parent process are already in its own file
+            self._reset()
+            if self.directory:
+                threading.Thread(target=self._run, name="metrics-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _final_snapshot(self):
+        # Only processes that served requests have totals worth publishing
+        if self._pid == os.getpid():
+            self.write_snapshot()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning("Could not write metrics snapshot: %s", e)
+
+    def _reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+        self._calls = itertools.count()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
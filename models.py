@@ -1,28 +1,221 @@
+import re
+import hashlib
+import itertools
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert, select, text, update
+from sqlalchemy.exc import DBAPIError
 from datetime import datetime
 
+from risk import RiskState
+
 # Initialize the database instance here to be shared
 db = SQLAlchemy()
 
+
+def engine_options(uri, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800):
+    """SQLALCHEMY_ENGINE_OPTIONS suited to the backend behind `uri`."""
+    if uri.startswith("sqlite"):
+        # SQLite has a single writer; extra pooled connections only add lock
+        # contention, and waiting on the lock is handled by busy_timeout.
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        # Drop server-side idle connections before the server does
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
+def install_sqlite_pragmas(engine, journal_mode="WAL", synchronous="NORMAL", busy_timeout_ms=5000,
+                           mmap_size=256 * 1024 * 1024, auto_vacuum="INCREMENTAL"):
+    """
+    Applies per-connection pragmas to a SQLite engine. WAL lets readers run
+    alongside the single writer, NORMAL sync is durable across app crashes in
+    WAL mode, busy_timeout makes concurrent writers wait instead of failing
+    with "database is locked", and mmap cuts read syscalls. auto_vacuum only
+    takes effect on a new file (or at the next full VACUUM); INCREMENTAL lets
+    compaction hand freed pages back in small steps.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        if auto_vacuum:
+            # Before journal_mode: it has to be set before the file gets its first page
+            cursor.execute(f"PRAGMA auto_vacuum = {auto_vacuum}")
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+        if synchronous:
+            cursor.execute(f"PRAGMA synchronous = {synchronous}")
+        if mmap_size is not None:
+            cursor.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        cursor.close()
+
+
 class ScamSession(db.Model):
     __tablename__ = "scam_sessions"
 
     id = db.Column(db.String(36), primary_key=True)
     turn_count = db.Column(db.Integer, default=0)
     scam_detected = db.Column(db.Boolean, default=False)
-    # Storing conversation history as a simple text block for this hackathon level
+    # State the agent reported for its last reply (see agent.DEFAULT_FLOW)
+    agent_state = db.Column(db.String(32), default="")
+    # Legacy transcript blob; messages now live in ScamMessage and this is
+    # only read by migrate_message_blobs() and left empty after.
     messages = db.Column(db.Text, default="")
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Indexed for retention range scans (retention.RetentionJob)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationship to intelligence
     intelligence = db.relationship("ScamIntelligence", backref="session", uselist=False, cascade="all, delete-orphan")
+    indicators = db.relationship("ScamIndicator", backref="session", lazy="dynamic", cascade="all, delete-orphan")
+    message_log = db.relationship("ScamMessage", backref="session", lazy="dynamic",
+                                  order_by="ScamMessage.seq", cascade="all, delete-orphan")
+    risk = db.relationship("SessionRisk", uselist=False, cascade="all, delete-orphan")
 
     def add_message(self, sender: str, text: str):
-        entry = f"{sender}: {text}"
-        if self.messages:
-            self.messages += f"\n{entry}"
-        else:
-            self.messages = entry
+        """Appends one message to the transcript (a single INSERT on flush)."""
+        db.session.add(_unsequenced(ScamMessage(session_id=self.id, sender=sender, text=text)))
+
+    def add_messages(self, entries):
+        """Appends (sender, text) pairs, written as one bulk INSERT."""
+        db.session.add_all([
+            _unsequenced(ScamMessage(session_id=self.id, sender=sender, text=text))
+            for sender, text in entries
+        ])
+
+    def iter_messages(self, batch_size=500):
+        """Streams the transcript in order without loading it all at once."""
+        yield from db.session.scalars(
+            select(ScamMessage)
+            .where(ScamMessage.session_id == self.id)
+            .order_by(ScamMessage.seq)
+            .execution_options(yield_per=batch_size)
+        )
+
+    def messages_page(self, after_seq=-1, limit=100):
+        """Keyset-paged transcript read: up to `limit` messages after `after_seq`."""
+        return (ScamMessage.query
+                .filter(ScamMessage.session_id == self.id, ScamMessage.seq > after_seq)
+                .order_by(ScamMessage.seq)
+                .limit(limit)
+                .all())
+
+    def risk_state(self):
+        """The session's running RiskState (empty for sessions that predate it)."""
+        return RiskState.from_row(self.risk) if self.risk is not None else RiskState()
+
+    def save_risk_state(self, state):
+        """Stores an updated RiskState (written on the caller's commit)."""
+        if self.risk is None:
+            self.risk = SessionRisk(session_id=self.id)
+        for column, value in state.to_row().items():
+            setattr(self.risk, column, value)
+
+
+class ScamMessage(db.Model):
+    """Append-only transcript entry; (session_id, seq) orders a conversation."""
+    __tablename__ = "scam_messages"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), db.ForeignKey('scam_sessions.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    sender = db.Column(db.String(32), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("session_id", "seq", name="uq_message_session_seq"),
+    )
+
+
+# Order in which unsequenced messages were appended (see _sequence_messages)
+_append_order = itertools.count()
+
+
+def _unsequenced(message):
+    message._append_order = next(_append_order)
+    return message
+
+
+@event.listens_for(db.session, "before_flush")
+def _sequence_messages(session, flush_context, instances):
+    """
+    Numbers appended messages at flush, after their session rows are claimed.
+    The no-op UPDATE holds the rows (on SQLite the write lock) until commit,
+    so concurrent turns of one session queue up here: the max(seq) read sees
+    every committed turn, and turn_count increments are applied on top of the
+    stored count rather than the one loaded at the start of the turn.
+    """
+    pending = sorted(
+        (obj for obj in session.new if isinstance(obj, ScamMessage) and obj.seq is None),
+        key=lambda message: message._append_order,
+    )
+    if not pending:
+        return
+    ids = {message.session_id for message in pending}
+    table = ScamSession.__table__
+    stored_turns = dict(session.execute(
+        update(table)
+        .where(table.c.id.in_(ids))
+        .values(turn_count=table.c.turn_count)
+        .returning(table.c.id, table.c.turn_count)
+    ).all())
+    for obj in session.dirty:
+        if isinstance(obj, ScamSession) and obj.id in stored_turns:
+            history = db.inspect(obj).attrs.turn_count.history
+            if history.added and history.deleted:
+                obj.turn_count = (stored_turns[obj.id] or 0) + (history.added[0] or 0) - (history.deleted[0] or 0)
+
+    next_seq = {session_id: last + 1 for session_id, last in session.execute(
+        select(ScamMessage.session_id, db.func.max(ScamMessage.seq))
+        .where(ScamMessage.session_id.in_(ids))
+        .group_by(ScamMessage.session_id)
+    ).all()}
+    for message in pending:
+        message.seq = next_seq.get(message.session_id, 0)
+        next_seq[message.session_id] = message.seq + 1
+
+
+class SessionRisk(db.Model):
+    """Running risk state of a session (see risk.RiskState), one row per session."""
+    __tablename__ = "session_risk"
+
+    session_id = db.Column(db.String(36), db.ForeignKey('scam_sessions.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    peak_score = db.Column(db.Float, nullable=False, default=0.0)
+    messages_scored = db.Column(db.Integer, nullable=False, default=0)
+    # Comma-separated flags in first-seen order
+    flags = db.Column(db.Text, nullable=False, default="")
+    # JSON objects: keyword -> decayed weight, extracted_data field -> count
+    keyword_weights = db.Column(db.Text, nullable=False, default="{}")
+    indicator_counts = db.Column(db.Text, nullable=False, default="{}")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Indicator kinds, keyed by the detector's extracted_data field names
+INDICATOR_KINDS = {
+    "upiIds": "upi_id",
+    "bankAccounts": "bank_account",
+    "phoneNumbers": "phone_number",
+    "phishingLinks": "phishing_link",
+    "suspiciousKeywords": "suspicious_keyword",
+}
+
+# Stored indicator values are cut to this many characters (a long link would
+# not fit the column on backends that enforce it); every caller building rows
+# goes through indicator_value() so both indicator tables share one key
+INDICATOR_VALUE_LENGTH = 255
+
+
+def indicator_value(value):
+    """The form an extracted value is stored and compared in."""
+    return value[:INDICATOR_VALUE_LENGTH]
 
 
 class ScamIntelligence(db.Model):
@@ -31,7 +224,8 @@ class ScamIntelligence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(36), db.ForeignKey('scam_sessions.id'), unique=True)
 
-    # Storing sets as comma-separated strings
+    # Legacy comma-separated storage. Indicators now live in ScamIndicator;
+    # these are only read by migrate_csv_indicators() and left empty after.
     upi_ids = db.Column(db.Text, default="")
     bank_accounts = db.Column(db.Text, default="")
     phone_numbers = db.Column(db.Text, default="")
@@ -40,3 +234,448 @@ class ScamIntelligence(db.Model):
 
     agent_notes = db.Column(db.Text, default="")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def add_indicators(self, extracted):
+        """Records extracted values for this session, skipping ones already stored."""
+        rows = [
+            {"session_id": self.session_id, "kind": kind, "value": indicator_value(value)}
+            for field, kind in INDICATOR_KINDS.items()
+            for value in extracted.get(field, ())
+        ]
+        insert_indicators(rows)
+
+    def indicator_kinds(self):
+        """Returns the set of indicator kinds seen so far in this session."""
+        return set(db.session.scalars(
+            select(ScamIndicator.kind).where(ScamIndicator.session_id == self.session_id).distinct()
+        ))
+
+    def indicators(self):
+        """Returns {kind: sorted values} for every kind (empty lists included)."""
+        found = {kind: [] for kind in INDICATOR_KINDS.values()}
+        rows = db.session.execute(
+            select(ScamIndicator.kind, ScamIndicator.value)
+            .where(ScamIndicator.session_id == self.session_id)
+            .order_by(ScamIndicator.kind, ScamIndicator.value)
+        )
+        for kind, value in rows:
+            found.setdefault(kind, []).append(value)
+        return found
+
+
+class ScamIndicator(db.Model):
+    """One row per (session, kind, value), e.g. a UPI ID seen in a session."""
+    __tablename__ = "scam_indicators"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), db.ForeignKey('scam_sessions.id'), nullable=False)
+    kind = db.Column(db.String(32), nullable=False)
+    value = db.Column(db.String(INDICATOR_VALUE_LENGTH), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Also serves per-session reads (leading session_id column)
+        db.UniqueConstraint("session_id", "kind", "value", name="uq_indicator_session_kind_value"),
+        # Reverse lookups: "which sessions mentioned this UPI ID"
+        db.Index("ix_indicator_kind_value", "kind", "value"),
+    )
+
+
+class IndicatorStat(db.Model):
+    """
+    Cross-session aggregate per indicator value, kept current by
+    insert_indicators(). Phishing links also count towards a derived
+    'link_domain' entry for their host.
+    """
+    __tablename__ = "indicator_stats"
+
+    kind = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.String(INDICATOR_VALUE_LENGTH), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    # Indexed so readers can poll for entries changed since their last look
+    last_seen = db.Column(db.DateTime, nullable=False, index=True)
+    # Messages the value was extracted from / sessions it appeared in
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+def link_domain(url):
+    """Lowercased host of a URL, without credentials or port."""
+    host = url.split("://", 1)[-1].split("/", 1)[0].rsplit("@", 1)[-1]
+    return host.split(":", 1)[0].lower()
+
+
+def _dialect_insert(table):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def insert_indicators(rows):
+    """
+    Insert-if-absent for indicator rows, using the backend's upsert syntax.
+    Row values must already be in indicator_value() form. Every row counts
+    as a hit in IndicatorStat; rows new to their session also count towards
+    the value's session total.
+    """
+    if not rows:
+        return
+
+    # Pending sessions must reach the DB before rows that reference them
+    if db.session.new:
+        db.session.flush()
+
+    # Core statements on the session's connection skip the ORM execute layer
+    connection = db.session.connection()
+    table = ScamIndicator.__table__
+    now = datetime.utcnow()
+    stmt = _dialect_insert(table)
+    if stmt is not None and connection.dialect.name in ("sqlite", "postgresql"):
+        # Duplicates are skipped and not returned, so the result is exactly the new rows
+        fresh = [
+            {"session_id": session_id, "kind": kind, "value": value}
+            for session_id, kind, value in connection.execute(
+                stmt.on_conflict_do_nothing().returning(table.c.session_id, table.c.kind, table.c.value),
+                [dict(row, created_at=now) for row in rows]
+            )
+        ]
+    else:
+        known = set(connection.execute(
+            select(table.c.session_id, table.c.kind, table.c.value)
+            .where(table.c.session_id.in_({row["session_id"] for row in rows}))
+        ).tuples())
+        fresh = []
+        for row in rows:
+            key = (row["session_id"], row["kind"], row["value"])
+            if key not in known:
+                known.add(key)
+                fresh.append(row)
+        if fresh:
+            connection.execute(insert(table).prefix_with("IGNORE"), [dict(row, created_at=now) for row in fresh])
+
+    _bump_indicator_stats(connection, rows, fresh, now)
+
+
+def _bump_indicator_stats(connection, rows, fresh, now):
+    hits, sessions = {}, {}
+    domain_sessions = set()
+    for row in rows:
+        keys = [(row["kind"], row["value"])]
+        if row["kind"] == "phishing_link":
+            keys.append(("link_domain", link_domain(row["value"])))
+        for key in keys:
+            hits[key] = hits.get(key, 0) + 1
+    for row in fresh:
+        key = (row["kind"], row["value"])
+        sessions[key] = sessions.get(key, 0) + 1
+        if row["kind"] == "phishing_link":
+            domain_sessions.add((row["session_id"], link_domain(row["value"])))
+    for _, domain in domain_sessions:
+        key = ("link_domain", domain)
+        sessions[key] = sessions.get(key, 0) + 1
+
+    table = IndicatorStat.__table__
+    stmt = _dialect_insert(table)
+    params = [
+        {"kind": kind, "value": value, "first_seen": now, "last_seen": now,
+         "hit_count": count, "session_count": sessions.get((kind, value), 0)}
+        for (kind, value), count in hits.items()
+    ]
+    if stmt is None:
+        # No portable upsert: fall back to read-then-write
+        for param in params:
+            updated = connection.execute(
+                table.update()
+                .where(table.c.kind == param["kind"], table.c.value == param["value"])
+                .values(last_seen=now, hit_count=table.c.hit_count + param["hit_count"],
+                        session_count=table.c.session_count + param["session_count"])
+            ).rowcount
+            if not updated:
+                connection.execute(insert(table), param)
+    elif connection.dialect.name in ("mysql", "mariadb"):
+        connection.execute(stmt.on_duplicate_key_update(
+            last_seen=stmt.inserted.last_seen,
+            hit_count=table.c.hit_count + stmt.inserted.hit_count,
+            session_count=table.c.session_count + stmt.inserted.session_count,
+        ), params)
+    else:
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.kind, table.c.value],
+            set_={
+                "last_seen": stmt.excluded.last_seen,
+                "hit_count": table.c.hit_count + stmt.excluded.hit_count,
+                "session_count": table.c.session_count + stmt.excluded.session_count,
+            },
+        ), params)
+
+
+def backfill_indicator_stats(batch_size=5000):
+    """
+    Builds IndicatorStat from existing ScamIndicator rows when the aggregate
+    is empty (first start after upgrading). Each stored row counts as one
+    hit. Returns the number of indicator rows read.
+    """
+    if db.session.scalar(select(IndicatorStat.kind).limit(1)) is not None:
+        return 0
+
+    totals = {}
+    rows = db.session.execute(
+        select(ScamIndicator.session_id, ScamIndicator.kind, ScamIndicator.value, ScamIndicator.created_at)
+        .execution_options(yield_per=batch_size)
+    )
+    read = 0
+    domain_sessions = set()
+    for session_id, kind, value, created_at in rows:
+        read += 1
+        created_at = created_at or datetime.utcnow()
+        # Rows stored before values were cut on the way in (SQLite does not enforce the length)
+        keys = [(kind, indicator_value(value))]
+        if kind == "phishing_link":
+            domain = link_domain(value)
+            if (session_id, domain) not in domain_sessions:
+                domain_sessions.add((session_id, domain))
+                keys.append(("link_domain", domain))
+        for key in keys:
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [created_at, created_at, 1]
+            else:
+                entry[0] = min(entry[0], created_at)
+                entry[1] = max(entry[1], created_at)
+                entry[2] += 1
+
+    params = [
+        {"kind": kind, "value": value, "first_seen": first, "last_seen": last,
+         "hit_count": count, "session_count": count}
+        for (kind, value), (first, last, count) in totals.items()
+    ]
+    for start in range(0, len(params), batch_size):
+        db.session.execute(insert(IndicatorStat.__table__), params[start:start + batch_size])
+    db.session.commit()
+    return read
+
+
+def sessions_with_indicator(kind, value, limit=None):
+    """Reverse lookup: ids of sessions where this indicator value was seen (newest first)."""
+    stmt = (
+        select(ScamIndicator.session_id)
+        .where(ScamIndicator.kind == kind, ScamIndicator.value == value)
+        .order_by(ScamIndicator.id.desc())
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    return list(db.session.scalars(stmt))
+
+
+def _split_csv(csv_str):
+    if not csv_str:
+        return []
+    return [item.strip() for item in csv_str.split(',') if item.strip()]
+
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables; columns added to an existing
+    model later are added here with ALTER TABLE (nullable, no backfill).
+    Returns the "table.column" names added.
+    """
+    inspector = db.inspect(db.engine)
+    dialect = db.engine.dialect
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            try:
+                db.session.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+                ))
+                db.session.commit()
+            except DBAPIError:
+                # Another worker starting at the same time added it first
+                db.session.rollback()
+                continue
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes():
+    """
+    create_all() skips tables that exist, and with them indexes added to
+    their models later; creates those. Returns the index names created.
+    """
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(db.engine, checkfirst=True)
+            except DBAPIError:
+                # Another worker starting at the same time created it first
+                continue
+            created.append(index.name)
+    return created
+
+
+def migrate_csv_indicators(batch_size=500):
+    """
+    One-way migration of the legacy CSV columns into ScamIndicator.
+    Idempotent: migrated rows have their CSV columns cleared, and inserts
+    skip values that already exist. Returns the number of records migrated.
+    """
+    columns = {
+        "upi_id": "upi_ids",
+        "bank_account": "bank_accounts",
+        "phone_number": "phone_numbers",
+        "phishing_link": "phishing_links",
+        "suspicious_keyword": "suspicious_keywords",
+    }
+    pending = db.or_(*[getattr(ScamIntelligence, column) != "" for column in columns.values()])
+
+    migrated = 0
+    while True:
+        records = ScamIntelligence.query.filter(pending).limit(batch_size).all()
+        if not records:
+            break
+
+        rows = []
+        for record in records:
+            for kind, column in columns.items():
+                rows.extend(
+                    {"session_id": record.session_id, "kind": kind, "value": indicator_value(value)}
+                    for value in _split_csv(getattr(record, column))
+                )
+                setattr(record, column, "")
+
+        insert_indicators(rows)
+        db.session.commit()
+        migrated += len(records)
+
+    return migrated
+
+
+_BLOB_LINE = re.compile(r'^(\S{1,32}): (.*)$')
+
+
+def _split_blob(blob):
+    """Parses a legacy 'sender: text' transcript; other lines continue the previous message."""
+    entries = []
+    for line in blob.split("\n"):
+        match = _BLOB_LINE.match(line)
+        if match or not entries:
+            sender, text = match.groups() if match else ("unknown", line)
+            entries.append([sender, text])
+        else:
+            entries[-1][1] += "\n" + line
+    return entries
+
+
+def migrate_message_blobs(batch_size=200):
+    """
+    One-way migration of legacy ScamSession.messages blobs into ScamMessage.
+    Idempotent: migrated sessions have the blob cleared. Returns the number
+    of sessions migrated.
+    """
+    migrated = 0
+    while True:
+        sessions = ScamSession.query.filter(ScamSession.messages != "").limit(batch_size).all()
+        if not sessions:
+            break
+
+        for session in sessions:
+            session.add_messages(_split_blob(session.messages))
+            session.messages = ""
+
+        db.session.commit()
+        migrated += len(sessions)
+
+    return migrated
+
+
+class CallbackOutbox(db.Model):
+    """
+    Durable queue of evaluation-endpoint reports. Rows are written in the same
+    transaction as the turn that produced them and survive restarts until sent.
+    """
+    __tablename__ = "callback_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(36), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent | failed (sending goes back to pending on retry)
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text, default="")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class CallbackState(db.Model):
+    """What was last reported for a session, so unchanged reports are skipped."""
+    __tablename__ = "callback_state"
+
+    session_id = db.Column(db.String(36), db.ForeignKey('scam_sessions.id'), primary_key=True)
+    # Digest of the last staged scamDetected + extractedIntelligence
+    fingerprint = db.Column(db.String(64), default="")
+    final_reported = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SchemaState(db.Model):
+    """The schema fingerprint init_db() last brought this database to (a single row)."""
+    __tablename__ = "schema_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Data migrations init_db() runs after the DDL; adding one here changes the
+# fingerprint, so every existing database runs the init step once more
+DATA_MIGRATIONS = ("indicator_stats", "csv_indicators", "message_blobs")
+
+
+def schema_fingerprint():
+    """Digest of the tables, columns and indexes the models declare, plus DATA_MIGRATIONS."""
+    parts = list(DATA_MIGRATIONS)
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name} {column.type!r}" for column in table.columns)
+        parts.extend(sorted(f"{index.name} {[column.name for column in index.columns]}" for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def schema_is_current():
+    """True if this database was already initialized for the models as they are now (one query)."""
+    try:
+        stored = db.session.scalar(select(SchemaState.fingerprint).where(SchemaState.id == 1))
+    except DBAPIError:
+        # No schema_state table: a new database, or one from before it existed
+        db.session.rollback()
+        return False
+    return stored == schema_fingerprint()
+
+
+def mark_schema_current():
+    db.session.merge(SchemaState(id=1, fingerprint=schema_fingerprint(), updated_at=datetime.utcnow()))
+    db.session.commit()
@@ -0,0 +1,336 @@
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db, IndicatorStat, INDICATOR_KINDS, indicator_value, link_domain
+
+logger = logging.getLogger(__name__)
+
+# Shared filter file; all workers on a host map the same one. Unset means a
+# file in the temp directory named after the database URL.
+PRESCREEN_PATH = os.environ.get('PRESCREEN_PATH') or None
+PRESCREEN_ENABLED = os.environ.get('PRESCREEN_ENABLED', '1') not in ('0', 'false', 'no')
+# Sizing: expected distinct indicators and target false-positive rate. The
+# file is rebuilt twice as large once the capacity is exceeded.
+PRESCREEN_CAPACITY = int(os.environ.get('PRESCREEN_CAPACITY', 1000000))
+PRESCREEN_FP_RATE = float(os.environ.get('PRESCREEN_FP_RATE', 0.001))
+# Hard cap on the bit array in bytes (0 = none); a cap trades a higher false-positive rate for memory
+PRESCREEN_MAX_BYTES = int(os.environ.get('PRESCREEN_MAX_BYTES', 0))
+PRESCREEN_REFRESH_INTERVAL = float(os.environ.get('PRESCREEN_REFRESH_INTERVAL', 1.0))
+# Re-read indicator_stats rows stamped this long before the file's watermark
+PRESCREEN_REFRESH_OVERLAP = float(os.environ.get('PRESCREEN_REFRESH_OVERLAP', 10.0))
+
+# Indicator kinds worth recognising in a later message
+PRESCREEN_KINDS = ("upi_id", "phone_number", "bank_account", "link_domain")
+
+_MAGIC = b"HPBLOOM1"
+# magic, hash count, capacity, bit count, items added, watermark (epoch seconds)
+_HEADER = struct.Struct("<8sIQQQd")
+_HEADER_SIZE = 64
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bloom_size(capacity, fp_rate, max_bytes=0):
+    """Returns (bits, hashes) for a Bloom filter of this capacity and false-positive rate."""
+    bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+    if max_bytes:
+        bits = min(bits, max_bytes * 8)
+    bits = max(64, bits + -bits % 8)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+def expected_fp_rate(bits, hashes, items):
+    """Theoretical false-positive rate after items distinct insertions."""
+    return (1 - math.exp(-hashes * items / bits)) ** hashes
+
+
+def indicator_key(kind, value):
+    """Normalised form under which a stored indicator is added to the filter."""
+    if kind in ("phone_number", "bank_account"):
+        digits = "".join(ch for ch in value if ch.isdigit())
+        # Phone numbers are matched on their last ten digits, with or without +91
+        return digits[-10:] if kind == "phone_number" else digits
+    return value.lower()
+
+
+def extracted_keys(extracted):
+    """
+    Keys to probe for a detector's extracted_data: each UPI ID, phone number
+    and account in the form stored ones are added under, and the host of
+    every link. Using the extractor's values means a message is screened for
+    exactly the indicators that would be recorded from it.
+    """
+    keys = set()
+    for field, kind in INDICATOR_KINDS.items():
+        if kind in PRESCREEN_KINDS:
+            keys.update(indicator_key(kind, indicator_value(value)) for value in extracted.get(field, ()))
+    for url in extracted.get("phishingLinks", ()):
+        keys.add(indicator_key("link_domain", link_domain(indicator_value(url))))
+    return keys
+
+
+class BloomFile:
+    """
+    A Bloom filter stored in a file and used through mmap, so every process
+    mapping it shares one copy in the page cache. Adding only ever sets
+    bits, so readers need no lock; writers serialise on a separate lock
+    file (see IndicatorPrescreen).
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self._handle = open(path, "r+b" if writable else "rb")
+        self.inode = os.fstat(self._handle.fileno()).st_ino
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self._map = mmap.mmap(self._handle.fileno(), 0, access=access)
+        magic, self.hashes, self.capacity, self.bits, _, _ = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a prescreen filter")
+
+    @classmethod
+    def create(cls, path, capacity, fp_rate, max_bytes=0):
+        """Writes an empty filter to path (replacing any file there) and opens it for writing."""
+        bits, hashes = bloom_size(capacity, fp_rate, max_bytes)
+        with open(path, "wb") as handle:
+            handle.write(_HEADER.pack(_MAGIC, hashes, capacity, bits, 0, 0.0).ljust(_HEADER_SIZE, b"\0"))
+            handle.truncate(_HEADER_SIZE + bits // 8)
+        return cls(path, writable=True)
+
+    @property
+    def items(self):
+        return _HEADER.unpack_from(self._map)[4]
+
+    @property
+    def watermark(self):
+        return _HEADER.unpack_from(self._map)[5]
+
+    @property
+    def nbytes(self):
+        return self.bits // 8
+
+    def set_header(self, items, watermark):
+        _HEADER.pack_into(self._map, 0, _MAGIC, self.hashes, self.capacity, self.bits, items, watermark)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        return [(first + i * step) % bits for i in range(self.hashes)]
+
+    def add(self, key):
+        """Sets key's bits; returns True if any was new (the key was not already present)."""
+        added = False
+        bitmap = self._map
+        for position in self._positions(key):
+            index = _HEADER_SIZE + (position >> 3)
+            mask = 1 << (position & 7)
+            byte = bitmap[index]
+            if not byte & mask:
+                bitmap[index] = byte | mask
+                added = True
+        return added
+
+    def __contains__(self, key):
+        bitmap = self._map
+        for position in self._positions(key):
+            if not bitmap[_HEADER_SIZE + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._handle.close()
+
+
+def default_path(database_uri):
+    """Filter file for a database: one per database URL, shared by its workers."""
+    name = hashlib.sha1(database_uri.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"honeypot-prescreen-{name}.bloom")
+
+
+class IndicatorPrescreen:
+    """
+    Cheap known-indicator check of the indicators detection extracted from
+    each /chat message.
+
+    A Bloom filter over every UPI ID, phone number, bank account and link
+    domain in indicator_stats lives in one memory-mapped file per host. Each
+    worker maps it read-only; a refresh thread in every worker tries a
+    non-blocking file lock and, if it wins, adds rows whose last_seen moved
+    past the file's watermark. Past its capacity the filter is rebuilt at
+    twice the size into a new file that replaces the old one atomically;
+    readers remap when they see the inode change.
+    """
+
+    def __init__(self, path=PRESCREEN_PATH, enabled=PRESCREEN_ENABLED, capacity=PRESCREEN_CAPACITY,
+                 fp_rate=PRESCREEN_FP_RATE, max_bytes=PRESCREEN_MAX_BYTES,
+                 refresh_interval=PRESCREEN_REFRESH_INTERVAL, overlap=PRESCREEN_REFRESH_OVERLAP):
+        self.path = path
+        self.enabled = enabled
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.max_bytes = max_bytes
+        self.refresh_interval = refresh_interval
+        self.overlap = overlap
+        self.app = None
+
+        self._filter = None
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._counters = {"checks": 0, "hits": 0, "refreshes": 0, "rebuilds": 0, "refresh_errors": 0}
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['prescreen'] = self
+        if self.path is None:
+            self.path = default_path(app.config['SQLALCHEMY_DATABASE_URI'])
+        if self.enabled:
+            app.before_request(self.start)
+
+    # ------------------------------------------------------------------
+    # Request-side API
+    # ------------------------------------------------------------------
+
+    def check(self, extracted):
+        """Returns the keys of a detector's extracted_data that are (probably) known indicators."""
+        bloom = self._filter
+        if bloom is None:
+            return []
+        self._counters["checks"] += 1
+        found = [key for key in extracted_keys(extracted) if key in bloom]
+        if found:
+            self._counters["hits"] += 1
+        return found
+
+    def stats(self):
+        bloom = self._filter
+        if bloom is None:
+            return dict(self._counters, enabled=self.enabled, loaded=False)
+        return dict(self._counters, enabled=self.enabled, loaded=True, path=self.path, bytes=bloom.nbytes,
+                    hashes=bloom.hashes, capacity=bloom.capacity, items=bloom.items,
+                    expected_fp_rate=round(expected_fp_rate(bloom.bits, bloom.hashes, bloom.items), 6))
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the refresh thread in the current process (idempotent, fork-aware)."""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="prescreen-refresh", daemon=True).start()
+            self._pid = os.getpid()
+
+    def refresh(self):
+        """Adds new indicators to the shared file if no other worker is, then (re)maps it."""
+        with open(self.path + ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass  # Another worker is updating the file right now
+            else:
+                try:
+                    self._update()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self._remap()
+        self._counters["refreshes"] += 1
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _update(self):
+        try:
+            bloom = BloomFile(self.path, writable=True)
+        except (OSError, ValueError):
+            self._rebuild(self.capacity)
+            return
+
+        try:
+            sizing = bloom_size(bloom.capacity, self.fp_rate, self.max_bytes)
+            if bloom.items > bloom.capacity or bloom.capacity < self.capacity or sizing != (bloom.bits, bloom.hashes):
+                # Full, or sized for other settings: start over
+                capacity = max(self.capacity, bloom.capacity * 2 if bloom.items > bloom.capacity else bloom.capacity)
+                bloom.close()
+                bloom = None
+                self._rebuild(capacity)
+                return
+
+            since = None
+            if bloom.watermark:
+                since = _EPOCH + timedelta(seconds=bloom.watermark - self.overlap)
+            items, watermark = self._fill(bloom, since, bloom.items, bloom.watermark)
+            if items != bloom.items or watermark != bloom.watermark:
+                bloom.set_header(items, watermark)
+        finally:
+            if bloom is not None:
+                bloom.close()
+
+    def _rebuild(self, capacity):
+        staging = f"{self.path}.{os.getpid()}.tmp"
+        bloom = BloomFile.create(staging, capacity, self.fp_rate, self.max_bytes)
+        try:
+            items, watermark = self._fill(bloom, None, 0, 0.0)
+            bloom.set_header(items, watermark)
+            bloom.flush()
+        finally:
+            bloom.close()
+        os.replace(staging, self.path)
+        self._counters["rebuilds"] += 1
+        logger.info("Prescreen filter built: %d indicators, %d bytes", items, os.path.getsize(self.path))
+
+    def _fill(self, bloom, since, items, watermark):
+        stmt = select(IndicatorStat.kind, IndicatorStat.value, IndicatorStat.last_seen).where(
+            IndicatorStat.kind.in_(PRESCREEN_KINDS))
+        if since is not None:
+            stmt = stmt.where(IndicatorStat.last_seen >= since)
+        for kind, value, last_seen in db.session.execute(stmt.execution_options(yield_per=5000)):
+            if bloom.add(indicator_key(kind, value)):
+                items += 1
+            watermark = max(watermark, (last_seen - _EPOCH).total_seconds())
+        db.session.rollback()
+        return items, watermark
+
+    def _remap(self):
+        current = self._filter
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if current is not None and current.inode == inode:
+            return
+        # Requests may still hold the old map; it is released with the last reference
+        self._filter = BloomFile(self.path)
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception as e:
+                self._counters["refresh_errors"] += 1
+                logger.error("Prescreen refresh failed: %s", e, exc_info=True)
+            time.sleep(self.refresh_interval)
+
+
+prescreen = IndicatorPrescreen()
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import logging
+from contextlib import nullcontext
+
+import click
+from sqlalchemy import bindparam, create_engine, delete, select, update
+
+from models import (db, ScamSession, ScamMessage, ScamIndicator, INDICATOR_KINDS, indicator_value,
+                    insert_indicators)
+from engines import ENGINE_CONFIG_PATH, build_engines
+
+logger = logging.getLogger(__name__)
+
+AGENT_SENDER = "agent"
+
+# Per worker process: its own DB engine and detector (set by _init_worker)
+_worker = {}
+
+
+def _init_worker(database_uri, config):
+    # Connections inherited over fork belong to the parent; open our own
+    _worker["engine"] = create_engine(database_uri)
+    _worker["detector"] = build_engines(config).detector
+
+
+def _score_batch(session_ids):
+    """
+    Worker task: re-runs detection over the scammer messages of each session.
+    Returns {session_id: (scam_detected, set of (kind, value))}.
+    """
+    detector = _worker["detector"]
+    results = {session_id: [False, set()] for session_id in session_ids}
+    with _worker["engine"].connect() as connection:
+        rows = connection.execute(
+            select(ScamMessage.session_id, ScamMessage.text)
+            .where(ScamMessage.session_id.in_(session_ids), ScamMessage.sender != AGENT_SENDER)
+            .order_by(ScamMessage.session_id, ScamMessage.seq)
+            .execution_options(yield_per=1000)
+        )
+        for session_id, text in rows:
+            result = detector.analyze_text(text)
+            entry = results[session_id]
+            entry[0] = entry[0] or result["is_scam"]
+            for field, kind in INDICATOR_KINDS.items():
+                entry[1].update((kind, indicator_value(value)) for value in result["extracted_data"].get(field, ()))
+    return {session_id: (scam, found) for session_id, (scam, found) in results.items()}
+
+
+def _iter_id_batches(batch_size):
+    last_id = ""
+    while True:
+        ids = list(db.session.scalars(
+            select(ScamSession.id).where(ScamSession.id > last_id).order_by(ScamSession.id).limit(batch_size)
+        ))
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def _apply(scored, dry_run, stats, report):
+    """Diffs one scored batch against the stored state and writes the changes."""
+    ids = list(scored)
+    current_verdicts = dict(db.session.execute(
+        select(ScamSession.id, ScamSession.scam_detected).where(ScamSession.id.in_(ids))
+    ).all())
+    current_indicators = {}
+    for session_id, kind, value in db.session.execute(
+        select(ScamIndicator.session_id, ScamIndicator.kind, ScamIndicator.value)
+        .where(ScamIndicator.session_id.in_(ids))
+    ):
+        current_indicators.setdefault(session_id, set()).add((kind, value))
+
+    verdict_updates, added, removed = [], [], []
+    for session_id, (scam, found) in scored.items():
+        if session_id not in current_verdicts:
+            continue  # Deleted while we were scoring
+        old_scam = bool(current_verdicts[session_id])
+        old_found = current_indicators.get(session_id, set())
+        gained, lost = found - old_found, old_found - found
+        stats["sessions"] += 1
+
+        if scam != old_scam:
+            verdict_updates.append({"b_id": session_id, "scam_detected": scam})
+            stats["to_scam" if scam else "to_clean"] += 1
+        if gained or lost:
+            stats["indicators_added"] += len(gained)
+            stats["indicators_removed"] += len(lost)
+            added.extend({"session_id": session_id, "kind": kind, "value": value} for kind, value in gained)
+            removed.extend({"b_session_id": session_id, "b_kind": kind, "b_value": value} for kind, value in lost)
+
+        if report is not None and (scam != old_scam or gained or lost):
+            report.write(json.dumps({
+                "sessionId": session_id,
+                "scamDetected": {"old": old_scam, "new": scam},
+                "added": sorted(map(list, gained)),
+                "removed": sorted(map(list, lost)),
+            }) + "\n")
+
+    if dry_run:
+        return
+
+    if verdict_updates:
+        db.session.execute(
+            update(ScamSession.__table__).where(ScamSession.__table__.c.id == bindparam("b_id")),
+            verdict_updates
+        )
+    if removed:
+        table = ScamIndicator.__table__
+        db.session.execute(
+            delete(table).where(table.c.session_id == bindparam("b_session_id"),
+                                table.c.kind == bindparam("b_kind"),
+                                table.c.value == bindparam("b_value")),
+            removed
+        )
+    insert_indicators(added)
+    db.session.commit()
+
+
+def rescore_sessions(database_uri, config=None, workers=None, batch_size=500, dry_run=False, report=None):
+    """
+    Re-runs detection over every stored transcript and brings scam_detected
+    and the indicator rows in line with the result; turn counts, transcripts
+    and callbacks are left alone.
+
+    Session ids are cut into batches that a process pool scores in parallel
+    (each worker with its own DB connection and detector built from config).
+    This process diffs each finished batch against the database and writes
+    it in one transaction, so the single-writer SQLite case never contends.
+    With dry_run nothing is written. If report is a file, one NDJSON line is
+    written per session that changed.
+
+    Returns summary counters.
+    """
+    # Only the CLI command gets here; multiprocessing stays out of server startup
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    workers = workers or os.cpu_count() or 1
+    stats = {"sessions": 0, "to_scam": 0, "to_clean": 0, "indicators_added": 0, "indicators_removed": 0}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(database_uri, config)) as pool:
+        in_flight = set()
+        for ids in _iter_id_batches(batch_size):
+            in_flight.add(pool.submit(_score_batch, ids))
+            # Keep a couple of batches per worker queued, never the whole table
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _apply(future.result(), dry_run, stats, report)
+        for future in in_flight:
+            _apply(future.result(), dry_run, stats, report)
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_s"] = round(elapsed, 2)
+    stats["sessions_per_s"] = round(stats["sessions"] / elapsed, 1) if elapsed else None
+    stats["workers"] = workers
+    stats["dry_run"] = dry_run
+    return stats
+
+
+def init_cli(app):
+    """Registers `flask rescore-sessions`."""
+
+    @app.cli.command("rescore-sessions")
+    @click.option("--workers", type=int, default=None, help="processes (default: CPU count)")
+    @click.option("--batch-size", default=500, show_default=True, help="sessions per task and per transaction")
+    @click.option("--config", "config_path", type=click.Path(exists=True, dir_okay=False),
+                  default=ENGINE_CONFIG_PATH, help="engine config JSON (default: HONEYPOT_ENGINE_CONFIG)")
+    @click.option("--dry-run", is_flag=True, help="report what would change without writing")
+    @click.option("--report", "report_path", type=click.Path(dir_okay=False, allow_dash=True),
+                  help="write per-session changes as NDJSON (- for stdout)")
+    def rescore_command(workers, batch_size, config_path, dry_run, report_path):
+        """Re-score every stored session with the current detector config."""
+        config = None
+        if config_path:
+            with open(config_path, encoding='utf-8') as handle:
+                config = json.load(handle)
+
+        with (click.open_file(report_path, "w") if report_path else nullcontext()) as report:
+            stats = rescore_sessions(app.config['SQLALCHEMY_DATABASE_URI'], config=config, workers=workers,
+                                     batch_size=batch_size, dry_run=dry_run, report=report)
+        click.echo(json.dumps(stats), err=True)
@@ -0,0 +1,466 @@
+import os
+import gzip
+import json
+import time
+import fcntl
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, func, select, text, tuple_
+
+from models import (db, ScamSession, ScamMessage, ScamIndicator, ScamIntelligence, SessionRisk,
+                    CallbackOutbox, CallbackState)
+from transfer import session_heads, export_batch
+
+logger = logging.getLogger(__name__)
+
+# Days a session is kept after it was created, by verdict (0 = keep forever)
+RETENTION_SCAM_DAYS = float(os.environ.get('RETENTION_SCAM_DAYS', 0))
+RETENTION_CLEAN_DAYS = float(os.environ.get('RETENTION_CLEAN_DAYS', 0))
+# Expired transcripts are archived here before they are deleted (unset: "archive"
+# next to the app; "-" deletes without archiving)
+RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR') or None
+# Sessions deleted per write transaction; smaller holds the write lock for less
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 200))
+# Seconds slept between batches so request writers get the lock
+RETENTION_PAUSE = float(os.environ.get('RETENTION_PAUSE', 0.05))
+# Sessions per archive segment file
+RETENTION_SEGMENT_SESSIONS = int(os.environ.get('RETENTION_SEGMENT_SESSIONS', 10000))
+# Free pages returned to the OS per incremental_vacuum step
+RETENTION_VACUUM_PAGES = int(os.environ.get('RETENTION_VACUUM_PAGES', 2000))
+# Seconds between background compaction passes (0 = only `flask compact-sessions`)
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 0))
+
+MANIFEST = "manifest.ndjson"
+SEGMENT_SUFFIX = ".ndjson.gz"
+KEYS_SUFFIX = ".keys.gz"
+
+# Outbox rows still to be delivered keep their session (and its transcript) alive
+_UNDELIVERED = ("pending", "sending")
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class ArchiveWriter:
+    """
+    Appends exported sessions to gzip NDJSON segment files.
+
+    Every batch is its own gzip member (a multi-member file is still one
+    gzip stream to readers), flushed and fsynced before write() returns, so
+    rows are only deleted once their archive copy is on disk. Next to each
+    segment a .keys.gz file lists its session ids and lowercased indicator
+    values, and when a segment is closed a line with its time range and
+    counts goes to manifest.ndjson; search() uses both to skip segments.
+    """
+
+    def __init__(self, directory, segment_sessions=RETENTION_SEGMENT_SESSIONS):
+        self.directory = directory
+        self.segment_sessions = segment_sessions
+        self.segments = []
+        self.bytes = 0
+        self._segment = None
+
+    def write(self, records):
+        """Archives the parsed export records of one batch."""
+        if self._segment is None:
+            self._open()
+        segment = self._segment
+        keys = set()
+        for record in records:
+            keys.add(record["sessionId"].lower())
+            for values in record["intelligence"].values():
+                keys.update(value.lower() for value in values)
+            created = record["createdAt"]
+            if created:
+                segment["created_from"] = min(segment["created_from"] or created, created)
+                segment["created_to"] = max(segment["created_to"] or created, created)
+
+        payload = "".join(json.dumps(record) + "\n" for record in records)
+        _append_member(segment["keys_path"], "".join(key + "\n" for key in sorted(keys)))
+        segment["bytes"] += _append_member(segment["path"], payload)
+        segment["sessions"] += len(records)
+        if segment["sessions"] >= self.segment_sessions:
+            self.close()
+
+    def close(self):
+        segment, self._segment = self._segment, None
+        if segment is None:
+            return
+        entry = {"segment": os.path.basename(segment["path"]), "sessions": segment["sessions"],
+                 "created_from": segment["created_from"], "created_to": segment["created_to"],
+                 "bytes": segment["bytes"]}
+        with open(os.path.join(self.directory, MANIFEST), "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        self.segments.append(entry["segment"])
+        self.bytes += segment["bytes"]
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        base = os.path.join(self.directory, f"sessions-{stamp}-{os.getpid()}-{len(self.segments)}")
+        self._segment = {"path": base + SEGMENT_SUFFIX, "keys_path": base + KEYS_SUFFIX, "sessions": 0,
+                         "bytes": 0, "created_from": None, "created_to": None}
+
+
+def _append_member(path, payload):
+    data = gzip.compress(payload.encode("utf-8"))
+    with open(path, "ab") as handle:
+        handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    return len(data)
+
+
+def search(directory, value=None, contains=None, since=None, until=None):
+    """
+    Yields archived session records whose id or an indicator equals value
+    (case-insensitive), whose messages contain the text contains
+    (case-insensitive), and whose createdAt falls in [since, until), given
+    as ISO strings. Segments outside the time range or without value in
+    their keys file are not opened.
+    """
+    if not os.path.isdir(directory):
+        return
+    manifest = {}
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    entry = json.loads(line)
+                    manifest[entry["segment"]] = entry
+    needle = value.lower() if value else None
+    contains = contains.lower() if contains else None
+
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        # Segments missing from the manifest (a run that stopped early) are always scanned
+        entry = manifest.get(name)
+        if entry is not None and entry["created_to"] is not None:
+            if (since and entry["created_to"] < since) or (until and entry["created_from"] >= until):
+                continue
+        if needle is not None and not _has_key(os.path.join(directory, name[:-len(SEGMENT_SUFFIX)] + KEYS_SUFFIX),
+                                               needle):
+            continue
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as handle:
+            for line in handle:
+                record = json.loads(line)
+                created = record["createdAt"] or ""
+                if (since and created < since) or (until and created >= until):
+                    continue
+                if needle is not None and record["sessionId"].lower() != needle and not any(
+                        item.lower() == needle for values in record["intelligence"].values() for item in values):
+                    continue
+                if contains is not None and not any(contains in message["text"].lower()
+                                                    for message in record["messages"]):
+                    continue
+                yield record
+
+
+def _has_key(keys_path, needle):
+    if not os.path.exists(keys_path):
+        return True
+    with gzip.open(keys_path, "rt", encoding="utf-8") as handle:
+        return any(line.rstrip("\n") == needle for line in handle)
+
+
+class RetentionJob:
+    """
+    Expires old sessions: archives them, deletes them in small batches and
+    gives the space back.
+
+    A session expires RETENTION_SCAM_DAYS / RETENTION_CLEAN_DAYS after its
+    created_at, depending on scam_detected; sessions with callbacks still
+    to deliver are kept until they go out. Expired sessions are found by a
+    range scan on the created_at index, archived (see ArchiveWriter), then
+    deleted with their messages, indicators, intelligence, risk and
+    callback rows, RETENTION_BATCH_SIZE per transaction with a pause in
+    between, so request writers wait at most one batch. indicator_stats is
+    kept: the cross-session aggregate outlives the transcripts behind it.
+    On SQLite the freed pages are then returned to the OS a few at a time
+    with incremental_vacuum (when the file has auto_vacuum = INCREMENTAL)
+    and the planner statistics refreshed with ANALYZE.
+
+    Runs from `flask compact-sessions`, or every RETENTION_INTERVAL seconds
+    in one worker per archive directory (chosen by a file lock).
+    """
+
+    def __init__(self, scam_days=RETENTION_SCAM_DAYS, clean_days=RETENTION_CLEAN_DAYS,
+                 archive_dir=RETENTION_ARCHIVE_DIR, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_PAUSE,
+                 interval=RETENTION_INTERVAL):
+        self.scam_days = scam_days
+        self.clean_days = clean_days
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.app = None
+
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._last = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['retention'] = self
+        if self.archive_dir is None:
+            self.archive_dir = os.path.join(app.root_path, "archive")
+        if self.interval > 0 and (self.scam_days > 0 or self.clean_days > 0):
+            app.before_request(self.start)
+
+    def stats(self):
+        return {"scam_days": self.scam_days, "clean_days": self.clean_days, "interval": self.interval,
+                "last_run": self._last}
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def run(self, now=None, scam_days=None, clean_days=None, archive_dir=None, batch_size=None,
+            dry_run=False, full_vacuum=False):
+        """
+        One compaction pass; needs an app context. Arguments left as None
+        use the job's settings. With dry_run only counts what would expire.
+        full_vacuum rewrites a SQLite file with a plain VACUUM (blocking
+        writers for the whole copy) and switches it to incremental
+        auto_vacuum, which later passes then use.
+
+        Returns a report: sessions expired per verdict, rows deleted per
+        table, archive output, bytes reclaimed and the time writers were
+        blocked (longest single write transaction and total).
+        """
+        now = now or datetime.utcnow()
+        scam_days = self.scam_days if scam_days is None else scam_days
+        clean_days = self.clean_days if clean_days is None else clean_days
+        archive_dir = self.archive_dir if archive_dir is None else archive_dir
+        batch_size = batch_size or self.batch_size
+        started = time.perf_counter()
+
+        report = {"dry_run": dry_run, "expired": {}, "rows_deleted": {}, "archived_sessions": 0,
+                  "archive_segments": [], "archive_bytes": 0, "write_transactions": 0,
+                  "write_lock_max_ms": 0.0, "write_lock_total_ms": 0.0}
+        size_before = self._file_size()
+        archive = None if dry_run or archive_dir in (None, "-") else ArchiveWriter(archive_dir)
+        try:
+            for scam, days in ((True, scam_days), (False, clean_days)):
+                if days <= 0:
+                    continue
+                cutoff = now - timedelta(days=days)
+                expired = 0
+                for ids in self._expired_batches(scam, cutoff, batch_size):
+                    expired += len(ids)
+                    if dry_run:
+                        continue
+                    if archive is not None:
+                        self._archive(archive, ids)
+                    self._timed(report, lambda: self._delete(ids, report["rows_deleted"]))
+                    if self.pause:
+                        time.sleep(self.pause)
+                report["expired"]["scam" if scam else "clean"] = {"cutoff": cutoff.isoformat(), "sessions": expired}
+        finally:
+            if archive is not None:
+                archive.close()
+                report["archived_sessions"] = sum(report["expired"].get(kind, {}).get("sessions", 0)
+                                                  for kind in ("scam", "clean"))
+                report["archive_segments"] = archive.segments
+                report["archive_bytes"] = archive.bytes
+            db.session.rollback()
+
+        if not dry_run:
+            report["vacuum"] = self._reclaim(report, full_vacuum)
+
+        size_after = self._file_size()
+        if size_before is not None:
+            report["bytes_before"] = size_before[0]
+            report["bytes_after"] = size_after[0]
+            report["bytes_reclaimed"] = size_before[0] - size_after[0]
+            report["free_bytes"] = size_after[1]
+        report["write_lock_max_ms"] = round(report["write_lock_max_ms"], 2)
+        report["write_lock_total_ms"] = round(report["write_lock_total_ms"], 2)
+        report["elapsed_s"] = round(time.perf_counter() - started, 2)
+        self._last = {"at": now.isoformat(), "sessions": sum(item["sessions"] for item in report["expired"].values()),
+                      "bytes_reclaimed": report.get("bytes_reclaimed")}
+        return report
+
+    def _expired_batches(self, scam, cutoff, batch_size):
+        # Keyset pages over (created_at, id): the created_at index serves the range
+        # and the order, and kept sessions (undelivered callbacks) are not re-read
+        undelivered = (
+            select(CallbackOutbox.id)
+            .where(CallbackOutbox.session_id == ScamSession.id, CallbackOutbox.status.in_(_UNDELIVERED))
+            .exists()
+        )
+        after = None
+        while True:
+            stmt = (
+                select(ScamSession.created_at, ScamSession.id)
+                .where(ScamSession.created_at < cutoff,
+                       func.coalesce(ScamSession.scam_detected, False) == scam,
+                       ~undelivered)
+                .order_by(ScamSession.created_at, ScamSession.id)
+                .limit(batch_size)
+            )
+            if after is not None:
+                stmt = stmt.where(tuple_(ScamSession.created_at, ScamSession.id) > after)
+            rows = db.session.execute(stmt).all()
+            db.session.rollback()
+            if not rows:
+                return
+            after = tuple(rows[-1])
+            yield [row.id for row in rows]
+
+    def _archive(self, archive, ids):
+        sessions = db.session.execute(session_heads().where(ScamSession.id.in_(ids)).order_by(ScamSession.id)).all()
+        records = [json.loads(line) for line in "".join(export_batch(sessions)).splitlines()]
+        db.session.rollback()
+        archive.write(records)
+
+    def _delete(self, ids, counts):
+        # Children first; the session row goes last
+        statements = (
+            ("scam_messages", delete(ScamMessage).where(ScamMessage.session_id.in_(ids))),
+            ("scam_indicators", delete(ScamIndicator).where(ScamIndicator.session_id.in_(ids))),
+            ("scam_intelligence", delete(ScamIntelligence).where(ScamIntelligence.session_id.in_(ids))),
+            ("session_risk", delete(SessionRisk).where(SessionRisk.session_id.in_(ids))),
+            ("callback_state", delete(CallbackState).where(CallbackState.session_id.in_(ids))),
+            ("callback_outbox", delete(CallbackOutbox).where(CallbackOutbox.session_id.in_(ids),
+                                                             CallbackOutbox.status.not_in(_UNDELIVERED))),
+            ("scam_sessions", delete(ScamSession).where(ScamSession.id.in_(ids))),
+        )
+        try:
+            for table, stmt in statements:
+                deleted = db.session.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+                counts[table] = counts.get(table, 0) + max(deleted, 0)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _reclaim(self, report, full_vacuum):
+        dialect = db.engine.dialect.name
+        if dialect == "postgresql":
+            # Autovacuum reuses the space; refresh the planner's view now
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                self._timed(report, lambda: connection.execute(text("ANALYZE")))
+            return "analyze"
+        if dialect != "sqlite":
+            return "skipped"
+
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            mode = "full"
+            if full_vacuum:
+                connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                self._timed(report, lambda: connection.exec_driver_sql("VACUUM"))
+            elif connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+                mode = "incremental"
+                # A few pages per step; each step is its own short write transaction.
+                # execute() steps a statement once, which frees a single page here,
+                # so the step goes through executescript() to run to completion.
+                driver = connection.connection.driver_connection
+                free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+                while free:
+                    self._timed(report, lambda: driver.executescript(
+                        f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES});"))
+                    left = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+                    if left >= free:
+                        break
+                    free = left
+                    if self.pause:
+                        time.sleep(self.pause)
+            else:
+                mode = "none (auto_vacuum is off; run once with --full-vacuum)"
+                logger.warning("Freed pages stay in the SQLite file until a full VACUUM; "
+                               "run `flask compact-sessions --full-vacuum` once to enable incremental vacuum")
+            self._timed(report, lambda: connection.exec_driver_sql("ANALYZE"))
+        return mode
+
+    def _file_size(self):
+        """(file bytes, free-page bytes) of a SQLite database, else None."""
+        if db.engine.dialect.name != "sqlite":
+            return None
+        with db.engine.connect() as connection:
+            page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+            pages = connection.exec_driver_sql("PRAGMA page_count").scalar()
+            free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return pages * page_size, free * page_size
+
+    @staticmethod
+    def _timed(report, work):
+        started = time.perf_counter()
+        work()
+        elapsed = (time.perf_counter() - started) * 1000
+        report["write_transactions"] += 1
+        report["write_lock_total_ms"] += elapsed
+        report["write_lock_max_ms"] = max(report["write_lock_max_ms"], elapsed)
+
+    # ------------------------------------------------------------------
+    # Background passes
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the compaction thread in the current process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="retention", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                with open(os.path.join(self.archive_dir, ".compaction.lock"), "a") as lock:
+                    # Every worker runs this loop; whichever holds the lock does the pass
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    with self.app.app_context():
+                        report = self.run()
+                logger.info("Compaction: %d sessions expired, %s bytes reclaimed, writers blocked %.1f ms max",
+                            self._last["sessions"], report.get("bytes_reclaimed"), report["write_lock_max_ms"])
+            except Exception as e:
+                logger.error("Compaction failed: %s", e, exc_info=True)
+
+
+retention = RetentionJob()
+
+
+def init_cli(app):
+    """Registers `flask compact-sessions` and `flask search-archive`."""
+
+    @app.cli.command("compact-sessions")
+    @click.option("--scam-days", type=float, default=None, help="keep scam sessions this long (default: RETENTION_SCAM_DAYS)")
+    @click.option("--clean-days", type=float, default=None,
+                  help="keep non-scam sessions this long (default: RETENTION_CLEAN_DAYS)")
+    @click.option("--archive-dir", default=None, help="archive directory, - to delete without archiving")
+    @click.option("--batch-size", type=int, default=None, help="sessions per delete transaction")
+    @click.option("--full-vacuum", is_flag=True, help="VACUUM the SQLite file and switch it to incremental auto_vacuum")
+    @click.option("--dry-run", is_flag=True, help="count what would expire without changing anything")
+    def compact_command(scam_days, clean_days, archive_dir, batch_size, full_vacuum, dry_run):
+        """Archive and delete expired sessions, then reclaim the space."""
+        report = retention.run(scam_days=scam_days, clean_days=clean_days, archive_dir=archive_dir,
+                               batch_size=batch_size, dry_run=dry_run, full_vacuum=full_vacuum)
+        click.echo(json.dumps(report), err=True)
+
+    @app.cli.command("search-archive")
+    @click.argument("value", required=False)
+    @click.option("--text", "contains", default=None, help="substring of a message (scans every segment in range)")
+    @click.option("--since", default=None, help="createdAt lower bound (ISO, inclusive)")
+    @click.option("--until", default=None, help="createdAt upper bound (ISO, exclusive)")
+    @click.option("--archive-dir", default=None, help="archive directory (default: RETENTION_ARCHIVE_DIR)")
+    def search_command(value, contains, since, until, archive_dir):
+        """Print archived sessions matching VALUE (session id or indicator) as NDJSON."""
+        for record in search(archive_dir or retention.archive_dir, value=value, contains=contains,
+                             since=since, until=until):
+            click.echo(json.dumps(record))
@@ -0,0 +1,95 @@
+import os
+import json
+
+# Per-message decay applied to the running score and to keyword weights
+RISK_DECAY = float(os.environ.get('RISK_DECAY', 0.8))
+# Keyword weights that decay below this are dropped
+RISK_WEIGHT_FLOOR = 0.05
+
+
+class RiskState:
+    """
+    Running risk of one session, folded forward one scammer message at a
+    time so the transcript never has to be re-read.
+
+    score decays by RISK_DECAY each message before the message's own
+    risk_score is added; peak_score is the highest score reached. flags is
+    the union of detector flags in first-seen order. keyword_weights decays
+    the same way and adds 1 per keyword in the message, so recent themes
+    weigh most. indicator_counts counts extracted values per field. An
+    update costs the size of the result, not of the conversation.
+    """
+
+    __slots__ = ("score", "peak_score", "messages_scored", "flags", "keyword_weights", "indicator_counts")
+
+    def __init__(self, score=0.0, peak_score=0.0, messages_scored=0, flags=None, keyword_weights=None,
+                 indicator_counts=None):
+        self.score = score
+        self.peak_score = peak_score
+        self.messages_scored = messages_scored
+        self.flags = list(flags or ())
+        self.keyword_weights = dict(keyword_weights or {})
+        self.indicator_counts = dict(indicator_counts or {})
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds the state from a SessionRisk row (or any object with its columns)."""
+        return cls(
+            score=row.score or 0.0,
+            peak_score=row.peak_score or 0.0,
+            messages_scored=row.messages_scored or 0,
+            flags=[flag for flag in (row.flags or "").split(",") if flag],
+            keyword_weights=json.loads(row.keyword_weights or "{}"),
+            indicator_counts=json.loads(row.indicator_counts or "{}"),
+        )
+
+    def to_row(self):
+        """Column values for SessionRisk."""
+        return {
+            "score": self.score,
+            "peak_score": self.peak_score,
+            "messages_scored": self.messages_scored,
+            "flags": ",".join(self.flags),
+            "keyword_weights": json.dumps(self.keyword_weights, sort_keys=True),
+            "indicator_counts": json.dumps(self.indicator_counts, sort_keys=True),
+        }
+
+    def update(self, result, decay=RISK_DECAY):
+        """Folds one analyze_text result into the state."""
+        self.messages_scored += 1
+        self.score = round(self.score * decay + result.get("risk_score", 0), 3)
+        self.peak_score = max(self.peak_score, self.score)
+
+        for flag in result.get("flags", ()):
+            if flag not in self.flags:
+                self.flags.append(flag)
+
+        weights = {}
+        for keyword, weight in self.keyword_weights.items():
+            weight = round(weight * decay, 3)
+            if weight >= RISK_WEIGHT_FLOOR:
+                weights[keyword] = weight
+        extracted = result.get("extracted_data", {})
+        for keyword in extracted.get("suspiciousKeywords", ()):
+            weights[keyword] = round(weights.get(keyword, 0) + 1, 3)
+        self.keyword_weights = weights
+
+        for field, values in extracted.items():
+            if values and field != "suspiciousKeywords":
+                self.indicator_counts[field] = self.indicator_counts.get(field, 0) + len(values)
+
+    def top_keywords(self, limit=5):
+        """Heaviest keywords first (ties alphabetical)."""
+        ranked = sorted(self.keyword_weights.items(), key=lambda item: (-item[1], item[0]))
+        return [keyword for keyword, _ in ranked[:limit]]
+
+    def summary(self):
+        """Plain-dict view handed to the agent."""
+        return {
+            "score": self.score,
+            "peak_score": self.peak_score,
+            "messages_scored": self.messages_scored,
+            "flags": list(self.flags),
+            "top_keywords": self.top_keywords(),
+            "indicator_counts": dict(self.indicator_counts),
+        }
@@ -0,0 +1,426 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, insert, update
+
+from models import (db, ScamSession, ScamIntelligence, ScamIndicator, ScamMessage, SessionRisk, INDICATOR_KINDS,
+                    indicator_value, insert_indicators)
+from risk import RiskState
+
+logger = logging.getLogger(__name__)
+
+# off: every request reads and writes the database directly (safe anywhere).
+# sticky: active sessions live in this process and are written behind. Only
+#   correct when one process sees all traffic for a session: a single
+#   gunicorn worker with threads, or session-affine routing in front of the
+#   workers. Flushes use an optimistic turn_count check, so a session written
+#   by another process is detected and dropped from the cache, not clobbered.
+SESSION_CACHE_MODE = os.environ.get('SESSION_CACHE_MODE', 'off').lower()
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+SESSION_CACHE_IDLE_TTL = float(os.environ.get('SESSION_CACHE_IDLE_TTL', 300))
+SESSION_FLUSH_INTERVAL = float(os.environ.get('SESSION_FLUSH_INTERVAL', 1.0))
+
+
+class CachedIntelligence:
+    """In-memory stand-in for ScamIntelligence (same indicator API)."""
+
+    def __init__(self, owner, indicators):
+        self._owner = owner
+        self._indicators = indicators
+        self.session_id = owner.id
+
+    def add_indicators(self, extracted):
+        for field, kind in INDICATOR_KINDS.items():
+            seen = self._indicators.setdefault(kind, set())
+            for value in extracted.get(field, ()):
+                value = indicator_value(value)
+                seen.add(value)
+                # Every mention is queued: insert_indicators() dedups rows but counts hits
+                self._owner._pending_indicators.append({"session_id": self.session_id, "kind": kind, "value": value})
+
+    def indicator_kinds(self):
+        return {kind for kind, values in self._indicators.items() if values}
+
+    def indicators(self):
+        found = {kind: [] for kind in INDICATOR_KINDS.values()}
+        for kind, values in self._indicators.items():
+            found[kind] = sorted(values)
+        return found
+
+
+class CachedSession:
+    """
+    In-memory stand-in for ScamSession. Mutations are recorded as pending
+    rows and written by SessionCache in the background.
+    """
+
+    def __init__(self, session_id, turn_count=0, scam_detected=False, next_seq=0, indicators=None, is_new=False,
+                 risk=None, agent_state=""):
+        self.id = session_id
+        self.turn_count = turn_count
+        self.scam_detected = scam_detected
+        # Only changes along with turn_count, so it needs no dirty tracking of its own
+        self.agent_state = agent_state
+        self.intelligence = CachedIntelligence(self, indicators or {})
+        self.risk = risk or RiskState()
+        self.lock = threading.RLock()
+        self.last_access = time.monotonic()
+
+        self._next_seq = next_seq
+        self._is_new = is_new
+        self._flushed_turn_count = turn_count
+        self._flushed_scam_detected = scam_detected
+        self._pending_messages = []
+        self._pending_indicators = []
+        self._risk_stored = risk is not None
+        self._risk_dirty = False
+
+    def add_message(self, sender, text):
+        self.add_messages([(sender, text)])
+
+    def add_messages(self, entries):
+        now = datetime.utcnow()
+        for sender, text in entries:
+            self._pending_messages.append({"session_id": self.id, "seq": self._next_seq,
+                                           "sender": sender, "text": text, "timestamp": now})
+            self._next_seq += 1
+
+    def risk_state(self):
+        return self.risk
+
+    def save_risk_state(self, state):
+        self.risk = state
+        self._risk_dirty = True
+
+    @property
+    def dirty(self):
+        return bool(self._is_new or self._pending_messages or self._pending_indicators or self._risk_dirty
+                    or self.turn_count != self._flushed_turn_count
+                    or self.scam_detected != self._flushed_scam_detected)
+
+
+class SessionCache:
+    """
+    LRU + idle-TTL cache of active sessions with batched write-behind.
+
+    A hit costs no SQL at all; misses are loaded in bulk. A background thread
+    writes every dirty session in one transaction each flush interval.
+    Evicted sessions are kept reachable until their changes are written, and
+    everything is flushed at shutdown. Up to one flush interval of turns can
+    be lost if the process is killed hard.
+    """
+
+    def __init__(self, mode=SESSION_CACHE_MODE, max_size=SESSION_CACHE_SIZE,
+                 idle_ttl=SESSION_CACHE_IDLE_TTL, flush_interval=SESSION_FLUSH_INTERVAL):
+        if mode not in ('off', 'sticky'):
+            raise ValueError(f"Unknown SESSION_CACHE_MODE: {mode}")
+        self.mode = mode
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.app = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._evicted = {}  # dirty sessions waiting for their final write
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "flushes": 0,
+                          "flush_errors": 0, "conflicts": 0}
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['session_cache'] = self
+        if self.enabled:
+            app.before_request(self.start)
+            atexit.register(self.shutdown)
+
+    # ------------------------------------------------------------------
+    # Request-side API
+    # ------------------------------------------------------------------
+
+    def get_many(self, session_ids):
+        """Returns {id: CachedSession} for existing sessions, loading misses in one query each."""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for session_id in session_ids:
+                cached = self._entries.get(session_id) or self._evicted.pop(session_id, None)
+                if cached is None:
+                    missing.append(session_id)
+                    continue
+                self._entries[session_id] = cached
+                self._entries.move_to_end(session_id)
+                cached.last_access = now
+                found[session_id] = cached
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(missing)
+
+        if missing:
+            for cached in self._load(missing):
+                found[cached.id] = self._remember(cached)
+        return found
+
+    def create(self, session_id, history=()):
+        """Starts a brand-new session in memory; it is inserted on the next flush."""
+        cached = CachedSession(session_id, is_new=True)
+        if history:
+            cached.add_messages(history)
+        return self._remember(cached)
+
+    def write_through(self, sessions):
+        """Flushes these sessions now (e.g. before a callback row references them)."""
+        cached = [session for session in sessions if isinstance(session, CachedSession)]
+        if cached:
+            self._flush_states(cached)
+
+    def locked(self, session):
+        """Serializes concurrent turns of one cached session."""
+        if isinstance(session, CachedSession):
+            return session.lock
+        return contextlib.nullcontext()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, mode=self.mode, size=len(self._entries),
+                        awaiting_flush=len(self._evicted))
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Starts the flusher thread in the current process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, name="session-flusher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def shutdown(self):
+        """Stops the flusher and writes every pending change."""
+        self._stop.set()
+        self.flush()
+
+    def flush(self):
+        """Writes all dirty sessions and drops idle ones. Safe to call any time."""
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [sid for sid, cached in self._entries.items()
+                               if now - cached.last_access > self.idle_ttl]:
+                self._evict(session_id)
+            states = [cached for cached in self._entries.values() if cached.dirty]
+            states += list(self._evicted.values())
+
+        if states:
+            self._flush_states(states)
+
+        with self._lock:
+            for session_id in [sid for sid, cached in self._evicted.items() if not cached.dirty]:
+                del self._evicted[session_id]
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Session cache flush failed: %s", e, exc_info=True)
+
+    def _remember(self, cached):
+        with self._lock:
+            # Another thread may have loaded the same session meanwhile
+            existing = self._entries.get(cached.id)
+            if existing is not None:
+                return existing
+            self._entries[cached.id] = cached
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+        return cached
+
+    def _evict(self, session_id):
+        # Caller holds self._lock
+        cached = self._entries.pop(session_id)
+        self._counters["evictions"] += 1
+        if cached.dirty:
+            self._evicted[session_id] = cached
+
+    def _load(self, session_ids):
+        rows = db.session.execute(
+            select(ScamSession.id, ScamSession.turn_count, ScamSession.scam_detected, ScamSession.agent_state)
+            .where(ScamSession.id.in_(session_ids))
+        ).all()
+        if not rows:
+            return []
+        ids = [row.id for row in rows]
+
+        indicators = {session_id: {} for session_id in ids}
+        for session_id, kind, value in db.session.execute(
+            select(ScamIndicator.session_id, ScamIndicator.kind, ScamIndicator.value)
+            .where(ScamIndicator.session_id.in_(ids))
+        ):
+            indicators[session_id].setdefault(kind, set()).add(value)
+
+        last_seq = dict(db.session.execute(
+            select(ScamMessage.session_id, db.func.max(ScamMessage.seq))
+            .where(ScamMessage.session_id.in_(ids))
+            .group_by(ScamMessage.session_id)
+        ).all())
+
+        risks = {row.session_id: RiskState.from_row(row) for row in db.session.scalars(
+            select(SessionRisk).where(SessionRisk.session_id.in_(ids))
+        )}
+
+        return [
+            CachedSession(row.id, turn_count=row.turn_count or 0, scam_detected=bool(row.scam_detected),
+                          next_seq=last_seq[row.id] + 1 if row.id in last_seq else 0,
+                          indicators=indicators[row.id], risk=risks.get(row.id), agent_state=row.agent_state or "")
+            for row in rows
+        ]
+
+    def _flush_states(self, states):
+        with self._flush_lock, self.app.app_context():
+            snapshots = []
+            for cached in states:
+                with cached.lock:
+                    snapshots.append((cached, self._take_snapshot(cached)))
+
+            try:
+                conflicts = self._write(snapshots)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for cached, snapshot in snapshots:
+                    with cached.lock:
+                        self._restore_snapshot(cached, snapshot)
+                with self._lock:
+                    self._counters["flush_errors"] += 1
+                raise
+
+            with self._lock:
+                self._counters["flushes"] += 1
+                for cached in conflicts:
+                    # Someone else owns this session now; reload it next time
+                    self._counters["conflicts"] += 1
+                    self._entries.pop(cached.id, None)
+                    self._evicted.pop(cached.id, None)
+
+    def _take_snapshot(self, cached):
+        snapshot = {
+            "is_new": cached._is_new,
+            "turn_count": cached.turn_count,
+            "scam_detected": cached.scam_detected,
+            "agent_state": cached.agent_state,
+            "base_turn_count": cached._flushed_turn_count,
+            "base_scam_detected": cached._flushed_scam_detected,
+            "messages": cached._pending_messages,
+            "indicators": cached._pending_indicators,
+            "risk": cached.risk.to_row() if cached._risk_dirty else None,
+            "risk_stored": cached._risk_stored,
+        }
+        if cached._risk_dirty:
+            cached._risk_stored = True
+            cached._risk_dirty = False
+        cached._is_new = False
+        cached._flushed_turn_count = cached.turn_count
+        cached._flushed_scam_detected = cached.scam_detected
+        cached._pending_messages = []
+        cached._pending_indicators = []
+        return snapshot
+
+    def _restore_snapshot(self, cached, snapshot):
+        cached._is_new = cached._is_new or snapshot["is_new"]
+        cached._flushed_turn_count = snapshot["base_turn_count"]
+        cached._flushed_scam_detected = snapshot["base_scam_detected"]
+        cached._pending_messages = snapshot["messages"] + cached._pending_messages
+        cached._pending_indicators = snapshot["indicators"] + cached._pending_indicators
+        if snapshot["risk"] is not None:
+            # The live state already includes the lost write; just write it again
+            cached._risk_stored = snapshot["risk_stored"]
+            cached._risk_dirty = True
+
+    def _write(self, snapshots):
+        """Issues the batched statements for a flush; returns sessions that lost a write race."""
+        now = datetime.utcnow()
+        new_sessions = [(cached, snap) for cached, snap in snapshots if snap["is_new"]]
+        if new_sessions:
+            db.session.execute(insert(ScamSession.__table__), [
+                {"id": cached.id, "turn_count": snap["turn_count"], "scam_detected": snap["scam_detected"],
+                 "agent_state": snap["agent_state"], "messages": "", "created_at": now}
+                for cached, snap in new_sessions
+            ])
+            db.session.execute(insert(ScamIntelligence.__table__), [
+                {"session_id": cached.id, "created_at": now} for cached, _ in new_sessions
+            ])
+
+        conflicts = []
+        for cached, snap in snapshots:
+            if snap["is_new"]:
+                continue
+            if (snap["turn_count"], snap["scam_detected"]) == (snap["base_turn_count"], snap["base_scam_detected"]):
+                continue
+            result = db.session.execute(
+                update(ScamSession.__table__)
+                .where(ScamSession.id == cached.id, ScamSession.turn_count == snap["base_turn_count"])
+                .values(turn_count=snap["turn_count"], scam_detected=snap["scam_detected"],
+                        agent_state=snap["agent_state"])
+            )
+            if result.rowcount != 1:
+                logger.warning("Session %s was modified by another process; dropping its cached state", cached.id)
+                conflicts.append(cached)
+
+        lost = {cached.id for cached in conflicts}
+        messages = [row for cached, snap in snapshots if cached.id not in lost for row in snap["messages"]]
+        if lost:
+            # The transcript is append-only, so the other process's turns don't
+            # invalidate ours: append them after whatever it wrote
+            last_seq = dict(db.session.execute(
+                select(ScamMessage.session_id, db.func.max(ScamMessage.seq))
+                .where(ScamMessage.session_id.in_(lost))
+                .group_by(ScamMessage.session_id)
+            ).all())
+            for cached, snap in snapshots:
+                if cached.id in lost:
+                    first = last_seq.get(cached.id, -1) + 1
+                    messages.extend(dict(row, seq=first + offset) for offset, row in enumerate(snap["messages"]))
+        if messages:
+            db.session.execute(insert(ScamMessage.__table__), messages)
+        insert_indicators([row for _, snap in snapshots for row in snap["indicators"]])
+
+        risk_inserts, risk_updates = [], []
+        for cached, snap in snapshots:
+            if snap["risk"] is None or cached.id in lost:
+                continue
+            if snap["risk_stored"]:
+                risk_updates.append(dict(snap["risk"], b_session_id=cached.id, updated_at=now))
+            else:
+                risk_inserts.append(dict(snap["risk"], session_id=cached.id, updated_at=now))
+        if risk_inserts:
+            db.session.execute(insert(SessionRisk.__table__), risk_inserts)
+        if risk_updates:
+            table = SessionRisk.__table__
+            db.session.execute(update(table).where(table.c.session_id == bindparam("b_session_id")), risk_updates)
+        return conflicts
+
+
+session_cache = SessionCache()
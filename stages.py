@@ -0,0 +1,272 @@
+import os
+import time
+import logging
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from extraction import LINK_PATTERN
+from metrics import metrics
+from models import link_domain
+
+logger = logging.getLogger(__name__)
+
+# Threads per worker process shared by all concurrent detector stages
+DETECTOR_POOL_SIZE = int(os.environ.get('DETECTOR_POOL_SIZE', 4))
+# Time a concurrent stage gets per message unless its config says otherwise
+DETECTOR_STAGE_BUDGET_MS = float(os.environ.get('DETECTOR_STAGE_BUDGET_MS', 50))
+
+# The stages ScamDetector runs when the engine config has no "stages" list;
+# together they score exactly like the single method they were split from.
+# Order matters: flags and extracted_data fields are merged in stage order.
+DEFAULT_STAGES = (
+    {"name": "keywords"},
+    {"name": "indicators"},
+)
+
+# Stage types by the name used in config (see register_stage)
+STAGE_TYPES = {}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def register_stage(name):
+    """Class decorator making a Stage subclass available to configs as {"name": name}."""
+    def decorator(cls):
+        STAGE_TYPES[name] = cls
+        return cls
+    return decorator
+
+
+def _executor():
+    # Pool threads do not survive a fork; each worker makes its own
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(DETECTOR_POOL_SIZE, thread_name_prefix="detector-stage")
+                _pool_pid = os.getpid()
+    return _pool
+
+
+class Stage:
+    """
+    One detector: run(text, text_lower) returns {"score", "flags",
+    "extracted", "signals"}, any of which may be left out. extracted maps
+    extracted_data fields to sets; signals are booleans the combination
+    rules in ScamDetector read (has_urgency, has_threat, has_verify).
+
+    weight scales score. Inline stages run on the request thread;
+    concurrent ones run on the shared pool while the inline ones do, and
+    are dropped for this message if they take longer than budget_ms or
+    already have max_in_flight calls running (a stalled stage cannot take
+    every pool thread). Stages must be safe to call from many threads.
+    """
+
+    def __init__(self, name, weight=1.0, concurrent=False, budget_ms=DETECTOR_STAGE_BUDGET_MS,
+                 max_in_flight=None, **options):
+        if options:
+            raise ValueError(f"Stage {name!r}: unknown options {sorted(options)}")
+        self.name = name
+        self.weight = weight
+        self.concurrent = concurrent
+        self.budget = budget_ms / 1000.0
+        self.max_in_flight = max_in_flight or DETECTOR_POOL_SIZE
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._record = metrics.recorder("honeypot_detector_stage_seconds", stage=name)
+
+    def bind(self, detector):
+        """Called once with the ScamDetector the stage belongs to."""
+
+    def run(self, text, text_lower):
+        raise NotImplementedError
+
+    def timed_run(self, text, text_lower):
+        started = time.perf_counter()
+        try:
+            return self.run(text, text_lower)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def claim(self):
+        """Takes an in-flight slot; False if the stage is at max_in_flight."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _pooled_run(self, text, text_lower):
+        try:
+            return self.timed_run(text, text_lower)
+        finally:
+            self.release()
+
+
+@register_stage("keywords")
+class KeywordStage(Stage):
+    """Suspicious keywords (10 each) and the urgency/threat/verify combinations."""
+
+    def bind(self, detector):
+        self.detector = detector
+
+    def run(self, text, text_lower):
+        detector = self.detector
+        if detector.template_cache is None:
+            hits = detector._match_keywords(text_lower)
+        else:
+            hits = detector._template_hits(text_lower)
+        keyword_matches = hits & detector.keywords
+        has_urgency = not hits.isdisjoint(detector.urgency_words)
+        has_threat = not hits.isdisjoint(detector.threat_words)
+        has_verify = not hits.isdisjoint(detector.verify_words)
+
+        score = 10 * len(keyword_matches)
+        flags = []
+        if has_urgency and has_threat:
+            score += 20
+            flags.append("urgency_with_threat")
+        if has_verify and has_threat:
+            score += 15
+            flags.append("verify_with_threat")
+        return {"score": score, "flags": flags, "extracted": {"suspiciousKeywords": keyword_matches},
+                "signals": {"has_urgency": has_urgency, "has_threat": has_threat, "has_verify": has_verify}}
+
+
+@register_stage("indicators")
+class IndicatorStage(Stage):
+    """UPI IDs, accounts, IFSC codes, links and phone numbers (see extraction.py)."""
+
+    def bind(self, detector):
+        self.extractor = detector.extractor
+
+    def run(self, text, text_lower):
+        extracted = self.extractor.extract(text)
+        score = 0
+        flags = []
+        if extracted["upiIds"] or extracted["bankAccounts"] or extracted["ifscCodes"]:
+            score += 30
+            flags.append("payment_request")
+        if extracted["phishingLinks"]:
+            score += 40
+            flags.append("phishing_link")
+        if extracted["phoneNumbers"]:
+            score += 10
+            flags.append("contact_sharing")
+        return {"score": score, "flags": flags, "extracted": extracted}
+
+
+@register_stage("url_reputation")
+class UrlReputationStage(Stage):
+    """
+    Links whose host (or a parent domain of it) is listed in a local feed
+    file, one domain per line, "#" comments allowed. The feed is read when
+    the engines are built, so edits roll out with the next engine reload.
+    """
+
+    def __init__(self, name, feed, score=40, **options):
+        super().__init__(name, **options)
+        with open(feed, encoding="utf-8") as handle:
+            self.domains = frozenset(
+                line.split("#", 1)[0].strip().lower() for line in handle if line.split("#", 1)[0].strip()
+            )
+        self.score = score
+
+    def run(self, text, text_lower):
+        if "http" not in text_lower:
+            return {}
+        for link in LINK_PATTERN.findall(text):
+            labels = link_domain(link).split(".")
+            if any(".".join(labels[start:]) in self.domains for start in range(len(labels) - 1)):
+                return {"score": self.score, "flags": ["known_bad_domain"]}
+        return {}
+
+
+def build_stages(specs, detector):
+    """
+    Instantiates stage configs, in order: each is {"name", "type" (default:
+    the name), "enabled", "weight", "concurrent", "budget_ms",
+    "max_in_flight", plus the type's own options}, or {"class":
+    "module:Class"} for a Stage subclass from outside this module.
+    Disabled stages are left out. Raises ValueError on a bad config.
+    """
+    stages = []
+    names = set()
+    for spec in specs:
+        options = dict(spec)
+        name = options.get("name")
+        if not name or name in names:
+            raise ValueError(f"Stage needs a unique name: {spec!r}")
+        names.add(name)
+        if not options.pop("enabled", True):
+            continue
+        path = options.pop("class", None)
+        kind = options.pop("type", name)
+        if path is not None:
+            module, _, attribute = path.partition(":")
+            cls = getattr(importlib.import_module(module), attribute)
+        elif kind in STAGE_TYPES:
+            cls = STAGE_TYPES[kind]
+        else:
+            raise ValueError(f"Unknown detector stage type {kind!r} (known: {', '.join(sorted(STAGE_TYPES))})")
+        try:
+            stage = cls(**options)
+        except TypeError as e:
+            raise ValueError(f"Stage {name!r}: {e}") from None
+        stage.bind(detector)
+        stages.append(stage)
+    return stages
+
+
+def run_stages(stages, text, text_lower, concurrent=True):
+    """
+    Runs the stages on one message. Returns ([(stage, output)] in stage
+    order, names of the stages left out: over budget, busy or failed).
+    concurrent=False promises that no stage is concurrent and skips the
+    pool bookkeeping.
+    """
+    if not concurrent:
+        return [(stage, stage.timed_run(text, text_lower)) for stage in stages], []
+
+    pending = []
+    degraded = []
+    for stage in stages:
+        if not stage.concurrent:
+            continue
+        if not stage.claim():
+            degraded.append(stage.name)
+            metrics.inc("honeypot_detector_stage_dropped_total", stage=stage.name, reason="busy")
+            continue
+        try:
+            pending.append((stage, time.perf_counter(), _executor().submit(stage._pooled_run, text, text_lower)))
+        except RuntimeError:
+            # Pool already shut down (interpreter exit)
+            stage.release()
+            degraded.append(stage.name)
+
+    outputs = {}
+    for stage in stages:
+        if not stage.concurrent:
+            outputs[stage.name] = stage.timed_run(text, text_lower)
+
+    for stage, submitted, future in pending:
+        try:
+            outputs[stage.name] = future.result(timeout=max(0.0, stage.budget - (time.perf_counter() - submitted)))
+        except FutureTimeout:
+            # Keeps running in the background; its result is not waited for
+            degraded.append(stage.name)
+            metrics.inc("honeypot_detector_stage_dropped_total", stage=stage.name, reason="timeout")
+        except Exception as e:
+            degraded.append(stage.name)
+            metrics.inc("honeypot_detector_stage_dropped_total", stage=stage.name, reason="error")
+            logger.error("Detector stage %s failed: %s", stage.name, e,
+                         extra={"rate_key": f"detector-stage-{stage.name}"})
+
+    return [(stage, outputs[stage.name]) for stage in stages if stage.name in outputs], degraded
@@ -0,0 +1,302 @@
+import os
+import json
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import insert, select
+
+from models import (db, ScamSession, ScamIntelligence, ScamMessage, ScamIndicator, SessionRisk, INDICATOR_KINDS,
+                    indicator_value, insert_indicators)
+from risk import RiskState
+
+logger = logging.getLogger(__name__)
+
+# Sessions per export query batch, and messages per import transaction
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 2000))
+
+AGENT_SENDER = "agent"
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _parse_time(value):
+    if not value:
+        return datetime.utcnow()
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return datetime.utcnow()
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+def session_heads():
+    """Select of the per-session fields an export record starts with (add where/order/limit)."""
+    return (
+        select(ScamSession.id, ScamSession.created_at, ScamSession.turn_count,
+               ScamSession.scam_detected, ScamSession.agent_state, ScamIntelligence.agent_notes)
+        .outerjoin(ScamIntelligence, ScamIntelligence.session_id == ScamSession.id)
+    )
+
+
+def export_sessions(batch_size=EXPORT_BATCH_SIZE, message_batch_size=1000):
+    """
+    Yields NDJSON text, one line per session:
+      {"sessionId", "createdAt", "turnCount", "scamDetected", "agentState", "agentNotes",
+       "intelligence": {kind: [values]}, "messages": [{"seq", "sender", "text", "timestamp"}]}
+
+    Sessions are read in keyset-paged batches; each batch's messages come
+    from one yield_per query and are written out as they arrive, so memory
+    stays bounded however large the database or a single transcript is.
+    Needs an app context for as long as the generator runs.
+    """
+    last_id = ""
+    while True:
+        sessions = db.session.execute(
+            session_heads()
+            .where(ScamSession.id > last_id)
+            .order_by(ScamSession.id)
+            .limit(batch_size)
+        ).all()
+        if not sessions:
+            return
+        last_id = sessions[-1].id
+        yield from export_batch(sessions, message_batch_size)
+
+
+def export_batch(sessions, message_batch_size=1000):
+    """Yields the NDJSON records for rows selected with session_heads(), ordered by id."""
+    ids = [row.id for row in sessions]
+
+    indicators = {}
+    for session_id, kind, value in db.session.execute(
+        select(ScamIndicator.session_id, ScamIndicator.kind, ScamIndicator.value)
+        .where(ScamIndicator.session_id.in_(ids))
+        .order_by(ScamIndicator.session_id, ScamIndicator.kind, ScamIndicator.value)
+    ):
+        indicators.setdefault(session_id, {}).setdefault(kind, []).append(value)
+
+    messages = db.session.execute(
+        select(ScamMessage.session_id, ScamMessage.seq, ScamMessage.sender, ScamMessage.text,
+               ScamMessage.timestamp)
+        .where(ScamMessage.session_id.in_(ids))
+        .order_by(ScamMessage.session_id, ScamMessage.seq)
+        .execution_options(yield_per=message_batch_size)
+    )
+    pending = next(messages, None)
+
+    for session in sessions:
+        head = json.dumps({
+            "sessionId": session.id,
+            "createdAt": _iso(session.created_at),
+            "turnCount": session.turn_count,
+            "scamDetected": bool(session.scam_detected),
+            "agentState": session.agent_state or "",
+            "agentNotes": session.agent_notes or "",
+            "intelligence": indicators.get(session.id, {}),
+        })
+        # Open the object and the messages array, then stream the array
+        yield head[:-1] + ', "messages": ['
+        separator = ""
+        while pending is not None and pending.session_id == session.id:
+            yield separator + json.dumps({"seq": pending.seq, "sender": pending.sender,
+                                          "text": pending.text, "timestamp": _iso(pending.timestamp)})
+            separator = ", "
+            pending = next(messages, None)
+        yield "]}\n"
+
+
+# ----------------------------------------------------------------------
+# Import
+# ----------------------------------------------------------------------
+
+def iter_ndjson(stream, start_offset=0):
+    """
+    Yields (offset after the line, parsed object or None) for each non-blank
+    line of a binary stream. Unparseable lines yield None so callers can
+    count them without stopping the run.
+    """
+    offset = start_offset
+    for raw in stream:
+        offset += len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield offset, record if isinstance(record, dict) else None
+
+
+def import_sessions(records, detector, chunk_size=IMPORT_CHUNK_SIZE, on_commit=None):
+    """
+    Imports sessions from (offset, record) pairs as produced by iter_ndjson().
+
+    Records use the export format; only sessionId and messages are required
+    (each message needs sender and text); records whose fields have the
+    wrong type are counted as invalid and left out. Every non-agent message is run
+    through detector.analyze_text, exactly as /chat would score it, and its
+    indicators, verdict and running risk state are stored. Sessions that already exist are
+    skipped, so re-running an interrupted import is safe. Writes go out as
+    executemany INSERTs, one transaction per chunk of about chunk_size
+    messages; on_commit(offset) is called after each commit.
+
+    Returns counters: imported, skipped, invalid, messages.
+    """
+    stats = {"imported": 0, "skipped": 0, "invalid": 0, "messages": 0}
+    chunk, chunk_messages, offset = [], 0, None
+
+    for offset, record in records:
+        if not _valid_record(record):
+            stats["invalid"] += 1
+            continue
+        chunk.append(record)
+        chunk_messages += len(record.get("messages", []))
+        if chunk_messages >= chunk_size:
+            _write_chunk(chunk, detector, stats)
+            if on_commit:
+                on_commit(offset)
+            chunk, chunk_messages = [], 0
+
+    if chunk:
+        _write_chunk(chunk, detector, stats)
+    if on_commit and offset is not None:
+        on_commit(offset)
+    return stats
+
+
+def _valid_record(record):
+    """
+    Whether a parsed record has the field types _write_chunk relies on, so a
+    malformed record is counted as invalid instead of failing its whole chunk.
+    """
+    if record is None:
+        return False
+    session_id = record.get("sessionId")
+    if not session_id or not isinstance(session_id, (str, int)) or isinstance(session_id, bool):
+        return False
+    if not isinstance(record.get("messages", []), list):
+        return False
+    if not isinstance(record.get("intelligence") or {}, dict):
+        return False
+    turn_count = record.get("turnCount")
+    if turn_count:
+        if isinstance(turn_count, bool) or not isinstance(turn_count, (str, int)):
+            return False
+        try:
+            if int(turn_count) < 0:
+                return False
+        except ValueError:
+            return False
+    return True
+
+
+def _write_chunk(records, detector, stats):
+    ids = {str(record["sessionId"])[:36] for record in records}
+    existing = set(db.session.scalars(select(ScamSession.id).where(ScamSession.id.in_(ids))))
+
+    sessions, intelligence, messages, indicators, risks = [], [], [], [], []
+    for record in records:
+        session_id = str(record["sessionId"])[:36]
+        if session_id in existing:
+            stats["skipped"] += 1
+            continue
+        existing.add(session_id)
+
+        scam_detected = bool(record.get("scamDetected"))
+        scammer_turns = 0
+        found = set()
+        risk = RiskState()
+        for seq, message in enumerate(record.get("messages", [])):
+            if not isinstance(message, dict) or not message.get("text"):
+                continue
+            sender = str(message.get("sender") or "unknown")[:32]
+            text = str(message["text"])
+            messages.append({"session_id": session_id, "seq": seq, "sender": sender, "text": text,
+                             "timestamp": _parse_time(message.get("timestamp"))})
+            if sender == AGENT_SENDER:
+                continue
+            scammer_turns += 1
+            result = detector.analyze_text(text)
+            risk.update(result)
+            scam_detected = scam_detected or result["is_scam"]
+            for field, kind in INDICATOR_KINDS.items():
+                found.update((kind, indicator_value(value)) for value in result["extracted_data"].get(field, ()))
+
+        for kind, values in (record.get("intelligence") or {}).items():
+            if kind in INDICATOR_KINDS.values() and isinstance(values, list):
+                found.update((kind, indicator_value(str(value))) for value in values)
+
+        sessions.append({
+            "id": session_id,
+            "turn_count": int(record.get("turnCount") or scammer_turns),
+            "scam_detected": scam_detected,
+            "agent_state": str(record.get("agentState") or "")[:32],
+            "messages": "",
+            "created_at": _parse_time(record.get("createdAt")),
+        })
+        intelligence.append({"session_id": session_id, "agent_notes": str(record.get("agentNotes") or "")})
+        risks.append(dict(risk.to_row(), session_id=session_id))
+        indicators.extend({"session_id": session_id, "kind": kind, "value": value} for kind, value in found)
+
+    if sessions:
+        db.session.execute(insert(ScamSession.__table__), sessions)
+        db.session.execute(insert(ScamIntelligence.__table__), intelligence)
+        db.session.execute(insert(SessionRisk.__table__), risks)
+    if messages:
+        db.session.execute(insert(ScamMessage.__table__), messages)
+    insert_indicators(indicators)
+    db.session.commit()
+
+    stats["imported"] += len(sessions)
+    stats["messages"] += len(messages)
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def init_cli(app, detector_source):
+    """Registers `flask export-sessions` and `flask import-sessions`."""
+
+    @app.cli.command("export-sessions")
+    @click.argument("output", type=click.Path(dir_okay=False, allow_dash=True), default="-")
+    @click.option("--batch-size", default=EXPORT_BATCH_SIZE, show_default=True)
+    def export_command(output, batch_size):
+        """Write every session as NDJSON to OUTPUT (default stdout)."""
+        with click.open_file(output, "w") as handle:
+            for chunk in export_sessions(batch_size=batch_size):
+                handle.write(chunk)
+
+    @app.cli.command("import-sessions")
+    @click.argument("source", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--chunk-size", default=IMPORT_CHUNK_SIZE, show_default=True)
+    @click.option("--resume/--no-resume", default=True, show_default=True,
+                  help="continue from SOURCE.progress if an earlier run stopped")
+    def import_command(source, chunk_size, resume):
+        """Import sessions from an NDJSON file, scoring every message."""
+        progress_path = source + ".progress"
+        start = 0
+        if resume and os.path.exists(progress_path):
+            with open(progress_path) as handle:
+                start = int(handle.read().strip() or 0)
+            click.echo(f"Resuming at byte {start}", err=True)
+
+        def checkpoint(offset):
+            with open(progress_path, "w") as handle:
+                handle.write(str(offset))
+
+        with open(source, "rb") as handle:
+            handle.seek(start)
+            stats = import_sessions(iter_ndjson(handle, start), detector_source().detector,
+                                    chunk_size=chunk_size, on_commit=checkpoint)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        click.echo(json.dumps(stats), err=True)